@@ -1,12 +1,69 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from typing import List, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import pandas as pd
 from datetime import datetime, date, timedelta
+import asyncio
+import base64
+import hashlib
+import json
 import os
+import sys
+import time
 
-app = FastAPI()
+# リポジトリ直下の共通モジュール(core/)を import できるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import config
+from core.intervals import clip_buckets, hour_of_week, hours_since, split_intervals, split_sessions
+from core.leaderboard import get_leaderboard, open_hours, window_start
+from core.live import LiveFeed
+from core.metrics import CACHE_REQUESTS, CONTENT_TYPE, REGISTRY, STAGE_SECONDS
+from core.presence import open_session_usage
+from core.response_cache import EncodedBody, ResponseCache
+from core.rollups import get_rollups
+from core.singleflight import SingleFlight
+from core.storage import get_storage, partition_exists
+
+try:
+    import orjson
+except ImportError:  # なければ標準の json で同じ内容に変換する
+    orjson = None
+
+class TimedJSONResponse(JSONResponse):
+    """
+    JSON への変換にかかった時間を vc_stage_seconds{stage="serialize"} に記録する。
+    """
+
+    def render(self, content) -> bytes:
+        with STAGE_SECONDS.time(stage="serialize"):
+            return super().render(content)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 終了時にライブ配信の監視タスクとスレッドプールを止める（stop_live_feeds は下で定義）
+    await stop_live_feeds()
+
+app = FastAPI(default_response_class=TimedJSONResponse, lifespan=lifespan)
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "vc_http_request_seconds", "API のレスポンスを返すまでの時間（秒）", ["method", "path", "status"],
+)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # ラベルの種類が増えすぎないよう、実際のパスではなくルートのパス（/api/v1/... ）を使う
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - t0, method=request.method, path=path, status=response.status_code)
+    return response
 
 # CORS の設定（localhost:3000 のみ許可）
 app.add_middleware(
@@ -17,104 +74,565 @@ app.add_middleware(
     allow_headers=["*"],  # すべてのヘッダーを許可
 )
 
-DATA_PATH = os.path.join("..", "data", "vc_logs.csv")  # ../data/vc_logs.csv を想定
-
 class ChannelUsage(BaseModel):
     channel_id: int
     channel_name: str
     duration_hour: float
 
-def load_data() -> pd.DataFrame:
-    """
-    CSVを読み込み、必要なら日時をdatetime型にパース。
-    """
-    if not os.path.exists(DATA_PATH):
-        # CSVが存在しない場合は空のDataFrameを返す
-        columns = ["user_id", "timestamp", "action", "channel_id", "channel_name"]
-        return pd.DataFrame([], columns=columns)
-    df = pd.read_csv(DATA_PATH)
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-    df.sort_values("timestamp", inplace=True)
-    return df
-
-def calculate_sessions(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    join と leave のペアからボイスチャット滞在時間を計算。
-    結果として
-      user_id, channel_id, start_time, end_time, duration_hour
-    のデータを返す。
-    """
-    if df.empty:
-        return pd.DataFrame(columns=["user_id", "channel_id", "channel_name", "start_time", "end_time", "duration_hour"])
-
-    sessions = []
-    user_in_channel = {}  # user_id: {"channel_id": x, "channel_name": y, "joined": time}
-
-    for _, row in df.iterrows():
-        uid = row["user_id"]
-        ch = row["channel_id"]
-        ch_name = row["channel_name"]
-        act = row["action"]
-        ts = row["timestamp"]
-        if act == "join":
-            user_in_channel[uid] = {
-                "channel_id": ch,
-                "channel_name": ch_name,
-                "joined": ts
+# 保存先（CSV / SQLite）と日別の集計テーブルはギルドごとに分かれている。
+# 各エンドポイントは ?guild_id= で対象を選び、省略時は DEFAULT_GUILD_ID（従来の data/ 直下）
+storage = get_storage()
+rollups = get_rollups()
+
+def load_rollups(guild_id: int = None):
+    """
+    ギルドの保存先で新しく確定したセッションを集計テーブルへ取り込んでから返す。
+    集計はすべて日別の集計テーブルから行うので、ログの件数には依存しない。
+    """
+    r = get_rollups(guild_id)
+    r.sync(get_storage(guild_id))
+    return r
+
+# 集計（pandas）は上限付きの専用スレッドプールで実行し、イベントループを止めない。
+# 同じ集計・同じデータバージョンへの同時リクエストは flights で1回の計算にまとめる
+executor = ThreadPoolExecutor(max_workers=config.API_WORKERS, thread_name_prefix="api-worker")
+# 追記分の取り込みはほとんどの場合すぐ終わるので、重い集計の後ろに並ばないよう別のスレッドで行う
+refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-refresh")
+flights = SingleFlight()
+
+async def offload(key, func, *args, pool: ThreadPoolExecutor = executor):
+    """
+    func(*args) をスレッドプールで実行する。同じ key の計算が実行中なら、その結果を共有する。
+    """
+    loop = asyncio.get_running_loop()
+    return await flights.run(key, lambda: loop.run_in_executor(pool, func, *args))
+
+def check_guild(guild_id: int = None):
+    """
+    ?guild_id= のギルドの保存先がなければ 404。読み出しでは保存先を作らない
+    （任意の guild_id でディレクトリ・ファイルや保存先のインスタンスが増えないように）。
+    """
+    if not partition_exists(guild_id):
+        raise HTTPException(status_code=404, detail="このギルドの記録はありません")
+
+async def refresh(guild_id: int = None):
+    """
+    load_rollups を実行し、ギルドの保存先のデータバージョンを返す。
+    """
+    check_guild(guild_id)
+    def sync():
+        load_rollups(guild_id)
+        return get_storage(guild_id).version
+    return await offload(("refresh", guild_id), sync, pool=refresh_executor)
+
+def data_etag(guild_id: int, version, *params) -> str:
+    """
+    ギルドの保存先のデータバージョン・今日の日付・パラメータから強い ETag を作る。
+    今日/直近1週間の集計は日付が変わると中身が変わるので、日付も含める。
+    """
+    key = repr((guild_id, version, date.today().isoformat(), params))
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+
+# ─────────────────────────────────────────────────────
+# レスポンスの変換とキャッシュ。集計結果は JSON のバイト列（と gzip 圧縮）にして response_cache に置き、
+# 同じデータのバージョンへのリクエストには変換済みのバイト列をそのまま返す
+# ─────────────────────────────────────────────────────
+response_cache = ResponseCache(config.RESPONSE_CACHE_MAX_BYTES)
+
+def dumps(content) -> bytes:
+    """
+    JSON のバイト列にする。orjson があれば使う。
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def encode(content) -> EncodedBody:
+    with STAGE_SECONDS.time(stage="serialize"):
+        return EncodedBody(dumps(content), config.RESPONSE_GZIP_MIN_BYTES)
+
+def gzip_etag(etag: str) -> str:
+    # 圧縮したレスポンスは別の表現なので、ETag も別にする
+    return etag[:-1] + '-gzip"'
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        q = params.strip().removeprefix("q=")
+        try:
+            return not params.strip() or float(q) > 0
+        except ValueError:
+            return False
+    return False
+
+def matched_etag(request: Request, etag: str) -> Optional[str]:
+    """
+    If-None-Match に etag（またはその gzip 版）があれば、一致したほうを返す。
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    matched = next((tag for tag in (etag, gzip_etag(etag)) if "*" in tags or tag in tags), None)
+    CACHE_REQUESTS.inc(cache="etag", result="hit" if matched else "miss")
+    return matched
+
+async def json_response(request: Request, key, func, *args, etag: str = None, max_age: int = 0) -> Response:
+    """
+    func(*args) を JSON に変換したレスポンスを返す。
+    etag を渡すと、If-None-Match が一致すれば 304 を返し、変換したバイト列を etag をキーにして response_cache に置く
+    （etag はデータのバージョン・今日の日付・パラメータから作るので、日付が変わると別のキーになる）。
+    etag がない（入室中の時間を含むなど、毎回変わる）ときはキャッシュせず、key で同時のリクエストだけまとめる。
+    gzip を受け付けるクライアントには圧縮したバイト列を返す。max_age を渡すと（締まった過去の期間）
+    Cache-Control: max-age=... でその間ブラウザにキャッシュさせ、なければ no-cache で毎回再検証させる。
+    """
+    cache_control = f"public, max-age={max_age}" if max_age else "no-cache"
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag is not None:
+        matched = matched_etag(request, etag)
+        if matched:
+            return Response(status_code=304, headers={**headers, "ETag": matched})
+        body = response_cache.get(etag)
+        if body is None:
+            def build():
+                body = encode(func(*args))
+                response_cache.put(etag, body)
+                return body
+            body = await offload(("response", etag), build)
+    else:
+        body = await offload(("response",) + key, lambda: encode(func(*args)))
+
+    content = body.raw
+    if body.gzip is not None and accepts_gzip(request):
+        content = body.gzip
+        headers["Content-Encoding"] = "gzip"
+        etag = gzip_etag(etag) if etag is not None else None
+    if etag is not None:
+        headers["ETag"] = etag
+    return Response(content, media_type="application/json", headers=headers)
+
+def open_since(guild_id: int) -> date:
+    """
+    まだ集計が変わりうる最初の日。今日か、入室中のセッションの最も早い開始日（閉じるとその日から後に加算される）。
+    """
+    opened = get_storage(guild_id).open_sessions()
+    today = date.today()
+    if opened.empty:
+        return today
+    return min(today, opened["start_time"].min().date())
+
+async def closed_etag(guild_id: int, start_day: Optional[date], end_day: date, *params) -> Optional[str]:
+    """
+    [start_day, end_day) が締まった期間（もう集計が変わらない）なら、その期間の集計の revision から作った ETag を返す。
+    まだ変わりうるなら None。保存先のバージョンや今日の日付を含めないので、日付が変わっても同じ ETag になる。
+    入室中のセッションを見てから集計テーブルを更新するので、その間に閉じたセッションも取りこぼさない。
+    """
+    check_guild(guild_id)
+    if end_day is None or end_day > date.today():
+        return None
+
+    def check():
+        since = open_since(guild_id)
+        r = load_rollups(guild_id)
+        return r.version(start_day, end_day) if end_day <= since else None
+
+    revision = await offload(("closed", guild_id, start_day, end_day), check, pool=refresh_executor)
+    if revision is None:
+        return None
+    key = repr((guild_id, "closed", revision, start_day, end_day, params))
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+
+def json_column(values: pd.Series) -> list:
+    """
+    列を JSON に入れる値のリストにする。日付は "YYYY-MM-DD"、欠損は None。
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.strftime("%Y-%m-%d").tolist()
+    if len(values) and isinstance(values.iloc[0], date):
+        # 集計テーブルの日付の列は datetime.date（標準の json は変換できない）
+        return [value.isoformat() for value in values]
+    if values.hasnans:
+        return values.astype(object).where(values.notna(), None).tolist()
+    return values.tolist()
+
+def records(frame: pd.DataFrame, columns: list) -> list:
+    """
+    DataFrame を行ごとの辞書のリストにする。列ごとに配列のまま変換するので、iterrows のように行ごとの Series を作らない。
+    """
+    return [dict(zip(columns, row)) for row in zip(*(json_column(frame[col]) for col in columns))]
+
+USAGE_COLUMNS = ["channel_id", "channel_name", "duration_hour"]
+
+def open_usage(guild_id: int, now: datetime) -> pd.DataFrame:
+    """
+    ギルドの入室中のセッションを now までの滞在として返す。読むのは入室中の人数分だけ。
+    """
+    return open_session_usage(get_storage(guild_id).open_sessions(), now)
+
+def add_open_usage(usage: pd.DataFrame, open_sessions: pd.DataFrame, start_day: date = None) -> pd.DataFrame:
+    """
+    チャンネル別の合計に、入室中のセッションの start_day 以降の時間を足す（前日から続いている分は0時から数える）。
+    """
+    open_sessions = open_sessions.assign(duration_hour=hours_since(open_sessions, start_day))
+    open_sessions = open_sessions[open_sessions["duration_hour"] > 0]
+    if open_sessions.empty:
+        return usage
+    usage = pd.concat([usage, open_sessions[["channel_id", "channel_name", "duration_hour"]]], ignore_index=True)
+    return usage.groupby(["channel_id", "channel_name"], dropna=False)["duration_hour"].sum().reset_index()
+
+# ─────────────────────────────────────────────────────
+# 各パネルのデータ。単独のエンドポイントと /dashboard で共有する
+# ─────────────────────────────────────────────────────
+def today_usage_data(r, open_sessions: pd.DataFrame = None) -> list:
+    today = date.today()
+    # チャンネルごとの合計時間
+    usage = r.channel_usage(today, today + timedelta(days=1))
+    if open_sessions is not None:
+        usage = add_open_usage(usage, open_sessions, today)
+    return records(usage, USAGE_COLUMNS)
+
+def weekly_usage_data(r) -> list:
+    end_day = date.today() + timedelta(days=1)
+    grp = r.daily_channel_usage(end_day - timedelta(days=7), end_day)
+    return records(grp, ["date"] + USAGE_COLUMNS)
+
+def total_usage_data(r, open_sessions: pd.DataFrame = None) -> list:
+    usage = r.channel_usage()
+    if open_sessions is not None:
+        usage = add_open_usage(usage, open_sessions)
+    usage.sort_values("duration_hour", ascending=False, inplace=True)
+    return records(usage, USAGE_COLUMNS)
+
+def ranking_data(total_usage: list) -> list:
+    # 累計時間の降順リストから上位10位のみ
+    return [{"rank": i + 1, **row} for i, row in enumerate(total_usage[:10])]
+
+def month_range(year: int, month: int) -> tuple:
+    start_day = date(year, month, 1)
+    # 次月1日を求めるため、+32日してday=1にする簡易ロジック
+    return start_day, (start_day + timedelta(days=32)).replace(day=1)
+
+def monthly_report_data(r, year: int, month: int) -> dict:
+    start_day, end_day = month_range(year, month)
+
+    daily_grp = r.daily_usage(start_day, end_day)
+    if daily_grp.empty:
+        return {"total_hour": 0.0, "daily_usage": []}
+
+    return {
+        "total_hour": float(daily_grp["duration_hour"].sum()),
+        "daily_usage": records(daily_grp, ["date", "duration_hour"]),
+    }
+
+def user_ranking_data(guild_id: int, window: str, offset: int, limit: int, user_id: int = None,
+                      open_sessions: pd.DataFrame = None) -> dict:
+    leaderboard = get_leaderboard(guild_id)
+    leaderboard.sync(get_rollups(guild_id))
+    start_day = window_start(window)
+    extra = open_hours(open_sessions, start_day)
+    return {
+        "window": window,
+        "start_date": start_day.isoformat() if start_day else None,
+        "total_users": leaderboard.total_users(window, extra),
+        "offset": offset,
+        "limit": limit,
+        "ranking": leaderboard.top(window, limit, offset, extra),
+        "user": leaderboard.rank(window, user_id, extra) if user_id is not None else None,
+    }
+
+def dashboard_data(r, year: int, month: int) -> dict:
+    total_usage = total_usage_data(r)
+    return {
+        "today_usage": today_usage_data(r),
+        "weekly_usage": weekly_usage_data(r),
+        "total_usage": total_usage,
+        "ranking": ranking_data(total_usage),
+        "monthly_report": monthly_report_data(r, year, month),
+    }
+
+def now_data(guild_id: int) -> dict:
+    now = datetime.now()
+    sessions = open_usage(guild_id, now).sort_values("start_time")
+    users = [
+        {
+            "user_id": int(row.user_id),
+            "channel_id": int(row.channel_id),
+            "channel_name": None if pd.isna(row.channel_name) else row.channel_name,
+            "start_time": row.start_time.isoformat(),
+            "duration_hour": float(row.duration_hour),
+        }
+        for row in sessions.itertuples(index=False)
+    ]
+    counts = sessions.groupby(["channel_id", "channel_name"], dropna=False).size().reset_index(name="count")
+    channels = [
+        {
+            "channel_id": int(row.channel_id),
+            "channel_name": None if pd.isna(row.channel_name) else row.channel_name,
+            "count": int(row.count),
+        }
+        for row in counts.sort_values("count", ascending=False).itertuples(index=False)
+    ]
+    return {"now": now.isoformat(), "users": users, "channels": channels}
+
+# ─────────────────────────────────────────────────────
+# ユーザー別のタイムライン。集計テーブルの user_sessions の索引から、そのユーザーの分だけを読む
+# ─────────────────────────────────────────────────────
+def iso_timestamp(value: str) -> str:
+    # 保存形式（"2025-02-01 10:00:00.000000"）を datetime.isoformat() と同じ表記にする
+    return value.replace(" ", "T").removesuffix(".000000")
+
+def session_data(rows: list) -> list:
+    return [
+        {
+            "start_time": iso_timestamp(start_time),
+            "end_time": iso_timestamp(end_time),
+            "channel_id": channel_id,
+            "channel_name": channel_name,
+            "duration_hour": duration_hour,
+        }
+        for _, start_time, end_time, channel_id, channel_name, duration_hour in rows
+    ]
+
+def encode_cursor(row: tuple) -> str:
+    # 最後に返した行の (start_time, id)。次のページはその続きから読む
+    return base64.urlsafe_b64encode(f"{row[1]}|{row[0]}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        start_time, rowid = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return start_time, int(rowid)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="cursor が正しくありません")
+
+def user_session_page(guild_id: int, user_id: int, start_day: date, end_day: date, after: tuple, limit: int,
+                      descending: bool) -> tuple:
+    """
+    limit 件のセッションと、続きがあればその cursor（なければ None）を返す。1件多く読んで続きの有無を調べる。
+    """
+    rows = get_rollups(guild_id).user_session_rows(user_id, start_day, end_day, after, limit + 1, descending)
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+def user_summary_data(guild_id: int, user_id: int, start_day: date, end_day: date,
+                      open_sessions: pd.DataFrame = None) -> dict:
+    summary = get_rollups(guild_id).user_summary(user_id, start_day, end_day)
+    totals = summary["totals"]
+    average_hour = totals["total_hour"] / totals["sessions"] if totals["sessions"] else 0.0
+    channels = [
+        {
+            "channel_id": None if pd.isna(row.channel_id) else int(row.channel_id),
+            "channel_name": None if pd.isna(row.channel_name) else row.channel_name,
+            "duration_hour": float(row.duration_hour),
+            "sessions": int(row.sessions),
+        }
+        for row in summary["channels"].itertuples(index=False)
+    ]
+    daily = {row.date.isoformat(): float(row.duration_hour) for row in summary["daily"].itertuples(index=False)}
+    active_days = totals["active_days"]
+
+    # 入室中のセッションは件数には数えず、時間だけを合計・チャンネル別・日別に足す
+    open_session = None
+    if open_sessions is not None:
+        mine = open_sessions[open_sessions["user_id"] == user_id]
+        if start_day is not None:
+            mine = mine[mine["start_time"] >= pd.Timestamp(start_day)]
+        if end_day is not None:
+            mine = mine[mine["start_time"] < pd.Timestamp(end_day)]
+        for row in mine.itertuples(index=False):
+            channel_name = None if pd.isna(row.channel_name) else row.channel_name
+            hours = float(row.duration_hour)
+            open_session = {
+                "start_time": row.start_time.isoformat(),
+                "channel_id": int(row.channel_id),
+                "channel_name": channel_name,
+                "duration_hour": hours,
             }
-        elif act == "leave":
-            if uid in user_in_channel:
-                # join時刻からの差分を計算
-                start_t = user_in_channel[uid]["joined"]
-                if user_in_channel[uid]["channel_id"] == ch:
-                    duration_sec = (ts - start_t).total_seconds()
-                    duration_hour = duration_sec / 3600.0
-                    sessions.append({
-                        "user_id": uid,
-                        "channel_id": ch,
-                        "channel_name": ch_name,
-                        "start_time": start_t,
-                        "end_time": ts,
-                        "duration_hour": duration_hour
-                    })
-                # leave後は状態を削除
-                del user_in_channel[uid]
-
-    return pd.DataFrame(sessions)
+            totals["total_hour"] += hours
+            entry = next((c for c in channels if c["channel_id"] == int(row.channel_id)
+                          and c["channel_name"] == channel_name), None)
+            if entry is None:
+                channels.append({"channel_id": int(row.channel_id), "channel_name": channel_name,
+                                 "duration_hour": hours, "sessions": 0})
+            else:
+                entry["duration_hour"] += hours
+        # 日別には0時で分けて足す
+        for piece in split_sessions(mine, "day").itertuples(index=False):
+            day = piece.bucket.date().isoformat()
+            if daily.get(day, 0.0) <= 0 < piece.duration_hour:
+                active_days += 1
+            daily[day] = daily.get(day, 0.0) + piece.duration_hour
+        channels.sort(key=lambda c: c["duration_hour"], reverse=True)
+
+    return {
+        "user_id": user_id,
+        "start_date": start_day.isoformat() if start_day else None,
+        "end_date": (end_day - timedelta(days=1)).isoformat() if end_day else None,
+        "total_hour": float(totals["total_hour"]),
+        "sessions": totals["sessions"],
+        "active_days": active_days,
+        "average_hour": float(average_hour),
+        "longest_hour": float(totals["longest_hour"]),
+        "first_start": totals["first_start"].isoformat() if totals["first_start"] is not None else None,
+        "last_end": totals["last_end"].isoformat() if totals["last_end"] is not None else None,
+        "channels": channels,
+        "daily_usage": [{"date": day, "duration_hour": hours} for day, hours in sorted(daily.items())],
+        "open_session": open_session,
+    }
+
+def heatmap_data(guild_id: int, start_day: date, end_day: date, user_id: int = None,
+                 open_sessions: pd.DataFrame = None) -> dict:
+    r = get_rollups(guild_id)
+    if user_id is None:
+        hours = r.weekly_heatmap(start_day, end_day)
+    else:
+        hours = r.user_weekly_heatmap(user_id, start_day, end_day)
+    if open_sessions is not None:
+        if user_id is not None:
+            open_sessions = open_sessions[open_sessions["user_id"] == user_id]
+        _, bucket, extra = split_intervals(
+            open_sessions["start_time"].to_numpy(), open_sessions["end_time"].to_numpy(), "hour",
+        )
+        hours = hours + hour_of_week(*clip_buckets(bucket, extra, start_day, end_day))
+    return {
+        "start_date": start_day.isoformat(),
+        "end_date": (end_day - timedelta(days=1)).isoformat(),
+        "user_id": user_id,
+        "total_hour": float(hours.sum()),
+        "hours": hours.tolist(),
+    }
+
+def with_open_usage(guild_id: int, data, *args):
+    """
+    data(r, *args, open_sessions) を、今の時刻までの入室中のセッションを含めて計算する。
+    """
+    return data(get_rollups(guild_id), *args, open_usage(guild_id, datetime.now()))
+
+# 新しいイベントを検出して、接続中のダッシュボードへまとめて配信する（ギルドごとに1つ）
+live_feeds = {}
+
+def live_feed_for(guild_id: int = None) -> LiveFeed:
+    check_guild(guild_id)
+    if guild_id == config.DEFAULT_GUILD_ID:
+        guild_id = None
+    feed = live_feeds.get(guild_id)
+    if feed is None:
+        r = get_rollups(guild_id)
+        feed = live_feeds[guild_id] = LiveFeed(
+            get_storage(guild_id), r,
+            totals=lambda: today_usage_data(r),
+            poll_interval=config.STREAM_POLL_INTERVAL,
+        )
+    return feed
+
+live_feed = live_feed_for()
+
+async def stop_live_feeds():
+    for feed in live_feeds.values():
+        await feed.stop()
+    executor.shutdown(wait=False, cancel_futures=True)
+    refresh_executor.shutdown(wait=False, cancel_futures=True)
 
 @app.get("/")
 def read_root():
     return {"message": "Hello from FastAPI backend!"}
 
-@app.get("/api/v1/today-usage", response_model=List[ChannelUsage])
-def get_today_usage():
-    df = load_data()
-    df_sessions = calculate_sessions(df)
-    if df_sessions.empty:
-        return []
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus のテキスト形式のメトリクス（core/metrics.py 参照）。
+    エンドポイントごとのレイテンシ、処理段階ごとの時間、読み込んだ行数、キャッシュのヒット、
+    ログのサイズ、最後のイベントからの経過秒数など。
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
+@app.get("/api/v1/dashboard")
+async def get_dashboard(request: Request, year: Optional[int] = None,
+                        month: Optional[int] = None, guild_id: Optional[int] = None):
+    """
+    ダッシュボードの5つのパネルを、1回の集計テーブル更新でまとめて返す。
+    year/month を省略した場合、月次レポートは今月分。
+    {
+      "today_usage": [...], "weekly_usage": [...], "total_usage": [...],
+      "ranking": [...], "monthly_report": {...}
+    }
+    """
     today = date.today()
-    start_of_day = datetime(today.year, today.month, today.day)
-    end_of_day = start_of_day + timedelta(days=1)
-    df_today = df_sessions[
-        (df_sessions["start_time"] >= start_of_day) & 
-        (df_sessions["start_time"] < end_of_day)
-    ]
-    # チャンネルごとの合計時間
-    usage = df_today.groupby(["channel_id", "channel_name"])["duration_hour"].sum().reset_index()
-    usage_list = []
-    for _, row in usage.iterrows():
-        usage_list.append(ChannelUsage(
-            channel_id=int(row["channel_id"]),
-            channel_name=row["channel_name"],
-            duration_hour=float(row["duration_hour"])
-        ))
-    return usage_list
+    year = year or today.year
+    month = month or today.month
+
+    version = await refresh(guild_id)
+    etag = data_etag(guild_id, version, "dashboard", year, month)
+    return await json_response(request, ("dashboard", guild_id, version, year, month),
+                               dashboard_data, get_rollups(guild_id), year, month, etag=etag)
+
+@app.get("/api/v1/stream")
+async def stream(request: Request, guild_id: Optional[int] = None):
+    """
+    Server-Sent Events で差分を配信する。
+    接続直後に今日の合計（today_usage）を送り、以降は
+    session_opened / session_closed / today_usage / reset を送る（core/live.py 参照）。
+    """
+    # 購読は送り始めてから（ここで例外になったり、送り始める前に切断されたりしてもキューが残らないように）
+    version = await refresh(guild_id)
+    initial = await offload(("today-usage", guild_id, version), today_usage_data, get_rollups(guild_id))
+    live_feed = live_feed_for(guild_id)
+
+    def sse(message: dict) -> str:
+        return f"event: {message['type']}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        queue = None
+        try:
+            queue = live_feed.subscribe()
+            yield sse({"type": "today_usage", "data": initial})
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # 接続維持用のコメント行
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse(message)
+        finally:
+            if queue is not None:
+                live_feed.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/v1/now")
+async def get_now(guild_id: Optional[int] = None):
+    """
+    いまボイスチャンネルにいるユーザーと、入室からの経過時間を返す。
+    {
+      "now": "2025-02-22T21:00:00",
+      "users": [{"user_id": 1, "channel_id": 2, "channel_name": "自習室", "start_time": "...", "duration_hour": 1.5}, ...],
+      "channels": [{"channel_id": 2, "channel_name": "自習室", "count": 3}, ...]
+    }
+    """
+    # 入室中のセッションは保存先のバージョンが変わらなくても動くので、同時のリクエストだけまとめる
+    check_guild(guild_id)
+    return await offload(("now", guild_id), now_data, guild_id)
+
+@app.get("/api/v1/today-usage", response_model=List[ChannelUsage])
+async def get_today_usage(request: Request, include_open: bool = False,
+                          guild_id: Optional[int] = None):
+    """
+    include_open=true のときは、入室中のセッションの現在までの時間も含める（ETag なし）。
+    """
+    version = await refresh(guild_id)
+    key = ("today-usage", guild_id, version)
+    if include_open:
+        return await json_response(request, key + ("open",), with_open_usage, guild_id, today_usage_data)
+    etag = data_etag(guild_id, version, "today-usage")
+    return await json_response(request, key, today_usage_data, get_rollups(guild_id), etag=etag)
 
 @app.get("/api/v1/weekly-usage")
-def get_weekly_usage():
+async def get_weekly_usage(request: Request, guild_id: Optional[int] = None):
     """
-    直近1週間の日付・チャンネル別利用時間を返す。
+    直近1週間（今日を含む7日間）の日付・チャンネル別利用時間を返す。
     React側で積み上げ棒グラフにしやすい形式。
     レスポンス例:
     [
@@ -122,123 +640,224 @@ def get_weekly_usage():
       ...
     ]
     """
-    df = load_data()
-    df_sessions = calculate_sessions(df)
-    if df_sessions.empty:
-        return []
-
-    end_dt = datetime.now()
-    start_dt = end_dt - timedelta(days=7)
-    df_week = df_sessions[
-        (df_sessions["start_time"] >= start_dt) &
-        (df_sessions["start_time"] < end_dt)
-    ].copy()
-    df_week["date"] = df_week["start_time"].dt.date
-    grp = df_week.groupby(["date", "channel_id", "channel_name"])["duration_hour"].sum().reset_index()
-
-    result = []
-    for _, row in grp.iterrows():
-        result.append({
-            "date": row["date"].strftime("%Y-%m-%d"),
-            "channel_id": int(row["channel_id"]),
-            "channel_name": row["channel_name"],
-            "duration_hour": float(row["duration_hour"])
-        })
-    return result
+    version = await refresh(guild_id)
+    etag = data_etag(guild_id, version, "weekly-usage")
+    return await json_response(request, ("weekly-usage", guild_id, version), weekly_usage_data, get_rollups(guild_id),
+                               etag=etag)
 
 @app.get("/api/v1/total-usage", response_model=List[ChannelUsage])
-def get_total_usage():
+async def get_total_usage(request: Request, include_open: bool = False,
+                          guild_id: Optional[int] = None):
     """
     全期間のチャンネル累計利用時間を返す
+    include_open=true のときは、入室中のセッションの現在までの時間も含める（ETag なし）。
     """
-    df = load_data()
-    df_sessions = calculate_sessions(df)
-    if df_sessions.empty:
-        return []
-
-    usage = df_sessions.groupby(["channel_id", "channel_name"])["duration_hour"].sum().reset_index()
-    usage.sort_values("duration_hour", ascending=False, inplace=True)
-
-    result = []
-    for _, row in usage.iterrows():
-        result.append(ChannelUsage(
-            channel_id=int(row["channel_id"]),
-            channel_name=row["channel_name"],
-            duration_hour=float(row["duration_hour"])
-        ))
-    return result
+    version = await refresh(guild_id)
+    key = ("total-usage", guild_id, version)
+    if include_open:
+        return await json_response(request, key + ("open",), with_open_usage, guild_id, total_usage_data)
+    etag = data_etag(guild_id, version, "total-usage")
+    return await json_response(request, key, total_usage_data, get_rollups(guild_id), etag=etag)
 
 @app.get("/api/v1/ranking")
-def get_ranking():
+async def get_ranking(request: Request, include_open: bool = False, guild_id: Optional[int] = None):
     """
     チャンネル使用量ランキング(上位10件など)を返す例
-    [ {channel_id, channel_name, duration_hour}, ... ]
+    [ {rank, channel_id, channel_name, duration_hour}, ... ]
     """
-    df = load_data()
-    df_sessions = calculate_sessions(df)
-    if df_sessions.empty:
-        return []
+    version = await refresh(guild_id)
+    key = ("ranking", guild_id, version)
+    if include_open:
+        def compute():
+            return ranking_data(with_open_usage(guild_id, total_usage_data))
+        return await json_response(request, key + ("open",), compute)
+    etag = data_etag(guild_id, version, "ranking")
+    return await json_response(request, key, lambda r: ranking_data(total_usage_data(r)), get_rollups(guild_id),
+                               etag=etag)
 
-    usage = df_sessions.groupby(["channel_id", "channel_name"])["duration_hour"].sum().reset_index()
-    usage.sort_values("duration_hour", ascending=False, inplace=True)
+@app.get("/api/v1/users/ranking")
+async def get_user_ranking(request: Request,
+                           window: Literal["day", "week", "month", "all"] = "week",
+                           offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100),
+                           user_id: Optional[int] = None, include_open: bool = False,
+                           guild_id: Optional[int] = None):
+    """
+    ユーザーの学習時間ランキングを offset 位置から limit 件返す（core/leaderboard.py）。
+    window は day（今日）/ week（直近7日）/ month（直近30日）/ all（全期間）。
+    user_id を指定すると、そのユーザーの順位も "user" に入れる（記録がなければ null）。
+    同じ時間のユーザーは同じ順位。
+    {
+      "window": "week", "start_date": "2025-02-16", "total_users": 42, "offset": 0, "limit": 20,
+      "ranking": [{"rank": 1, "user_id": 123, "duration_hour": 12.5}, ...],
+      "user": {"rank": 5, "user_id": 456, "duration_hour": 8.0}
+    }
+    """
+    version = await refresh(guild_id)
+    key = ("users-ranking", guild_id, version, window, offset, limit, user_id)
+    if include_open:
+        def compute():
+            return user_ranking_data(guild_id, window, offset, limit, user_id, open_usage(guild_id, datetime.now()))
+        return await json_response(request, key + ("open",), compute)
+    etag = data_etag(guild_id, version, "users-ranking", window, offset, limit, user_id)
+    return await json_response(request, key, user_ranking_data, guild_id, window, offset, limit, user_id, etag=etag)
 
-    # 上位10位のみ
-    usage_top = usage.head(10)
-    result = []
-    for i, row in usage_top.iterrows():
-        result.append({
-            "rank": i+1,
-            "channel_id": int(row["channel_id"]),
-            "channel_name": row["channel_name"],
-            "duration_hour": float(row["duration_hour"])
-        })
-    return result
+def end_after(end: Optional[date]) -> Optional[date]:
+    # API では終わりの日付も含める。集計テーブルには翌日を [start_day, end_day) の end_day として渡す
+    return end + timedelta(days=1) if end is not None else None
 
-@app.get("/api/v1/monthly-report")
-def get_monthly_report(year: int, month: int):
+@app.get("/api/v1/users/{user_id}/sessions")
+async def get_user_sessions(request: Request, user_id: int,
+                            start: Optional[date] = None, end: Optional[date] = None,
+                            order: Literal["asc", "desc"] = "desc", cursor: Optional[str] = None,
+                            limit: int = Query(100, ge=1, le=config.USER_SESSIONS_MAX_LIMIT),
+                            guild_id: Optional[int] = None):
     """
-    指定された年・月の合計時間・日毎のデータなどを返す例
+    ユーザーの確定したセッションを、開始時刻の新しい順（order=asc で古い順）に limit 件返す。
+    start / end（どちらも含む）で開始日を絞り込める。続きがあれば next_cursor を ?cursor= に渡す（なければ null）。
+    limit が USER_SESSIONS_STREAM_ROWS を超えるページは、少しずつ読んで JSON を順に送る。
     {
-      "total_hour": 10.5,
-      "daily_usage": [
-         {"date": "2025-02-01", "duration_hour": 1.2},
-         ...
-      ]
+      "user_id": 123, "start_date": "2025-02-01", "end_date": "2025-02-28", "order": "desc", "limit": 100,
+      "sessions": [
+        {"start_time": "2025-02-28T21:00:00", "end_time": "2025-02-28T23:30:00",
+         "channel_id": 456, "channel_name": "自習室", "duration_hour": 2.5},
+        ...
+      ],
+      "next_cursor": "MjAyNS0wMi0xMCAxMDowMDowMC4wMDAwMDB8NDI="
     }
     """
-    df = load_data()
-    df_sessions = calculate_sessions(df)
-    if df_sessions.empty:
-        return {"total_hour": 0.0, "daily_usage": []}
-
-    start_dt = datetime(year, month, 1)
-    # 次月1日を求めるため、+32日してday=1にする簡易ロジック
-    end_dt = (start_dt + timedelta(days=32)).replace(day=1)
+    after = decode_cursor(cursor) if cursor else None
+    descending = order == "desc"
+    end_day = end_after(end)
+    version = await refresh(guild_id)
+    etag = data_etag(guild_id, version, "user-sessions", user_id, start, end, order, cursor, limit)
+    head = {
+        "user_id": user_id,
+        "start_date": start.isoformat() if start else None,
+        "end_date": end.isoformat() if end else None,
+        "order": order,
+        "limit": limit,
+    }
+    if limit <= config.USER_SESSIONS_STREAM_ROWS:
+        def compute():
+            rows, next_cursor = user_session_page(guild_id, user_id, start, end_day, after, limit, descending)
+            return {**head, "sessions": session_data(rows), "next_cursor": next_cursor}
+        return await json_response(request, ("user-sessions", guild_id, version, user_id, start, end, order, cursor,
+                                             limit), compute, etag=etag)
 
-    df_month = df_sessions[
-        (df_sessions["start_time"] >= start_dt) &
-        (df_sessions["start_time"] < end_dt)
-    ].copy()
+    # 大きいページは変換済みのバイト列をキャッシュせず、圧縮もしない。304 と ETag の扱いは json_response と同じ
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    matched = matched_etag(request, etag)
+    if matched:
+        return Response(status_code=304, headers={**headers, "ETag": matched})
 
-    if df_month.empty:
-        return {"total_hour": 0.0, "daily_usage": []}
+    async def body():
+        # 1回に読むのは USER_SESSIONS_STREAM_ROWS 件まで。続きは直前の行の (start_time, id) から読む
+        loop = asyncio.get_running_loop()
+        yield dumps(head)[:-1] + b',"sessions":['
+        remaining, position, next_cursor, first = limit, after, None, True
+        while remaining > 0:
+            size = min(remaining, config.USER_SESSIONS_STREAM_ROWS)
+            rows, next_cursor = await loop.run_in_executor(
+                executor, user_session_page, guild_id, user_id, start, end_day, position, size, descending,
+            )
+            if rows:
+                with STAGE_SECONDS.time(stage="serialize"):
+                    chunk = dumps(session_data(rows))[1:-1]
+                yield chunk if first else b"," + chunk
+                first = False
+            if next_cursor is None:
+                break
+            remaining -= len(rows)
+            position = (rows[-1][1], rows[-1][0])
+        yield b'],"next_cursor":' + dumps(next_cursor) + b"}"
 
-    total_hour = df_month["duration_hour"].sum()
+    return StreamingResponse(body(), media_type="application/json", headers={**headers, "ETag": etag})
 
-    df_month["date"] = df_month["start_time"].dt.date
-    daily_grp = df_month.groupby("date")["duration_hour"].sum().reset_index()
+@app.get("/api/v1/users/{user_id}/summary")
+async def get_user_summary(request: Request, user_id: int,
+                           start: Optional[date] = None, end: Optional[date] = None,
+                           include_open: bool = False, guild_id: Optional[int] = None):
+    """
+    ユーザーの start / end（どちらも含む）に始まったセッションの集計を返す。
+    include_open=true で入室中のセッションの時間も合計・チャンネル別・日別に含める（sessions の件数には数えない）。
+    {
+      "user_id": 123, "start_date": null, "end_date": null,
+      "total_hour": 120.5, "sessions": 80, "active_days": 40, "average_hour": 1.5, "longest_hour": 6.0,
+      "first_start": "2025-01-04T09:00:00", "last_end": "2025-02-28T23:30:00",
+      "channels": [{"channel_id": 456, "channel_name": "自習室", "duration_hour": 100.0, "sessions": 60}, ...],
+      "daily_usage": [{"date": "2025-01-04", "duration_hour": 2.0}, ...],
+      "open_session": null
+    }
+    """
+    end_day = end_after(end)
+    if not include_open:
+        # end が昨日以前で、もう変わらない期間なら、その期間の集計が変わるまで1回だけ計算する
+        etag = await closed_etag(guild_id, start, end_day, "user-summary", user_id)
+        if etag is not None:
+            return await json_response(request, ("user-summary", guild_id, "closed", etag), user_summary_data,
+                                       guild_id, user_id, start, end_day, etag=etag,
+                                       max_age=config.CLOSED_PERIOD_MAX_AGE)
+    version = await refresh(guild_id)
+    key = ("user-summary", guild_id, version, user_id, start, end)
+    if include_open:
+        def compute():
+            return user_summary_data(guild_id, user_id, start, end_day, open_usage(guild_id, datetime.now()))
+        return await json_response(request, key + ("open",), compute)
+    etag = data_etag(guild_id, version, "user-summary", user_id, start, end)
+    return await json_response(request, key, user_summary_data, guild_id, user_id, start, end_day, etag=etag)
 
-    daily_list = []
-    for _, row in daily_grp.iterrows():
-        daily_list.append({
-            "date": row["date"].strftime("%Y-%m-%d"),
-            "duration_hour": float(row["duration_hour"])
-        })
+@app.get("/api/v1/heatmap")
+async def get_heatmap(request: Request, start: Optional[date] = None, end: Optional[date] = None,
+                      user_id: Optional[int] = None, include_open: bool = False, guild_id: Optional[int] = None):
+    """
+    曜日・時間帯ごとの合計時間（ヒートマップ用）。hours[曜日][時] で、曜日は 0 が月曜日。
+    期間は start / end（どちらも含む）で、省略時は今日までの28日間。
+    セッションは毎時0分で分けて数える（23:30〜翌0:30 なら 23時と0時に30分ずつ）。
+    user_id を指定するとそのユーザーの分だけ。include_open=true で入室中の時間も含める。
+    {
+      "start_date": "2025-02-01", "end_date": "2025-02-28", "user_id": null, "total_hour": 320.5,
+      "hours": [[0.0, 0.0, ..., 1.5], ...]
+    }
+    """
+    end_day = end_after(end or date.today())
+    start_day = start or end_day - timedelta(days=28)
+    if not include_open:
+        etag = await closed_etag(guild_id, start_day, end_day, "heatmap", user_id)
+        if etag is not None:
+            return await json_response(request, ("heatmap", guild_id, "closed", etag), heatmap_data,
+                                       guild_id, start_day, end_day, user_id, etag=etag,
+                                       max_age=config.CLOSED_PERIOD_MAX_AGE)
+    version = await refresh(guild_id)
+    key = ("heatmap", guild_id, version, start_day, end_day, user_id)
+    if include_open:
+        def compute():
+            return heatmap_data(guild_id, start_day, end_day, user_id, open_usage(guild_id, datetime.now()))
+        return await json_response(request, key + ("open",), compute)
+    etag = data_etag(guild_id, version, "heatmap", start_day, end_day, user_id)
+    return await json_response(request, key, heatmap_data, guild_id, start_day, end_day, user_id, etag=etag)
 
-    return {
-        "total_hour": float(total_hour),
-        "daily_usage": daily_list
+@app.get("/api/v1/monthly-report")
+async def get_monthly_report(request: Request, year: int, month: int, guild_id: Optional[int] = None):
+    """
+    指定された年・月の合計時間・日毎のデータなどを返す例
+    {
+      "total_hour": 10.5,
+      "daily_usage": [
+         {"date": "2025-02-01", "duration_hour": 1.2},
+         ...
+      ]
     }
+    """
+    start_day, end_day = month_range(year, month)
+    # 先月以前の月は、その月の集計が変わらない限り1回だけ計算する
+    etag = await closed_etag(guild_id, start_day, end_day, "monthly-report")
+    if etag is not None:
+        return await json_response(request, ("monthly-report", guild_id, "closed", etag), monthly_report_data,
+                                   get_rollups(guild_id), year, month, etag=etag, max_age=config.CLOSED_PERIOD_MAX_AGE)
+    version = await refresh(guild_id)
+    etag = data_etag(guild_id, version, "monthly-report", year, month)
+    return await json_response(request, ("monthly-report", guild_id, version, year, month),
+                               monthly_report_data, get_rollups(guild_id), year, month, etag=etag)
 
 # サーバー起動は、以下コマンドなどで行う
 # uvicorn main:app --reload --port 8000
\ No newline at end of file
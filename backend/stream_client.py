@@ -0,0 +1,104 @@
+"""
+/api/v1/stream の動作確認用クライアント（Discord なしで実行できる）。
+
+一時ディレクトリのログを使う API サーバーをこのプロセス内で起動し、
+SSE に複数のクライアントで接続したうえで join / leave を保存先に書き込み、
+全クライアントに session_opened → session_closed → today_usage が届くことを確認する。
+
+実行例（backend/ で）:
+    python stream_client.py --clients 5
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import uvicorn
+
+EXPECTED = ["session_opened", "session_closed", "today_usage"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def listen(url: str, received: queue.Queue, ready: threading.Event):
+    """
+    SSE を読み、受け取ったメッセージを received に入れる。
+    """
+    with httpx.stream("GET", url, timeout=None) as response:
+        ready.set()
+        for line in response.iter_lines():
+            if line.startswith("data: "):
+                received.put(json.loads(line[len("data: "):]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=3, help="同時に接続するクライアント数")
+    parser.add_argument("--timeout", type=float, default=10.0, help="メッセージを待つ秒数")
+    args = parser.parse_args()
+
+    # 本番のログを汚さないよう、一時ディレクトリを保存先にしてから main を読み込む
+    os.environ["DATA_DIR"] = tempfile.mkdtemp()
+    os.environ.setdefault("STREAM_POLL_INTERVAL", "0.2")
+    import main as api
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    url = f"http://127.0.0.1:{port}/api/v1/stream"
+    inboxes = []
+    for _ in range(args.clients):
+        received, ready = queue.Queue(), threading.Event()
+        threading.Thread(target=listen, args=(url, received, ready), daemon=True).start()
+        ready.wait(args.timeout)
+        inboxes.append(received)
+
+    # 接続直後の today_usage を読み捨てる
+    for received in inboxes:
+        assert received.get(timeout=args.timeout)["type"] == "today_usage"
+
+    # VCLogger の代わりに、セッションの状態機械を通して保存先へ直接書き込む
+    from core.session_tracker import SessionTracker
+    tracker = SessionTracker()
+    now = datetime.now()
+    events, _ = tracker.join(1, 100, "自習室", now - timedelta(minutes=30))
+    api.storage.append_events(events)
+    time.sleep(1.0)
+    events, sessions = tracker.leave(1, 100, "自習室", now)
+    api.storage.append_events(events)
+    api.storage.append_sessions(sessions)
+
+    ok = True
+    for i, received in enumerate(inboxes):
+        types = []
+        deadline = time.monotonic() + args.timeout
+        while len(types) < len(EXPECTED) and time.monotonic() < deadline:
+            try:
+                types.append(received.get(timeout=max(deadline - time.monotonic(), 0.01))["type"])
+            except queue.Empty:
+                break
+        status = "OK" if types == EXPECTED else "NG"
+        ok &= types == EXPECTED
+        print(f"client {i}: {status} {types}")
+
+    print(f"購読者数: {api.live_feed.subscriber_count}")
+    server.should_exit = True
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+API の負荷試験: 多数のクライアントから同時にダッシュボードを読み込んだときのレイテンシを測る。
+
+generate_logs.py のデータセットを一時ディレクトリにコピーし、その保存先を使う API サーバーを
+別プロセスの uvicorn で起動する。--clients 個のクライアントが ENDPOINTS から順にリクエストを送り
+（If-None-Match なし。毎回集計させる）、p50 / p95 / p99 を表示する。
+--write-interval 秒ごとに join / leave を保存先に書き込み、Bot が動いているときのように
+データのバージョンを変えながら測る。
+
+--backend に別のチェックアウトの backend/ を渡すと、そのコードのサーバーで同じ試験ができる（変更前との比較用）。
+
+実行例:
+    python benchmarks/api_load.py --size 1m --clients 100
+    git worktree add /tmp/before HEAD~1
+    python benchmarks/api_load.py --size 1m --clients 100 --backend /tmp/before/backend
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import httpx
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.generate_logs import SIZES, ensure_dataset  # noqa: E402
+
+ENDPOINTS = [
+    "/api/v1/dashboard",
+    "/api/v1/today-usage",
+    "/api/v1/weekly-usage",
+    "/api/v1/total-usage",
+    "/api/v1/ranking",
+    "/api/v1/monthly-report?year={year}&month={month}",
+    "/api/v1/today-usage?include_open=true",
+    "/api/v1/now",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(backend_dir: str, data_dir: str, port: int, workers: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATA_DIR": data_dir,
+        "STORAGE_BACKEND": "csv",
+        "DEFAULT_GUILD_ID": "",
+        "API_WORKERS": str(workers),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--timeout-keep-alive", "60"],
+        cwd=backend_dir, env=env,
+    )
+
+
+def wait_ready(base_url: str, timeout: float = 600):
+    """
+    起動を待ち、最初のリクエストでセッションの作成と集計テーブルの構築を済ませておく。
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(base_url + "/api/v1/dashboard", timeout=timeout).raise_for_status()
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def writer(data_dir: str, interval: float, stop: threading.Event):
+    """
+    interval 秒ごとに、合成ユーザーの join と leave を交互に保存先へ書き込む。
+    """
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["STORAGE_BACKEND"] = "csv"
+    os.environ["DEFAULT_GUILD_ID"] = ""
+    # 計測中にログの切り替え（過去分の圧縮）が走らないようにする
+    os.environ["VC_LOG_ROTATE"] = "off"
+    from core.session_tracker import SessionTracker
+    from core.storage import get_storage
+
+    storage = get_storage()
+    tracker = SessionTracker()
+    joined = False
+    while not stop.wait(interval):
+        now = datetime.now()
+        if joined:
+            events, sessions = tracker.leave(1, 100, "自習室", now)
+        else:
+            events, sessions = tracker.join(1, 100, "自習室", now)
+        storage.append_events(events)
+        if sessions:
+            storage.append_sessions(sessions)
+        joined = not joined
+
+
+class Connection:
+    """
+    keep-alive で GET を繰り返すだけの最小限の HTTP/1.1 クライアント。
+    1 vCPU の環境でもクライアント側の CPU 時間でサーバーの測定を乱さないよう、httpx は使わない。
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path: str) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode("latin-1"))
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("サーバーが接続を閉じました")
+        length, keep_alive = 0, True
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+            elif name.lower() == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+        await self.reader.readexactly(length)
+        if not keep_alive:
+            self.close()
+        return int(status_line.split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def client(host: str, port: int, paths: list, requests: int, latencies: list, errors: list):
+    conn = Connection(host, port)
+    try:
+        for i in range(requests):
+            path = paths[i % len(paths)]
+            t0 = time.perf_counter()
+            try:
+                status = await conn.get(path)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                conn.close()
+                errors.append(f"{path}: {e!r}")
+                continue
+            if status == 200:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors.append(f"{path}: HTTP {status}")
+    finally:
+        conn.close()
+
+
+async def run_load(host: str, port: int, clients: int, requests: int, seed: int) -> tuple:
+    today = date.today()
+    paths = [p.format(year=today.year, month=today.month) for p in ENDPOINTS]
+    rng = random.Random(seed)
+    latencies, errors = [], []
+    tasks = []
+    for _ in range(clients):
+        # クライアントごとに始めるエンドポイントをずらす
+        shift = rng.randrange(len(paths))
+        tasks.append(client(host, port, paths[shift:] + paths[:shift], requests, latencies, errors))
+    t0 = time.perf_counter()
+    await asyncio.gather(*tasks)
+    return latencies, errors, time.perf_counter() - t0
+
+
+def cpu_seconds(pid: int) -> float:
+    """
+    プロセスの CPU 時間（user + system）。/proc のない環境では nan。
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return float("nan")
+
+
+def singleflight_counts(base_url: str) -> dict:
+    counts = {}
+    text = httpx.get(base_url + "/metrics").text
+    for line in text.splitlines():
+        if line.startswith('vc_cache_requests_total{cache="singleflight"'):
+            result = line.split('result="')[1].split('"')[0]
+            counts[result] = float(line.rsplit(" ", 1)[1])
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=SIZES, default="1m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clients", type=int, default=100, help="同時に接続するクライアント数")
+    parser.add_argument("--requests", type=int, default=20, help="クライアントごとのリクエスト数")
+    parser.add_argument("--workers", type=int, default=4, help="サーバーの API_WORKERS")
+    parser.add_argument("--write-interval", type=float, default=1.0, help="書き込みの間隔（秒）。0 で書き込まない")
+    parser.add_argument("--backend", default=os.path.join(ROOT_DIR, "backend"), help="サーバーの backend/ ディレクトリ")
+    args = parser.parse_args()
+
+    source = ensure_dataset(args.size, args.seed)
+    data_dir = tempfile.mkdtemp(prefix="api_load_")
+    shutil.copy(source, os.path.join(data_dir, "vc_logs.csv"))
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(os.path.abspath(args.backend), data_dir, port, args.workers)
+    stop = threading.Event()
+    try:
+        t0 = time.perf_counter()
+        wait_ready(base_url)
+        print(f"起動・初回の集計: {time.perf_counter() - t0:.1f} 秒")
+
+        if args.write_interval > 0:
+            threading.Thread(target=writer, args=(data_dir, args.write_interval, stop), daemon=True).start()
+        cpu_before = cpu_seconds(server.pid)
+        latencies, errors, elapsed = asyncio.run(
+            run_load("127.0.0.1", port, args.clients, args.requests, args.seed)
+        )
+        server_cpu = cpu_seconds(server.pid) - cpu_before
+        counts = singleflight_counts(base_url)
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    ms = np.array(latencies) * 1000
+    print(f"{args.clients} クライアント × {args.requests} リクエスト: {len(ms)} 件成功 / {len(errors)} 件失敗 / "
+          f"{elapsed:.1f} 秒 ({len(ms) / elapsed:.0f} req/s)")
+    if len(ms):
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"  p50 {p50:.0f} ms / p95 {p95:.0f} ms / p99 {p99:.0f} ms / max {ms.max():.0f} ms")
+    print(f"  サーバーの CPU 時間 {server_cpu:.1f} 秒（1リクエストあたり {server_cpu / max(len(ms), 1) * 1000:.1f} ms）")
+    if counts:
+        print(f"  single-flight: 実行 {counts.get('executed', 0):.0f} 回 / 共有 {counts.get('shared', 0):.0f} 回")
+    for error in errors[:5]:
+        print(f"  {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+イベントログのメモリ上の表現（core.eventstore.EventStore）のベンチマーク。
+
+generate_logs.py のデータセットを、置き換え前の LogCache と同じく DataFrame のまま読んで
+突き合わせたセッションと一緒に持つ場合と、LogCache（EventStore）で読んだ場合について、
+読み込み時間と読み込み後の常駐メモリの増分をそれぞれ別プロセスで測る（Linux のみ）。
+イベントの内容が一致することも確認する。
+
+実行例:
+    python benchmarks/bench_eventstore.py --size 1m
+    python benchmarks/bench_eventstore.py --size 10m
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_logs import SIZES, ensure_dataset  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def load_dataframe(path: str):
+    """
+    比較用: 置き換え前の LogCache._parse と同じ読み方。
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    df.sort_values("timestamp", inplace=True, kind="stable")
+    return df
+
+
+def load_legacy(path: str):
+    """
+    比較用: 置き換え前の LogCache が保持していたもの（イベント・セッション・leave 待ちの join）。
+    """
+    from core.sessions import calculate_sessions, pending_joins
+
+    events = load_dataframe(path)
+    return events, calculate_sessions(events), pending_joins(events)
+
+
+def load_eventstore(path: str):
+    from core.logcache import LogCache
+
+    cache = LogCache(path)
+    cache.refresh()
+    return cache
+
+
+def run_worker(kind: str, path: str) -> dict:
+    import pandas as pd  # noqa: F401  ライブラリの読み込み分は増分に含めない
+
+    import core.logcache  # noqa: F401
+
+    gc.collect()
+    before = rss_mb()
+    t0 = time.perf_counter()
+    loaded = load_legacy(path) if kind == "dataframe" else load_eventstore(path)
+    seconds = time.perf_counter() - t0
+    gc.collect()
+    result = {"seconds": seconds, "resident_mb": rss_mb() - before}
+    if kind == "dataframe":
+        result["rows"] = len(loaded[0])
+        result["frame_mb"] = sum(df.memory_usage(deep=True).sum() for df in loaded) / 2**20
+    else:
+        store = loaded._store
+        result["rows"] = len(store)
+        result["frame_mb"] = store.nbytes / 2**20
+    return result
+
+
+def check_equal(path: str):
+    """
+    EventStore から戻した DataFrame が、DataFrame のまま読んだものと同じ値か確認する。
+    """
+    expected = load_dataframe(path).reset_index(drop=True)
+    actual = load_eventstore(path).events()
+    for col in expected.columns:
+        a = actual[col].astype(object).where(actual[col].notna(), None).to_numpy()
+        e = expected[col].astype(object).where(expected[col].notna(), None).to_numpy()
+        if col == "timestamp":
+            a, e = actual[col].to_numpy(), expected[col].to_numpy().astype(actual[col].dtype)
+        elif col in ("channel_id", "guild_id"):
+            e = [None if v is None else int(v) for v in e]
+            a = [None if v is None else int(v) for v in a]
+        if not all(x == y for x, y in zip(a, e)):
+            raise AssertionError(f"{col} が一致しません")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=SIZES, default="1m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", choices=["dataframe", "eventstore"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.path)))
+        return
+
+    path = ensure_dataset(args.size, args.seed)
+    results = {}
+    for kind in ("dataframe", "eventstore"):
+        out = subprocess.run([sys.executable, __file__, "--worker", kind, "--path", path],
+                             check=True, capture_output=True, text=True).stdout
+        results[kind] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{results['dataframe']['rows']:,} 行")
+    for kind, r in results.items():
+        print(f"  {kind:<11} 読み込み {r['seconds']:6.2f} 秒 / 常駐メモリの増分 {r['resident_mb']:8.1f} MB "
+              f"（データ {r['frame_mb']:.1f} MB）")
+    ratio = results["dataframe"]["resident_mb"] / max(results["eventstore"]["resident_mb"], 1e-9)
+    print(f"  常駐メモリ: {ratio:.1f} 分の1")
+    if args.size != "10m":
+        check_equal(path)
+        print("  内容は一致しました")
+
+
+if __name__ == "__main__":
+    main()
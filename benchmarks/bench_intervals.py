@@ -0,0 +1,113 @@
+"""
+日・時間の区切りでのセッションの分割（core.intervals.split_intervals）のベンチマーク。
+
+合成した数百万件のセッションを日・毎時の区切りに分ける時間を、1件ずつ datetime で区切りを
+進める素朴な実装と比べる。一部のセッションで結果が一致すること（夏時間のあるタイムゾーンを含む）と、
+分けた時間の合計が元のセッションの時間と等しいことも確認する。
+
+実行例:
+    python benchmarks/bench_intervals.py --sessions 3000000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.intervals import hour_of_week, split_intervals  # noqa: E402
+
+STEPS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+
+
+def legacy_split(starts, ends, unit: str, tz=None) -> list:
+    """
+    比較用: セッションごとに区切りを1つずつ進めて分ける。
+    """
+    step = STEPS[unit]
+    pieces = []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bucket = start.replace(hour=0) if unit == "day" else start
+        bucket = bucket.replace(minute=0, second=0, microsecond=0)
+        while True:
+            piece_start, piece_end = max(start, bucket), min(end, bucket + step)
+            if tz is None:
+                seconds = (piece_end - piece_start).total_seconds()
+            else:
+                seconds = max((piece_end.replace(tzinfo=tz).timestamp() - piece_start.replace(tzinfo=tz).timestamp()), 0)
+            pieces.append((i, bucket, seconds / 3600.0))
+            bucket += step
+            if bucket >= end:
+                break
+    return pieces
+
+
+def make_synthetic_sessions(n: int, seed: int = 0):
+    """
+    1年分の開始時刻と、平均1.5時間（約1%は1日以上）の長さのセッションを作る。
+    """
+    rng = np.random.default_rng(seed)
+    starts = np.datetime64("2025-01-01T00:00:00", "us") + rng.integers(0, 365 * 86_400 * 10**6, n).astype("timedelta64[us]")
+    hours = rng.exponential(1.5, n)
+    hours[rng.random(n) < 0.01] *= 20
+    return starts, starts + (hours * 3_600_000_000).astype("int64").astype("timedelta64[us]")
+
+
+def check(starts, ends, unit: str, tz):
+    index, bucket, hours = split_intervals(starts, ends, unit, tz)
+    expected = legacy_split([s.item() for s in starts], [e.item() for e in ends], unit, tz)
+    if len(expected) != len(index):
+        raise AssertionError(f"{unit}: 区切りの数が一致しません（{len(index)} / {len(expected)}）")
+    for (i, b, h), ai, ab, ah in zip(expected, index, bucket.astype(datetime), hours):
+        if i != ai or b != ab or abs(h - ah) > 1e-9:
+            raise AssertionError(f"{unit}: {(i, b, h)} != {(ai, ab, ah)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=3_000_000, help="ベクトル化した実装に与えるセッション数")
+    parser.add_argument("--legacy-sessions", type=int, default=100_000,
+                        help="素朴な実装に与えるセッション数（全件だと時間がかかるため一部で計測して外挿する）")
+    parser.add_argument("--timezone", default="Asia/Tokyo")
+    args = parser.parse_args()
+
+    tz = ZoneInfo(args.timezone) if args.timezone else None
+    starts, ends = make_synthetic_sessions(args.sessions)
+    total = (ends - starts).astype("int64").sum() / 3_600_000_000
+    print(f"synthetic sessions: {args.sessions:,}（合計 {total:,.0f} 時間）")
+
+    for zone in (tz, ZoneInfo("America/New_York")):
+        for unit in STEPS:
+            check(starts[:5000], ends[:5000], unit, zone)
+    print("results match on 5,000 sessions (day / hour, including a DST time zone)")
+
+    sample = slice(0, args.legacy_sessions)
+    sample_starts = [s.item() for s in starts[sample]]
+    sample_ends = [e.item() for e in ends[sample]]
+    for unit in STEPS:
+        t0 = time.perf_counter()
+        legacy_split(sample_starts, sample_ends, unit, tz)
+        legacy_sec = time.perf_counter() - t0
+        legacy_estimate = legacy_sec * args.sessions / args.legacy_sessions
+
+        t0 = time.perf_counter()
+        index, bucket, hours = split_intervals(starts, ends, unit, tz)
+        vector_sec = time.perf_counter() - t0
+        if abs(hours.sum() - total) > 1e-6 * total:
+            raise AssertionError(f"{unit}: 分けた時間の合計が一致しません")
+        print(f"{unit:<5} loop       : {legacy_sec:7.3f}s for {args.legacy_sessions:,} sessions "
+              f"(~{legacy_estimate:.1f}s for {args.sessions:,})")
+        print(f"{unit:<5} vectorized : {vector_sec:7.3f}s for {args.sessions:,} sessions ({len(index):,} pieces)"
+              f" / speedup ~{legacy_estimate / vector_sec:.0f}x")
+        if unit == "hour":
+            t0 = time.perf_counter()
+            hour_of_week(bucket, hours)
+            print(f"hour-of-week heatmap: {time.perf_counter() - t0:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
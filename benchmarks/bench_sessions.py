@@ -0,0 +1,124 @@
+"""
+セッション計算(core.sessions.calculate_sessions)のベンチマーク。
+
+合成した数百万行のログに対して、従来の iterrows() 実装と
+ベクトル化した実装の処理時間を比較し、結果が一致することも確認する。
+
+実行例:
+    python benchmarks/bench_sessions.py --rows 3000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.sessions import calculate_sessions  # noqa: E402
+
+
+def legacy_calculate_sessions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    比較用: 置き換え前の backend/main.py の実装そのまま。
+    """
+    sessions = []
+    user_in_channel = {}
+
+    for _, row in df.iterrows():
+        uid = row["user_id"]
+        ch = row["channel_id"]
+        ch_name = row["channel_name"]
+        act = row["action"]
+        ts = row["timestamp"]
+        if act == "join":
+            user_in_channel[uid] = {"channel_id": ch, "channel_name": ch_name, "joined": ts}
+        elif act == "leave":
+            if uid in user_in_channel:
+                start_t = user_in_channel[uid]["joined"]
+                if user_in_channel[uid]["channel_id"] == ch:
+                    sessions.append({
+                        "user_id": uid,
+                        "channel_id": ch,
+                        "channel_name": ch_name,
+                        "start_time": start_t,
+                        "end_time": ts,
+                        "duration_hour": (ts - start_t).total_seconds() / 3600.0,
+                    })
+                del user_in_channel[uid]
+
+    return pd.DataFrame(sessions)
+
+
+def make_synthetic_log(rows: int, users: int = 5000, channels: int = 40, seed: int = 0) -> pd.DataFrame:
+    """
+    join/leave が概ね交互に並ぶ合成ログを作る。
+    孤立した leave、チャンネル不一致の leave、leave のない join も一定割合で混ぜる。
+    """
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(10**17, 10**18, size=users)
+    channel_ids = rng.integers(10**17, 10**18, size=channels)
+
+    user_idx = rng.integers(0, users, size=rows)
+    channel_idx = rng.integers(0, channels, size=rows)
+    # 同じユーザーの行が交互に join/leave になるように、ユーザー内の出現順で決める
+    occurrence = pd.Series(user_idx).groupby(user_idx).cumcount().to_numpy()
+    actions = np.where(occurrence % 2 == 0, "join", "leave").astype(object)
+
+    # 約2%を逆のアクションにして孤立 leave / 上書き join を作る
+    flip = rng.random(rows) < 0.02
+    actions[flip] = np.where(actions[flip] == "join", "leave", "join")
+
+    # leave は基本的に直前の join と同じチャンネル、約3%だけ別チャンネル
+    same_channel = pd.Series(channel_idx).groupby(user_idx).shift(1).to_numpy()
+    is_leave = actions == "leave"
+    keep = is_leave & ~np.isnan(same_channel) & (rng.random(rows) >= 0.03)
+    channel_idx = np.where(keep, np.nan_to_num(same_channel).astype(np.int64), channel_idx)
+
+    start = np.datetime64("2025-01-01T00:00:00")
+    offsets = np.sort(rng.integers(0, 365 * 24 * 3600 * 10**6, size=rows))
+    timestamps = start + offsets.astype("timedelta64[us]")
+
+    return pd.DataFrame({
+        "user_id": user_ids[user_idx],
+        "timestamp": pd.to_datetime(timestamps),
+        "action": actions,
+        "channel_id": channel_ids[channel_idx],
+        "channel_name": [f"ch-{i}" for i in channel_idx],
+    })
+
+
+def timeit(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3_000_000, help="ベクトル化実装に与える行数")
+    parser.add_argument("--legacy-rows", type=int, default=200_000,
+                        help="iterrows 実装に与える行数（全件だと数分かかるため一部で計測して外挿する）")
+    args = parser.parse_args()
+
+    df = make_synthetic_log(args.rows)
+    print(f"synthetic log: {len(df):,} rows")
+
+    sample = df.head(args.legacy_rows)
+    expected, legacy_sec = timeit(legacy_calculate_sessions, sample)
+    actual, _ = timeit(calculate_sessions, sample)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    print(f"results match on {len(sample):,} rows ({len(expected):,} sessions)")
+
+    sessions, vector_sec = timeit(calculate_sessions, df)
+    legacy_estimate = legacy_sec * len(df) / len(sample)
+    print(f"iterrows   : {legacy_sec:8.3f}s for {len(sample):,} rows "
+          f"(~{legacy_estimate:.1f}s for {len(df):,} rows)")
+    print(f"vectorized : {vector_sec:8.3f}s for {len(df):,} rows ({len(sessions):,} sessions)")
+    print(f"speedup    : ~{legacy_estimate / vector_sec:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
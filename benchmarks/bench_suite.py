@@ -0,0 +1,326 @@
+"""
+分析まわりの処理を、合成した vc_logs.csv で段階ごとに計測するベンチマーク。
+
+  load_events          ログ全体の読み込み（LogCache）
+  calculate_sessions   イベントの突き合わせ（core.sessions）
+  storage_bootstrap    保存先の初期化（vc_sessions.csv の作成を含む）
+  load_sessions        セッションファイルの読み込み
+  rollups_rebuild      日別の集計テーブルの作り直し
+  stats_*              統計コマンド（StudyTimeTracker）の集計
+  plot_*               グラフの描画
+  GET ...              FastAPI の TestClient 経由のレイテンシ（中央値。p95 と初回も表示）
+
+データは benchmarks/generate_logs.py で作り（benchmarks/data/ に残して次回も使う）、
+サイズごとに別プロセスで計測し（--repeat 回実行して段階ごとに最も良い値を使う）、
+ピークメモリは段階ごとの常駐メモリの増分（Linux のみ）。
+
+結果は benchmarks/baseline.json と比べ、時間かメモリが許容幅を超えて増えた段階があれば
+終了コード 1 で終わる。計測し直した値を基準にするときは --update-baseline を付ける。
+
+実行例:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --sizes 10k 1m 10m --repeat 1 --requests 50
+    python benchmarks/bench_suite.py --sizes 10k --update-baseline
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_logs import SIZES, ensure_dataset  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+ENDPOINTS = [
+    "/api/v1/dashboard",
+    "/api/v1/today-usage",
+    "/api/v1/today-usage?include_open=true",
+    "/api/v1/weekly-usage",
+    "/api/v1/total-usage",
+    "/api/v1/ranking",
+    "/api/v1/users/ranking?window=week&limit=50",
+    "/api/v1/monthly-report?year={year}&month={month}",
+    "/api/v1/now",
+]
+
+
+# ─────────────────────────────────────────────────────
+# 計測（ワーカープロセス側）
+# ─────────────────────────────────────────────────────
+def _status_kb(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak() -> bool:
+    """
+    常駐メモリの最大値（VmHWM）を今の値に戻す。Linux 以外では False。
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class Recorder:
+    def __init__(self):
+        self.results = {}
+
+    def measure(self, name: str, func, *args, **kwargs):
+        rss = _status_kb("VmRSS") if _reset_peak() else None
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - t0
+        peak = _status_kb("VmHWM") if rss is not None else None
+        self.results[name] = {
+            "seconds": seconds,
+            "peak_mb": None if peak is None else max(peak - rss, 0) / 1024,
+        }
+        return result
+
+    def measure_requests(self, name: str, client, url: str, requests: int):
+        """
+        初回 1 回と、その後 requests 回のレイテンシ。ETag があれば 304 になる再検証も計る。
+        """
+        rss = _status_kb("VmRSS") if _reset_peak() else None
+        t0 = time.perf_counter()
+        response = client.get(url)
+        cold = time.perf_counter() - t0
+        response.raise_for_status()
+
+        timings = []
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            client.get(url).raise_for_status()
+            timings.append(time.perf_counter() - t0)
+        peak = _status_kb("VmHWM") if rss is not None else None
+        timings.sort()
+        self.results[name] = {
+            "seconds": timings[len(timings) // 2],
+            "p95_seconds": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+            "cold_seconds": cold,
+            "peak_mb": None if peak is None else max(peak - rss, 0) / 1024,
+        }
+
+        etag = response.headers.get("etag")
+        if etag:
+            timings = []
+            for _ in range(requests):
+                t0 = time.perf_counter()
+                r = client.get(url, headers={"If-None-Match": etag})
+                timings.append(time.perf_counter() - t0)
+                assert r.status_code == 304, (url, r.status_code)
+            timings.sort()
+            self.results[f"{name} (304)"] = {"seconds": timings[len(timings) // 2], "peak_mb": None}
+
+
+def run_worker(requests: int) -> dict:
+    """
+    DATA_DIR の vc_logs.csv を使って各段階を計測する。環境変数は親プロセスが設定する。
+    """
+    from types import SimpleNamespace
+
+    from fastapi.testclient import TestClient
+
+    from cogs.stats import StudyTimeTracker
+    from core import charts, config
+    from core.leaderboard import WINDOWS, open_hours
+    from core.logcache import LogCache
+    from core.presence import open_session_usage
+    from core.rollups import get_rollups
+    from core.sessions import calculate_sessions
+    from core.storage import get_storage
+
+    rec = Recorder()
+    cache = LogCache(config.VC_LOG_PATH)
+    rec.measure("load_events", cache.refresh)
+    events = cache.events()
+    del cache
+    rec.measure("calculate_sessions", calculate_sessions, events)
+    del events
+
+    storage = rec.measure("storage_bootstrap", get_storage)
+    rec.measure("load_sessions", storage.sessions)
+    rec.measure("rollups_rebuild", get_rollups().rebuild, storage)
+
+    # 統計コマンドの集計（Discord には接続しない）
+    cog = StudyTimeTracker(SimpleNamespace(get_cog=lambda name: None))
+    today = rec.measure("stats_today", cog.get_today_channel_usage, None)
+    weekly = rec.measure("stats_weekly", cog.get_weekly_channel_usage, None)
+    total = rec.measure("stats_total", cog.get_total_channel_usage, None)
+    open_df = open_session_usage(storage.open_sessions(), datetime.now())
+    leaderboard = rec.measure("stats_rank_index", cog.load_leaderboard, None)
+    rec.measure("stats_rank", leaderboard.top, "all", 3, 0, open_hours(open_df))
+    top_users = [entry["user_id"] for entry in leaderboard.top("all", 100)]
+    rec.measure("stats_myrank", lambda: [leaderboard.rank(w, uid) for uid in top_users for w in WINDOWS])
+    month_start = datetime.combine(date.today().replace(day=1), datetime.min.time())
+    month_end = (month_start + timedelta(days=32)).replace(day=1)
+    month = rec.measure("stats_report", cog.load_sessions, None, month_start, month_end)
+    top_user = int(month["user_id"].mode().iloc[0]) if not month.empty else None
+    user_sessions = rec.measure("stats_studytime", cog.load_sessions, None, user_id=top_user)
+
+    # グラフ（Bot では RenderPool の別プロセスで実行する関数をそのまま呼ぶ）。
+    # ワーカーは使い回すので、matplotlib の初回の初期化（フォントの読み込みなど）は計測から外す
+    charts.plot_total_channel_usage(total.head(1))
+    if not today.empty:
+        rec.measure("plot_today", charts.plot_today_channel_usage, today)
+    if not weekly.empty:
+        rec.measure("plot_weekly", charts.plot_weekly_channel_usage, weekly)
+    if not total.empty:
+        rec.measure("plot_total", charts.plot_total_channel_usage, total)
+    if not month.empty:
+        rec.measure("plot_report", charts.plot_study_time, month, None, "D")
+    if not user_sessions.empty:
+        rec.measure("plot_studytime", charts.plot_study_time, user_sessions, None, "D")
+
+    # API
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+    import main as api
+
+    client = TestClient(api.app)
+    for url in ENDPOINTS:
+        url = url.format(year=month_start.year, month=month_start.month)
+        rec.measure_requests(f"GET {url}", client, url, requests)
+
+    storage.close()
+    return rec.results
+
+
+# ─────────────────────────────────────────────────────
+# 実行と基準値との比較（親プロセス側）
+# ─────────────────────────────────────────────────────
+def run_size(size: str, seed: int, requests: int, repeat: int) -> dict:
+    """
+    ワーカーを repeat 回実行し、段階ごとに最も良かった値を返す（他のプロセスの影響による揺れを除く）。
+    """
+    source = ensure_dataset(size, seed)
+    runs = [run_once(source, size, requests) for _ in range(repeat)]
+    best = {}
+    for name in runs[0]:
+        best[name] = {
+            key: min((run[name][key] for run in runs if run.get(name, {}).get(key) is not None), default=None)
+            for key in runs[0][name]
+        }
+    return best
+
+
+def run_once(source: str, size: str, requests: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as data_dir:
+        # 保存先の初期化でセッションファイルなどを書くので、コピーを使う
+        shutil.copyfile(source, os.path.join(data_dir, "vc_logs.csv"))
+        env = dict(os.environ, DATA_DIR=data_dir, STORAGE_BACKEND="csv", DEFAULT_GUILD_ID="")
+        for key in ("SQLITE_PATH", "ROLLUP_PATH", "GUILDS_DIR", "GUILD_SETTINGS_PATH"):
+            # DATA_DIR の下の既定のパスを使わせる
+            env.pop(key, None)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--requests", str(requests)],
+            env=env, stdout=subprocess.PIPE, text=True, check=True,
+        )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results: dict, baseline: dict, tolerance: float, memory_tolerance: float,
+            min_seconds: float, min_mb: float) -> list:
+    """
+    基準値より許容幅を超えて遅く（メモリを多く）なった段階を返す。
+    小さな値の揺れで落ちないよう、差が min_seconds / min_mb 未満なら無視する。
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = current["seconds"] - base["seconds"]
+        if slower > min_seconds and current["seconds"] > base["seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {base['seconds'] * 1000:.1f} ms → {current['seconds'] * 1000:.1f} ms")
+        if current.get("peak_mb") is not None and base.get("peak_mb") is not None:
+            grew = current["peak_mb"] - base["peak_mb"]
+            if grew > min_mb and current["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance):
+                regressions.append(f"{name}: {base['peak_mb']:.0f} MB → {current['peak_mb']:.0f} MB")
+    return regressions
+
+
+def print_results(size: str, results: dict, baseline: dict):
+    print(f"\n== {size} ({SIZES[size]:,} 行) ==")
+    print(f"{'段階':<52} {'時間(ms)':>10} {'基準(ms)':>10} {'比':>6} {'メモリ(MB)':>11}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        base_ms = f"{base['seconds'] * 1000:10.1f}" if base else f"{'-':>10}"
+        ratio = f"{current['seconds'] / base['seconds']:6.2f}" if base and base["seconds"] > 0 else f"{'-':>6}"
+        peak = f"{current['peak_mb']:11.1f}" if current.get("peak_mb") is not None else f"{'-':>11}"
+        extra = ""
+        if "p95_seconds" in current:
+            extra = f"  (p95 {current['p95_seconds'] * 1000:.1f} / 初回 {current['cold_seconds'] * 1000:.1f})"
+        print(f"{name:<52} {current['seconds'] * 1000:10.1f} {base_ms} {ratio} {peak}{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=["10k", "1m"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=20, help="エンドポイントごとのリクエスト回数")
+    parser.add_argument("--repeat", type=int, default=3, help="サイズごとの実行回数（段階ごとに最も良い値を使う）")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="今回の結果を基準値として保存する")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="時間の許容幅（0.5 なら 1.5 倍まで）")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="メモリの許容幅")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="これ未満の時間差は無視する")
+    parser.add_argument("--min-mb", type=float, default=20.0, help="これ未満のメモリ差は無視する")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.requests)))
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    for size in args.sizes:
+        results = run_size(size, args.seed, args.requests, args.repeat)
+        size_baseline = baseline.get("sizes", {}).get(size, {})
+        print_results(size, results, size_baseline)
+        if args.update_baseline:
+            baseline.setdefault("sizes", {})[size] = results
+        else:
+            regressions += [f"[{size}] {r}" for r in compare(
+                results, size_baseline, args.tolerance, args.memory_tolerance, args.min_ms / 1000, args.min_mb,
+            )]
+
+    if args.update_baseline:
+        baseline["seed"] = args.seed
+        baseline["updated"] = date.today().isoformat()
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n基準値を保存しました: {args.baseline}")
+        return
+
+    if regressions:
+        print("\n基準値より悪化した段階:")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print("\n基準値からの悪化はありません。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+ベンチマーク用の vc_logs.csv を作る（乱数のシードが同じなら同じファイルになる）。
+
+ユーザーごとに「入室 → （移動）→ 退出」の滞在を重ならないように並べ、
+次のような実際のログに近いイベントを混ぜる。
+  - 移動: 前のチャンネルの leave と次のチャンネルの join が同時刻に並ぶ
+  - 孤立した leave: Bot が止まっていて join を取りこぼした滞在（約1%）
+  - leave のない join: leave を取りこぼした滞在（約0.5%）と、最後にまだ入室中の人
+  - 日付をまたぐ滞在: 夜に始まる長めの滞在
+ユーザーごとの活動量には偏りを持たせる（一部のユーザーがよく入室する）。
+期間は --end の日付の 23:59:59 までの --days 日間。
+
+実行例:
+    python benchmarks/generate_logs.py --size 1m
+    python benchmarks/generate_logs.py --events 250000 --out data/vc_logs.csv
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.schema import LOG_COLUMNS  # noqa: E402
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 1回の滞在あたりの移動回数の割合（0回 / 1回 / 2回）
+MOVE_PROBS = [0.85, 0.11, 0.04]
+MISSED_JOIN_RATE = 0.01
+MISSED_LEAVE_RATE = 0.005
+# 1回の書き込みで to_csv に渡す行数
+WRITE_CHUNK = 1_000_000
+
+
+def default_users(events: int) -> int:
+    return int(min(max(events // 40, 50), 50_000))
+
+
+def dataset_path(size: str, seed: int, end: date) -> str:
+    return os.path.join(DATA_DIR, f"vc_logs_{size}_seed{seed}_{end:%Y%m%d}.csv")
+
+
+def make_events(events: int, users: int, channels: int, seed: int, end: date, days: int = 365) -> pd.DataFrame:
+    """
+    およそ events 行のイベントを timestamp 順の DataFrame で返す。
+    """
+    rng = np.random.default_rng(seed)
+    end_time = np.datetime64(datetime.combine(end, datetime.max.time()).replace(microsecond=0), "us")
+    span = days * 86400 * 10**6  # マイクロ秒
+    start_time = end_time - np.timedelta64(span, "us")
+
+    # Discord の ID と同じくらいの桁の数（重複はまず起きない）
+    user_ids = rng.integers(10**17, 10**18, size=users)
+    channel_ids = rng.integers(10**17, 10**18, size=channels)
+    channel_names = np.array([f"勉強部屋{i + 1}" for i in range(channels)], dtype=object)
+
+    # 1回の滞在で平均 2 + 2 * (移動回数) 行。期間の終わりで切れる分を見込んで少し多めに作る
+    moves_mean = sum(i * p for i, p in enumerate(MOVE_PROBS))
+    visits = int(events / (2 + 2 * moves_mean) * 1.05) + 1
+
+    # ── 滞在をユーザーに割り当て、ユーザーごとに重ならないように並べる ──
+    activity = rng.pareto(1.5, size=users) + 1.0
+    visit_user = np.sort(rng.choice(users, size=visits, p=activity / activity.sum()))
+    per_user = np.bincount(visit_user, minlength=users)
+
+    # 滞在時間は対数正規（中央値 約1時間）、3分〜10時間
+    duration = np.exp(rng.normal(np.log(3600), 0.9, size=visits))
+    duration = np.clip(duration, 180, 36000) * 10**6
+    # 夜（20〜24時）に始まる滞在は長め（日付をまたぐ）にする
+    long_night = rng.random(visits) < 0.08
+    duration[long_night] *= 2.5
+
+    # ユーザーの期間のうち滞在していない時間を、ランダムな間隔に分ける
+    busy = np.bincount(visit_user, weights=duration, minlength=users)
+    scale = np.minimum(1.0, 0.9 * span / np.maximum(busy, 1))
+    duration *= scale[visit_user]
+    free = span - busy * scale
+    gaps = rng.exponential(1.0, size=visits)
+    gap_sum = np.bincount(visit_user, weights=gaps, minlength=users)
+    gaps *= (free / np.maximum(gap_sum, 1e-9))[visit_user] * 0.99
+
+    first = np.r_[0, np.cumsum(per_user)[:-1]]
+    step = np.cumsum(gaps + duration)
+    before_user = np.r_[0.0, step][first][visit_user]
+    visit_end = step - before_user
+    visit_start = visit_end - duration
+
+    # 夜に始まる滞在は開始時刻を 20〜24時に寄せる（前後の滞在と重ならない範囲で）
+    offset_us = visit_start.astype(np.int64)
+    day_base = (start_time.astype(np.int64) + offset_us) // (86400 * 10**6) * (86400 * 10**6)
+    night = day_base + rng.integers(20 * 3600, 24 * 3600, size=visits) * 10**6 - start_time.astype(np.int64)
+    prev_end = np.r_[0.0, visit_end[:-1]]
+    prev_end[first[per_user > 0]] = 0.0
+    next_start = np.r_[visit_start[1:], np.inf]
+    last = first + per_user - 1
+    next_start[last[per_user > 0]] = span
+    shift_ok = long_night & (night > prev_end) & (night + duration < next_start)
+    visit_start = np.where(shift_ok, night, visit_start)
+    visit_end = np.where(shift_ok, night + duration, visit_end)
+
+    # ── 移動でセグメントに分ける ──
+    moves = rng.choice(len(MOVE_PROBS), size=visits, p=MOVE_PROBS)
+    segments = moves + 1
+    seg_visit = np.repeat(np.arange(visits), segments)
+    seg_index = np.arange(len(seg_visit)) - np.repeat(np.cumsum(segments) - segments, segments)
+    # セグメントの境目は滞在時間を均等に分けた位置の前後
+    jitter = rng.uniform(0.2, 0.8, size=len(seg_visit))
+    frac_start = np.where(seg_index == 0, 0.0, (seg_index - 1 + jitter) / segments[seg_visit])
+    frac_end = np.r_[frac_start[1:], 0.0]
+    frac_end[np.cumsum(segments) - 1] = 1.0
+    seg_duration = (visit_end - visit_start)[seg_visit]
+    seg_start = visit_start[seg_visit] + frac_start * seg_duration
+    seg_end = visit_start[seg_visit] + frac_end * seg_duration
+
+    # 移動先は直前と違うチャンネル
+    channel = rng.integers(0, channels, size=len(seg_visit))
+    hop = rng.integers(1, max(channels, 2), size=len(seg_visit))
+    for k in range(1, len(MOVE_PROBS)):
+        moved = seg_index == k
+        channel[moved] = (channel[np.flatnonzero(moved) - 1] + hop[moved]) % channels
+
+    # ── イベント行にする（join / leave） ──
+    is_first = seg_index == 0
+    is_last = frac_end == 1.0
+    keep_join = ~(is_first & (rng.random(len(seg_visit)) < MISSED_JOIN_RATE))
+    keep_leave = ~(is_last & (rng.random(len(seg_visit)) < MISSED_LEAVE_RATE))
+
+    def rows(mask, when, action):
+        idx = np.flatnonzero(mask)
+        return pd.DataFrame({
+            "timestamp": start_time + when[idx].astype(np.int64).astype("timedelta64[us]"),
+            # 同時刻の移動は leave → join の順に並べる
+            "order": np.full(len(idx), 0 if action == "leave" else 1, dtype=np.int8),
+            "user_id": user_ids[visit_user[seg_visit[idx]]],
+            "action": action,
+            "channel_id": channel_ids[channel[idx]],
+            "channel_name": channel_names[channel[idx]],
+        })
+
+    df = pd.concat([rows(keep_join, seg_start, "join"), rows(keep_leave, seg_end, "leave")], ignore_index=True)
+    df = df[df["timestamp"] <= end_time]
+    df.sort_values(["timestamp", "order"], inplace=True, kind="stable")
+    # 期間の始めを切り、最後の events 行にする（始めの leave は join が期間外の孤立した leave になる）
+    df = df.iloc[-events:]
+    df["guild_id"] = pd.array([pd.NA] * len(df), dtype="Int64")
+    return df.reset_index(drop=True)[LOG_COLUMNS]
+
+
+def write_log(df: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    for i in range(0, max(len(df), 1), WRITE_CHUNK):
+        df.iloc[i:i + WRITE_CHUNK].to_csv(
+            tmp_path, mode="w" if i == 0 else "a", header=(i == 0), index=False, lineterminator="\n",
+        )
+    os.replace(tmp_path, path)
+
+
+def describe(df: pd.DataFrame) -> str:
+    ts = df["timestamp"]
+    user_last = df.groupby("user_id")["action"].last()
+    joins = df[df["action"] == "join"]
+    leaves = df[df["action"] == "leave"]
+    # 移動: 同じユーザーの leave と join が同時刻に並んでいるもの
+    moved = leaves.merge(joins, on=["user_id", "timestamp"]).shape[0]
+    # 日付をまたぐ滞在: 直前のイベントが join で、日付が違う leave
+    prev = df.groupby("user_id").shift(1)
+    overnight = ((df["action"] == "leave") & (prev["action"] == "join")
+                 & (prev["timestamp"].dt.date != ts.dt.date)).sum()
+    return (
+        f"{len(df):,} 行 / ユーザー {df['user_id'].nunique():,} 人 / チャンネル {df['channel_id'].nunique()} 個 / "
+        f"{ts.iloc[0]:%Y-%m-%d} 〜 {ts.iloc[-1]:%Y-%m-%d}\n"
+        f"  移動 {moved:,} 回 / 日付をまたぐ滞在 {overnight:,} 回 / 最後に入室中 {(user_last == 'join').sum():,} 人"
+    )
+
+
+def ensure_dataset(size: str, seed: int = 0, end: date = None, verbose: bool = True) -> str:
+    """
+    SIZES の1つを benchmarks/data/ に作り（既にあればそのまま）、パスを返す。
+    """
+    end = end or date.today()
+    path = dataset_path(size, seed, end)
+    if not os.path.exists(path):
+        events = SIZES[size]
+        t0 = time.perf_counter()
+        df = make_events(events, default_users(events), 40, seed, end)
+        write_log(df, path)
+        if verbose:
+            print(f"生成: {path} ({time.perf_counter() - t0:.1f} 秒)")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=SIZES, default="10k")
+    parser.add_argument("--events", type=int, help="行数（--size の代わりに指定）")
+    parser.add_argument("--users", type=int, help="ユーザー数（省略時は行数から決める）")
+    parser.add_argument("--channels", type=int, default=40)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(), help="最終日（YYYY-MM-DD）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="出力先（省略時は benchmarks/data/ の下）")
+    args = parser.parse_args()
+
+    events = args.events or SIZES[args.size]
+    label = args.size if args.events is None else str(args.events)
+    path = args.out or dataset_path(label, args.seed, args.end)
+
+    t0 = time.perf_counter()
+    df = make_events(events, args.users or default_users(events), args.channels, args.seed, args.end, args.days)
+    write_log(df, path)
+    print(f"{path}: {time.perf_counter() - t0:.1f} 秒")
+    print(describe(df))
+
+
+if __name__ == "__main__":
+    main()
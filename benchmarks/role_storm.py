@@ -0,0 +1,212 @@
+"""
+RoleManager のロール更新を、Discord に接続しない偽のクライアントで比べる。
+
+入室・退出・移動・ミュート切り替えを混ぜた合成イベントを流し、
+  - 置き換え前の実装（イベントごとにロールを線形探索し、毎回 add_roles / remove_roles）
+  - RoleManager（ロールのキャッシュ＋状態の確認＋ギルドごとのキュー）
+それぞれの API 呼び出し回数とロール探索回数を数え、最後に全員のロールが
+ボイスチャンネルにいるかどうかと一致していることを確認する（RoleManager は --seeds 個のシードで確認し、
+一致しないものがあれば終了コード 1）。偽のメンバーは、実際の discord.py と同じく API 呼び出しの結果を
+少し遅れて（ゲートウェイのメンバー更新が届いてから）キャッシュのロールに反映する。
+
+実行例:
+    python benchmarks/role_storm.py --members 300 --events 20000
+    python benchmarks/role_storm.py --members 50 --events 3000 --seeds 10 --burst 1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.role_manager import RoleManager, RoleUpdateQueue  # noqa: E402
+from core.config import STUDY_ROLE_NAME  # noqa: E402
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, role_count: int):
+        self.id = guild_id
+        self._roles = [SimpleNamespace(id=i, name=f"role-{i}") for i in range(1, role_count)]
+        self._roles.append(SimpleNamespace(id=role_count, name=STUDY_ROLE_NAME))
+        self.lookups = 0
+
+    @property
+    def roles(self):
+        self.lookups += 1
+        return self._roles
+
+
+class FakeMember:
+    """
+    add_roles / remove_roles は API 呼び出しとして数え、latency 秒で返る。
+    ロールはさらに gateway_delay 秒後に反映する（ゲートウェイからのメンバー更新の代わり）。
+    """
+
+    def __init__(self, member_id: int, guild: FakeGuild, stats: dict, latency: float, gateway_delay: float = 0.0):
+        self.id = member_id
+        self.guild = guild
+        self.role_ids = set()
+        self.stats = stats
+        self.latency = latency
+        self.gateway_delay = gateway_delay
+        self._updates = deque()
+
+    def get_role(self, role_id):
+        return role_id if role_id in self.role_ids else None
+
+    async def _call(self, apply):
+        self.stats["calls"] += 1
+        await asyncio.sleep(self.latency)
+        if self.gateway_delay <= 0:
+            apply()
+            return
+
+        # 同じ時刻のタイマーは順番が決まらないので、届いた順に反映するよう先入れ先出しで持つ
+        self._updates.append(apply)
+        self.stats["updates"] += 1
+        asyncio.get_running_loop().call_later(self.gateway_delay, self._deliver)
+
+    def _deliver(self):
+        self._updates.popleft()()
+        self.stats["updates"] -= 1
+
+    async def add_roles(self, role):
+        await self._call(lambda: self.role_ids.add(role.id))
+
+    async def remove_roles(self, role):
+        await self._call(lambda: self.role_ids.discard(role.id))
+
+
+def make_storm(members: int, events: int, channels: int, seed: int) -> list:
+    """
+    (member_index, before_channel, after_channel) のリスト。None はボイスチャンネル外。
+    """
+    rng = random.Random(seed)
+    where = [None] * members
+    storm = []
+    for _ in range(events):
+        i = rng.randrange(members)
+        before = where[i]
+        r = rng.random()
+        if before is None:
+            after = rng.randrange(channels)
+        elif r < 0.3:
+            after = None                      # 退出
+        elif r < 0.5:
+            after = rng.randrange(channels)   # 移動
+        else:
+            after = before                    # ミュート・カメラなどの切り替え
+        where[i] = after
+        storm.append((i, before, after))
+    return storm
+
+
+async def settle(stats: dict):
+    # ゲートウェイのメンバー更新がすべて届くまで待つ
+    while stats["updates"]:
+        await asyncio.sleep(0.001)
+
+
+async def run_legacy(storm, guild, members, stats):
+    for i, before, after in storm:
+        member = members[i]
+        role = discord.utils.get(member.guild.roles, name=STUDY_ROLE_NAME)
+        if after is not None:
+            await member.add_roles(role)
+        elif before is not None:
+            await member.remove_roles(role)
+    await settle(stats)
+
+
+async def run_role_manager(storm, guild, members, stats, rate: int, per: float, burst: int):
+    cog = RoleManager(bot=None)
+    cog.queue = RoleUpdateQueue(rate, per)
+    channel = lambda c: None if c is None else SimpleNamespace(id=c)  # noqa: E731
+    for n, (i, before, after) in enumerate(storm):
+        await cog.on_voice_state_update(
+            members[i], SimpleNamespace(channel=channel(before)), SimpleNamespace(channel=channel(after))
+        )
+        if n % burst == burst - 1:
+            # イベントは一度に届くわけではないので、ときどきワーカーに処理させる
+            await asyncio.sleep(0)
+    while any(not task.done() for task in cog.queue._tasks.values()):
+        await asyncio.sleep(0.001)
+    await settle(stats)
+    return cog.queue
+
+
+def check(storm, members, role_id) -> bool:
+    final = {}
+    for i, _, after in storm:
+        final[i] = after is not None
+    return all((role_id in members[i].role_ids) == inside for i, inside in final.items())
+
+
+def simulate(name: str, storm: list, members: int, roles: int = 250, latency: float = 0.0005,
+             gateway_delay: float = 0.002, rate: int = 50, per: float = 0.05, burst: int = 50) -> dict:
+    """
+    storm を legacy / role_manager の実装で流し、API 呼び出し回数・ロール探索回数・時間・最終状態が正しいかを返す。
+    """
+    guild = FakeGuild(1, roles)
+    stats = {"calls": 0, "updates": 0}
+    fake_members = [FakeMember(i, guild, stats, latency, gateway_delay) for i in range(members)]
+    t0 = time.perf_counter()
+    queue = None
+    if name == "legacy":
+        asyncio.run(run_legacy(storm, guild, fake_members, stats))
+    else:
+        queue = asyncio.run(run_role_manager(storm, guild, fake_members, stats, rate, per, burst))
+    return {
+        "calls": stats["calls"],
+        "lookups": guild.lookups,
+        "seconds": time.perf_counter() - t0,
+        "ok": check(storm, fake_members, roles),
+        "queue": queue,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=300)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--roles", type=int, default=250, help="ギルドのロール数（線形探索の長さ）")
+    parser.add_argument("--latency", type=float, default=0.0005, help="API 呼び出し1回の擬似的な所要時間（秒）")
+    parser.add_argument("--rate", type=int, default=50, help="RoleManager のキューの上限回数")
+    parser.add_argument("--per", type=float, default=0.05, help="RoleManager のキューの上限の単位時間（秒）")
+    parser.add_argument("--burst", type=int, default=50, help="この件数のイベントごとにワーカーへ処理を渡す")
+    parser.add_argument("--gateway-delay", type=float, default=0.002,
+                        help="API 呼び出しの結果がメンバーのキャッシュに反映されるまでの時間（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seeds", type=int, default=3, help="RoleManager の最終状態を確認するシードの数（seed から順に）")
+    args = parser.parse_args()
+
+    options = dict(roles=args.roles, latency=args.latency, gateway_delay=args.gateway_delay,
+                   rate=args.rate, per=args.per, burst=args.burst)
+    failed = 0
+    for seed in range(args.seed, args.seed + args.seeds):
+        storm = make_storm(args.members, args.events, args.channels, seed)
+        print(f"seed {seed}: イベント {len(storm)} 件 / メンバー {args.members} 人 / ロール {args.roles} 個")
+        # 従来の実装は比較用に最初のシードだけ
+        for name in ("legacy", "role_manager") if seed == args.seed else ("role_manager",):
+            result = simulate(name, storm, args.members, **options)
+            queue = result["queue"]
+            extra = f"  (スキップ {queue.skipped} / まとめた指示 {queue.merged})" if queue is not None else ""
+            print(
+                f"{name:>12}: API 呼び出し {result['calls']:>6} 回 / ロール探索 {result['lookups']:>6} 回 / "
+                f"{result['seconds']:.2f} 秒 / 最終状態 {'OK' if result['ok'] else 'NG'}{extra}"
+            )
+            failed += not result["ok"]
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
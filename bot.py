@@ -1,3 +1,5 @@
+from core.startup import STARTUP, sync_commands
+
 import discord
 from discord.ext import commands
 import traceback
@@ -7,24 +9,55 @@ import os
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
 PREFIX = os.getenv("PREFIX")
+# シャード数（省略時は Discord の推奨値）
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+
+EXTENSIONS = [
+    'cogs.vc_tracker',
+    'cogs.role_manager',
+    'cogs.stats',
+    'cogs.guild_settings',
+    'cogs.metrics',
+]
 
 intents = discord.Intents.default()
 intents.voice_states = True
 intents.members = True
 
-bot = commands.Bot(command_prefix=PREFIX, intents=intents)
+# 複数のサーバーで動かせるよう、シャードを自動で分ける Bot を使う
+# ステータスは接続（再接続）のたびに Discord へ送られるので、on_ready で設定し直さない
+bot = commands.AutoShardedBot(command_prefix=PREFIX, intents=intents, shard_count=SHARD_COUNT,
+                              activity=discord.Game(name="勉強時間をトラッキング中！"))
+STARTUP.mark("import")
+# 最初の on_ready か（2回目以降は再接続）
+first_ready = True
 
 @bot.event
-async def on_ready():
-    print(f'{bot.user} has connected')
-    await bot.tree.sync()  # スラッシュコマンドを同期
-    print(f'{bot.user}としてログインしました。')
-    await bot.change_presence(activity=discord.Game(name="勉強時間をトラッキング中！"))
-
+async def setup_hook():
+    # ログイン後、ゲートウェイに接続する前に1回だけ呼ばれる（on_ready は再接続のたびに呼ばれる）
+    STARTUP.mark("login")
     # 拡張機能の読み込み
-    await bot.load_extension('cogs.vc_tracker')
-    await bot.load_extension('cogs.role_manager')
-    await bot.load_extension('cogs.stats')
+    for extension in EXTENSIONS:
+        await bot.load_extension(extension)
+        STARTUP.mark(f"load {extension}")
+    # スラッシュコマンドを同期（定義が変わっていなければ省略）
+    try:
+        synced = await sync_commands(bot.tree, bot.application_id)
+        STARTUP.mark("command sync" if synced else "command sync (skipped)")
+    except discord.HTTPException as e:
+        # 同期できなくても、前回登録したコマンドはそのまま使える
+        print(f"スラッシュコマンドを同期できませんでした: {e}")
+
+@bot.event
+async def on_ready():
+    global first_ready
+    if first_ready:
+        first_ready = False
+        STARTUP.mark("ready")
+        print(f'{bot.user}としてログインしました。')
+        print(STARTUP.report())
+    else:
+        print(f'{bot.user} が再接続しました。')
 
 # コマンド実行中にエラーが発生した場合のイベント
 @bot.event
@@ -72,4 +105,6 @@ async def on_command_error(ctx, error):
     # ユーザーにコマンドエラーを通知
     await ctx.send("コマンド実行中にエラーが発生しました。")
 
-bot.run(TOKEN)
+# グラフ描画のワーカー（spawn）はこのファイルを __mp_main__ として読み込み直すので、そこでは Bot を起動しない
+if __name__ == "__main__":
+    bot.run(TOKEN)
@@ -0,0 +1,39 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+from core.guild_settings import get_guild_settings
+
+class GuildSettingsCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.settings = get_guild_settings()
+
+    @app_commands.command(name="settings", description="このサーバーのログ用チャンネルと勉強中ロールの名前を設定します。")
+    @app_commands.describe(log_channel="入退室の通知を送るテキストチャンネル", role_name="VC参加中に付けるロールの名前")
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.guild_only()
+    async def settings_command(self, interaction: discord.Interaction,
+                               log_channel: discord.TextChannel = None, role_name: str = None):
+        """
+        引数を省略した項目は変更しない。何も指定しなければ現在の設定を表示する。
+        """
+        values = {}
+        if log_channel is not None:
+            values["log_channel_id"] = log_channel.id
+        if role_name is not None:
+            values["role_name"] = role_name
+        if values:
+            self.settings.update(interaction.guild_id, **values)
+
+        current = self.settings.get(interaction.guild_id)
+        channel = interaction.guild.get_channel(current["log_channel_id"])
+        await interaction.response.send_message(
+            f"⚙️ **このサーバーの設定**\n"
+            f"- ログ用チャンネル: {channel.mention if channel else '未設定'}\n"
+            f"- 勉強中ロール: {current['role_name']}",
+            ephemeral=True,
+        )
+
+async def setup(bot):
+    await bot.add_cog(GuildSettingsCog(bot))
@@ -0,0 +1,81 @@
+import asyncio
+import math
+
+from discord.ext import commands, tasks
+
+from core import config
+from core.metrics import REGISTRY, serve, write_file
+
+class MetricsExporter(commands.Cog):
+    """
+    Bot のメトリクス（core/metrics.py）を METRICS_PORT の HTTP ポート、または METRICS_FILE に出力する。
+    ほかの Cog が持っている件数（入室中の人数・書き込み待ち・ロール更新・グラフキャッシュ）は出力のたびに取りにいく。
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.server = None
+        REGISTRY.gauge("vc_bot_guilds", "参加しているギルド数", collect=lambda: {(): len(self.bot.guilds)})
+        REGISTRY.gauge("vc_bot_latency_seconds", "Discord ゲートウェイのレイテンシ（秒）", collect=self.latency)
+        REGISTRY.gauge("vc_presence_users", "入室中として追跡しているユーザー数", collect=self.presence_users)
+        REGISTRY.gauge("vc_event_queue_depth", "保存先への書き込みを待っているイベント・セッションの件数",
+                       collect=self.event_queue_depth)
+        REGISTRY.counter("vc_role_updates_total", "「勉強中」ロールの更新指示（result は called / skipped / merged）",
+                         ["result"], collect=self.role_updates)
+        REGISTRY.gauge("vc_chart_cache_bytes", "描画済みグラフのキャッシュの合計サイズ（バイト）",
+                       collect=lambda: self.chart_cache_stat("bytes"))
+        REGISTRY.gauge("vc_chart_cache_entries", "描画済みグラフのキャッシュの件数",
+                       collect=lambda: self.chart_cache_stat("entries"))
+        self.write_metrics.change_interval(seconds=config.METRICS_INTERVAL)
+
+    async def cog_load(self):
+        if config.METRICS_PORT:
+            self.server = await serve(REGISTRY, config.METRICS_HOST, config.METRICS_PORT)
+            print(f"メトリクス: http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+        if config.METRICS_FILE:
+            self.write_metrics.start()
+
+    async def cog_unload(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.write_metrics.is_running():
+            self.write_metrics.cancel()
+            await asyncio.to_thread(write_file, REGISTRY, config.METRICS_FILE)
+
+    @tasks.loop(seconds=15)
+    async def write_metrics(self):
+        try:
+            await asyncio.to_thread(write_file, REGISTRY, config.METRICS_FILE)
+        except OSError as e:
+            print(f"メトリクスを書き出せませんでした: {e}")
+
+    # ── ほかの Cog から取る値 ────────────────────────────
+    def latency(self) -> dict:
+        # 接続前は nan / inf になる
+        latency = self.bot.latency
+        return {(): latency} if math.isfinite(latency) else {}
+
+    def presence_users(self) -> dict:
+        vc_logger = self.bot.get_cog("VCLogger")
+        if vc_logger is None:
+            return {}
+        return {(): sum(len(tracker.presence) for tracker in list(vc_logger.trackers.values()))}
+
+    def event_queue_depth(self) -> dict:
+        vc_logger = self.bot.get_cog("VCLogger")
+        return {} if vc_logger is None else {(): vc_logger.writer.pending}
+
+    def role_updates(self) -> dict:
+        role_manager = self.bot.get_cog("RoleManager")
+        if role_manager is None:
+            return {}
+        queue = role_manager.queue
+        return {("called",): queue.calls, ("skipped",): queue.skipped, ("merged",): queue.merged}
+
+    def chart_cache_stat(self, key: str) -> dict:
+        stats_cog = self.bot.get_cog("StudyTimeTracker")
+        return {} if stats_cog is None else {(): stats_cog.chart_cache.stats()[key]}
+
+async def setup(bot):
+    await bot.add_cog(MetricsExporter(bot))
@@ -1,17 +1,211 @@
 import discord
 from discord.ext import commands
+import asyncio
+import time
+from collections import deque
+
+from core import config
+from core.guild_settings import get_guild_settings
+from core.metrics import HANDLER_SECONDS, timed
+
+class RoleUpdateQueue:
+    """
+    ロールの付け外しをギルドごとのキューに積み、ワーカータスクが順に API を呼ぶ。
+
+    - キューはメンバーごとに「最終的に付いていてほしいか」だけを持つので、
+      入退室を繰り返しても、まだ実行していない付け外しは最後の1回にまとまる
+    - 実行直前にメンバーの現在の状態と比べ、既にその状態なら API を呼ばない。
+      一度付け外しを送ったメンバーは、メンバーのキャッシュのロールではなく最後に送った（送信中の）状態と比べる
+      （add_roles の結果はゲートウェイのメンバー更新が届くまでキャッシュに入らないため）。
+      キャッシュが送った状態に追いついたら（confirm()）記録を捨て、以後はキャッシュと比べる
+      （モデレーターが手で付け外ししても、次の入退室で直せるように）
+    - ギルドごとに per 秒あたり rate 回までに抑える（ロール変更のレート制限はギルド単位）
+    """
+
+    def __init__(self, rate: int = 10, per: float = 10.0):
+        self.rate = rate
+        self.per = per
+        self._pending = {}  # guild_id -> {member_id: (member, role, want)}
+        self._sent = {}     # guild_id -> 直近 rate 回の呼び出し時刻
+        self._last_sent = {}  # guild_id -> {(member_id, role_id): 最後に送った（送信中の）状態}
+        self._tasks = {}
+        # 監視用のカウンター
+        self.calls = 0
+        self.skipped = 0
+        self.merged = 0
+
+    @staticmethod
+    def has_role(member, role) -> bool:
+        return member.get_role(role.id) is not None
+
+    def current(self, member, role) -> bool:
+        """
+        member に role が付いている（付く予定の）状態か。最後に送った付け外しがあればその状態、なければキャッシュのロール。
+        """
+        sent = self._last_sent.get(member.guild.id, {}).get((member.id, role.id))
+        return self.has_role(member, role) if sent is None else sent
+
+    def confirm(self, member, role):
+        """
+        member のキャッシュのロールが最後に送った状態と同じになっていれば、その記録を捨てる
+        （ゲートウェイのメンバー更新が届いたとき・API 呼び出しが成功したときに呼ぶ）。
+        """
+        last_sent = self._last_sent.get(member.guild.id)
+        key = (member.id, role.id)
+        if last_sent and key in last_sent and last_sent[key] == self.has_role(member, role):
+            del last_sent[key]
+
+    def forget(self, guild_id: int, member_id: int = None):
+        """
+        ギルド（member_id を渡すとそのメンバー）のまだ送っていない指示と記録を捨てる。
+        Bot がギルドから外れた・メンバーがギルドを抜けたとき（メンバー更新はもう届かない）に呼ぶ。
+        """
+        if member_id is None:
+            task = self._tasks.pop(guild_id, None)
+            if task is not None:
+                task.cancel()
+            for table in (self._pending, self._sent, self._last_sent):
+                table.pop(guild_id, None)
+            return
+        self._pending.get(guild_id, {}).pop(member_id, None)
+        last_sent = self._last_sent.get(guild_id)
+        if last_sent:
+            for key in [key for key in last_sent if key[0] == member_id]:
+                del last_sent[key]
+
+    def submit(self, member, role, want: bool):
+        """
+        member に role が付いている（want=True）/ いない（want=False）状態にする。ブロックしない。
+        """
+        guild_id = member.guild.id
+        pending = self._pending.setdefault(guild_id, {})
+        if member.id in pending:
+            self.merged += 1
+        elif self.current(member, role) == want:
+            self.skipped += 1
+            return
+        pending[member.id] = (member, role, want)
+
+        task = self._tasks.get(guild_id)
+        if task is None or task.done():
+            self._tasks[guild_id] = asyncio.get_running_loop().create_task(self._run(guild_id))
+
+    async def _run(self, guild_id: int):
+        pending = self._pending[guild_id]
+        last_sent = self._last_sent.setdefault(guild_id, {})
+        while pending:
+            member_id = next(iter(pending))
+            entry = member, role, want = pending[member_id]
+            if self.current(member, role) == want:
+                del pending[member_id]
+                self.skipped += 1
+                continue
+
+            # 送るまでは pending に残しておき、待っている間に届いた指示はそこで上書きさせる
+            await self._acquire(guild_id)
+            if pending.get(member_id) is not entry:
+                # 待っている間に新しい指示が来た。そちらを処理し直す
+                continue
+            del pending[member_id]
+
+            # 送信中に届いた指示は、キャッシュではなくこの状態と比べる
+            key = (member_id, role.id)
+            previous = last_sent.get(key)
+            last_sent[key] = want
+            try:
+                if want:
+                    await member.add_roles(role)
+                else:
+                    await member.remove_roles(role)
+                self.calls += 1
+                # メンバー更新が先に届いていれば、もうキャッシュと比べてよい
+                self.confirm(member, role)
+            except discord.RateLimited as e:
+                # discord.py が待ちきれなかった制限。少し待ってからやり直す
+                self._restore(last_sent, key, previous)
+                pending.setdefault(member_id, entry)
+                await asyncio.sleep(e.retry_after)
+            except discord.HTTPException as e:
+                self._restore(last_sent, key, previous)
+                print(f"ロール更新エラー: {e}")
+
+    @staticmethod
+    def _restore(last_sent: dict, key, previous):
+        # 失敗した呼び出しは反映されていないので、その前に送った状態に戻す
+        if previous is None:
+            last_sent.pop(key, None)
+        else:
+            last_sent[key] = previous
+
+    async def _acquire(self, guild_id: int):
+        """
+        直近 per 秒の呼び出しが rate 回に達していれば、枠が空くまで待つ。
+        """
+        sent = self._sent.setdefault(guild_id, deque(maxlen=self.rate))
+        if len(sent) == self.rate:
+            wait = self.per - (time.monotonic() - sent[0])
+            if wait > 0:
+                await asyncio.sleep(wait)
+        sent.append(time.monotonic())
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
 
 class RoleManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # ギルドごとの「勉強中」ロール（名前は設定から）。ロールの作成・変更・削除と設定の変更で取り直す
+        self.settings = get_guild_settings()
+        self.roles = {}
+        self.queue = RoleUpdateQueue(config.ROLE_UPDATE_RATE, config.ROLE_UPDATE_PER)
+
+    async def cog_unload(self):
+        self.queue.cancel()
+
+    def study_role(self, guild):
+        name = self.settings.get(guild.id)["role_name"]
+        cached = self.roles.get(guild.id)
+        if cached is None or cached[0] != name:
+            cached = self.roles[guild.id] = (name, discord.utils.get(guild.roles, name=name))
+        return cached[1]
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.roles.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        self.roles.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.roles.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        role = self.study_role(after.guild)
+        if role is not None:
+            self.queue.confirm(after, role)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.queue.forget(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.queue.forget(guild.id)
+        self.roles.pop(guild.id, None)
 
     @commands.Cog.listener()
+    @timed(HANDLER_SECONDS, cog="RoleManager", event="on_voice_state_update")
     async def on_voice_state_update(self, member, before, after):
-        role = discord.utils.get(member.guild.roles, name="勉強中")
-        if after.channel:
-            await member.add_roles(role)
-        elif before.channel and not after.channel:
-            await member.remove_roles(role)
+        role = self.study_role(member.guild)
+        if role is None:
+            return
+        # ミュート切り替えや移動でも呼ばれるが、既に付いていればキューが API を呼ばない
+        self.queue.submit(member, role, after.channel is not None)
 
 async def setup(bot):
-    await bot.add_cog(RoleManager(bot))
\ No newline at end of file
+    await bot.add_cog(RoleManager(bot))
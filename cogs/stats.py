@@ -2,366 +2,373 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import japanize_matplotlib
+import asyncio
+import io
 from datetime import datetime, timedelta
-
-sns.set(style="whitegrid")
-japanize_matplotlib.japanize()
+from core import config
+from core.chart_cache import ChartCache
+from core.leaderboard import WINDOW_LABELS, WINDOWS, get_leaderboard, open_hours, window_start
+from core.metrics import COMMAND_SECONDS
+from core.presence import open_session_usage
+from core.render_pool import RenderPool, RenderPoolBusy
+from core.rollups import get_rollups
+from core.startup import STARTUP
+from core.storage import get_storage
+
+BUSY_MESSAGE = "グラフの作成が混み合っています。少し待ってからもう一度お試しください。"
 
 class StudyTimeTracker(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # 保存先（CSV / SQLite）と日別の集計テーブルはギルドごとに分かれている（get_storage / get_rollups）
+        # グラフはイベントループを止めないよう別プロセスで描画する
+        self.render_pool = RenderPool(config.RENDER_WORKERS, config.RENDER_MAX_PENDING)
+        # 同じグラフの連続リクエストは、データが変わっていなければ描画済みの画像を返す
+        self.chart_cache = ChartCache(config.CHART_CACHE_MAX_BYTES)
+        self.warm_task = None
+
+    async def cog_unload(self):
+        if self.warm_task is not None:
+            self.warm_task.cancel()
+        self.render_pool.shutdown()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # 描画ワーカーの起動（matplotlib などの読み込み）は、接続が終わってからバックグラウンドで行う
+        if self.warm_task is None:
+            self.warm_task = asyncio.create_task(self.warm_render_pool())
+
+    async def warm_render_pool(self):
+        try:
+            await self.render_pool.warm()
+        except Exception as e:
+            # 起動に失敗しても、描画のときにもう一度ワーカーを作る
+            print(f"グラフ描画のワーカーを起動できませんでした: {e!r}")
+            return
+        print(f"グラフ描画の準備ができました（起動から {STARTUP.mark('render pool warm'):.2f} 秒）")
 
-    def load_data(self):
+    def chart_key(self, guild_id, name: str, params: tuple, start_day=None, end_day=None):
         """
-        CSVからログを読み込み、timestampをdatetime型にパースして返す。
-        CSV例: user_id, channel_id, action, timestamp
+        グラフのキャッシュキー。ギルドの期間 [start_day, end_day) の集計が変わるとキーも変わる。
         """
-        df = pd.read_csv("./data/vc_logs.csv", parse_dates=["timestamp"])
-        df.sort_values("timestamp", inplace=True)
-        return df
+        return (guild_id, name, params, self.load_rollups(guild_id).version(start_day, end_day))
 
-    def calculate_study_sessions(self, df):
+    @staticmethod
+    def stage(interaction: discord.Interaction, stage: str):
         """
-        join から leaveまでのVC滞在時間を集計し、
-        user_id, channel_id, start_time, end_time, duration(hours) をDataFrameで返す
+        コマンドの段階（load / compute / render）の時間を記録する with 用のコンテキスト。
         """
-        sessions = []
-        user_sessions = {}  # user_idをキーにして開始時間・チャンネルを記憶
-
-        for _, row in df.iterrows():
-            user_id = row["user_id"]
-            channel_id = row["channel_id"]
-            if row["action"] == "join":
-                # join時に記録
-                user_sessions[user_id] = {
-                    "channel_id": channel_id,
-                    "start": row["timestamp"]
-                }
-            elif row["action"] == "leave" and user_id in user_sessions:
-                # leave時に滞在時間を計算
-                start_data = user_sessions.pop(user_id)
-                if start_data["channel_id"] == channel_id:
-                    duration = (row["timestamp"] - start_data["start"]).total_seconds() / 3600
-                    sessions.append({
-                        "user_id": user_id,
-                        "channel_id": channel_id,
-                        "start_time": start_data["start"],
-                        "end_time": row["timestamp"],
-                        "duration": duration
-                    })
-
-        df_sessions = pd.DataFrame(sessions)
-        return df_sessions
+        command = interaction.command.name if interaction.command else "unknown"
+        return COMMAND_SECONDS.time(command=command, stage=stage)
 
-    # ─────────────────────────────────────────────────────
-    # (1) 今日のチャンネル使用時間: 棒グラフ
-    # ─────────────────────────────────────────────────────
-    def get_today_channel_usage(self, df_sessions):
+    async def send_cached_chart(self, interaction: discord.Interaction, key, filename: str) -> bool:
         """
-        今日の各チャンネル使用累計時間を取得して返す (単位: 時間)
+        キャッシュに描画済みの画像があれば返して True、なければ False。
         """
-        today = datetime.date.today()
-        # 今日の0:00～23:59の範囲
-        start_of_day = datetime(today.year, today.month, today.day)
-        end_of_day = start_of_day + timedelta(days=1)
-
-        df_today = df_sessions[
-            (df_sessions["start_time"] >= start_of_day) &
-            (df_sessions["start_time"] < end_of_day)
-        ]
-        if df_today.empty:
-            return pd.DataFrame()
-
-        # チャンネルごとに合計
-        usage_by_channel = df_today.groupby("channel_id")["duration"].sum().reset_index()
-        return usage_by_channel
+        png = self.chart_cache.get(key)
+        if png is None:
+            return False
+        await interaction.followup.send(file=discord.File(io.BytesIO(png), filename=filename))
+        return True
 
-    def plot_today_channel_usage(self, usage_df):
+    async def send_chart(self, interaction: discord.Interaction, key, chart: str, *args, filename: str):
         """
-        今日のチャンネル使用時間を棒グラフで可視化し、画像ファイルを保存してパスを返す
-        - カラーマップで使用時間が多いほど濃い色
-        - 閾値ラインの例として、全チャンネル平均を追加
+        描画プールで core/charts.py の chart(*args) の PNG を作ってキャッシュし、defer 済みの interaction にファイルとして返す。
         """
-        # 空チェック
-        if usage_df.empty:
-            return None
-
-        usage_df.sort_values("duration", inplace=True, ascending=True)
+        try:
+            with self.stage(interaction, "render"):
+                png = await self.render_pool.render(chart, *args)
+        except RenderPoolBusy:
+            await interaction.followup.send(BUSY_MESSAGE)
+            return
+        self.chart_cache.put(key, png)
+        await interaction.followup.send(file=discord.File(io.BytesIO(png), filename=filename))
 
-        # カラーマップを使用時間に応じてスケールさせる
-        norm = plt.Normalize(usage_df["duration"].min(), usage_df["duration"].max())
-        cmap = sns.light_palette("blue", as_cmap=True)
+    async def defer_chart(self, interaction: discord.Interaction) -> bool:
+        """
+        描画待ちが上限なら断り、そうでなければ応答を保留（考え中…表示）にする。
+        """
+        if self.render_pool.busy:
+            await interaction.response.send_message(BUSY_MESSAGE, ephemeral=True)
+            return False
+        await interaction.response.defer(thinking=True)
+        return True
 
-        plt.figure(figsize=(8, 6))
-        bar_container = plt.barh(
-            usage_df["channel_id"],
-            usage_df["duration"],
-            color=[cmap(norm(val)) for val in usage_df["duration"]]
-        )
+    def load_rollups(self, guild_id):
+        """
+        ギルドの保存先で新しく確定したセッションを集計テーブルへ取り込んでから返す。
+        """
+        rollups = get_rollups(guild_id)
+        rollups.sync(get_storage(guild_id))
+        return rollups
 
-        # 使用時間の平均にラインを引く (閾値ライン例)
-        avg_usage = usage_df["duration"].mean()
-        plt.axvline(avg_usage, color="red", linestyle="--", label=f"平均: {avg_usage:.2f}h")
+    def load_sessions(self, guild_id, start=None, end=None, user_id=None):
+        """
+        保存先から確定済みのセッションを読み込み、
+        user_id, channel_id, start_time, end_time, duration(hours) をDataFrameで返す
+        """
+        df_sessions = get_storage(guild_id).sessions(start, end, user_id)
+        return df_sessions.drop(columns="channel_name").rename(columns={"duration_hour": "duration"})
 
-        plt.title("今日のチャンネル使用時間 (時間)")
-        plt.xlabel("使用時間 (時間)")
-        plt.legend()
+    def load_user_sessions(self, guild_id, user_id):
+        """
+        集計テーブルのユーザー別の索引から、そのユーザーのセッションだけを load_sessions と同じ形で返す
+        """
+        df_sessions = self.load_rollups(guild_id).user_sessions(user_id)
+        return df_sessions.drop(columns="channel_name").rename(columns={"duration_hour": "duration"})
 
-        # 棒に対して値を表示
-        for rect, val in zip(bar_container, usage_df["duration"]):
-            plt.text(val+0.01, rect.get_y() + rect.get_height()/2,
-                    f"{val:.2f}h",
-                    va="center", fontsize=8)
+    # ─────────────────────────────────────────────────────
+    # (1) 今日のチャンネル使用時間: 棒グラフ
+    # ─────────────────────────────────────────────────────
+    def get_today_channel_usage(self, guild_id):
+        """
+        今日の各チャンネル使用累計時間を取得して返す (単位: 時間)
+        """
+        today = datetime.now().date()
+        usage = self.load_rollups(guild_id).channel_usage(today, today + timedelta(days=1))
+        if usage.empty:
+            return pd.DataFrame()
 
-        plt.tight_layout()
-        img_path = "today_channel_usage.png"
-        plt.savefig(img_path, dpi=100)
-        plt.close()
-        return img_path
+        # チャンネルごとに合計
+        usage_by_channel = usage.groupby("channel_id")["duration_hour"].sum().reset_index()
+        return usage_by_channel.rename(columns={"duration_hour": "duration"})
 
     @app_commands.command(name="todays_usage", description="今日のチャンネル使用時間の可視化を表示します。")
     async def todays_usage(self, interaction: discord.Interaction):
         """
         今日一日のチャンネル別使用時間を棒グラフで表示する
         """
-        df_logs = self.load_data()
-        df_sessions = self.calculate_study_sessions(df_logs)
-        usage_df = self.get_today_channel_usage(df_sessions)
+        if not await self.defer_chart(interaction):
+            return
+        today = datetime.now().date()
+        with self.stage(interaction, "load"):
+            key = await asyncio.to_thread(self.chart_key, interaction.guild_id, "todays_usage", (today,), today, today + timedelta(days=1))
+        if await self.send_cached_chart(interaction, key, filename="today_channel_usage.png"):
+            return
+
+        with self.stage(interaction, "compute"):
+            usage_df = await asyncio.to_thread(self.get_today_channel_usage, interaction.guild_id)
         if usage_df.empty:
-            await interaction.response.send_message("本日はまだチャンネル使用の記録がありません。")
+            await interaction.followup.send("本日はまだチャンネル使用の記録がありません。")
             return
 
-        img_path = self.plot_today_channel_usage(usage_df)
-        await interaction.response.send_message(file=discord.File(img_path))
+        await self.send_chart(interaction, key, "plot_today_channel_usage", usage_df, filename="today_channel_usage.png")
 
     # ─────────────────────────────────────────────────────
     # (2) 直近1週間の音声チャンネル使用時間: 積み上げ棒グラフ
     # ─────────────────────────────────────────────────────
-    def get_weekly_channel_usage(self, df_sessions):
+    def get_weekly_channel_usage(self, guild_id):
         """
-        直近7日間の日付ごとのチャンネル使用時間を集計
+        直近7日間（今日を含む）の日付ごとのチャンネル使用時間を集計
         戻り値: pivot_table（日付をindex, channel_idをcolumn, 使用時間合計を値）
         """
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-
-        df_week = df_sessions[
-            (df_sessions["start_time"] >= start_date) &
-            (df_sessions["start_time"] < end_date)
-        ].copy()
+        start_date = datetime.now().date() - timedelta(days=6)
+        end_date = start_date + timedelta(days=7)
 
+        df_week = self.load_rollups(guild_id).daily_channel_usage(start_date, end_date)
         if df_week.empty:
             return pd.DataFrame()
 
         # 日付ごと・チャンネルごとに集計
-        df_week["day"] = df_week["start_time"].dt.date
-        pivot_df = df_week.groupby(["day", "channel_id"])["duration"].sum().reset_index()
-        pivot_df = pivot_df.pivot(index="day", columns="channel_id", values="duration").fillna(0)
+        pivot_df = df_week.groupby(["date", "channel_id"])["duration_hour"].sum().reset_index()
+        pivot_df = pivot_df.pivot(index="date", columns="channel_id", values="duration_hour").fillna(0)
 
         # 日付が抜けているところを補完（0埋め）
-        all_days = [start_date.date() + timedelta(days=i) for i in range(7)]
+        all_days = [start_date + timedelta(days=i) for i in range(7)]
         pivot_df = pivot_df.reindex(all_days).fillna(0)
         return pivot_df
 
-    def plot_weekly_channel_usage(self, pivot_df):
-        """
-        直近1週間分のチャンネル使用時間を積み上げ棒グラフで可視化
-        ・x軸のラベルで土日を赤字
-        ・平均使用時間ライン
-        """
-        if pivot_df.empty:
-            return None
-
-        plt.figure(figsize=(10, 6))
-
-        # 積み上げ棒グラフ
-        bottom_vals = np.zeros(len(pivot_df))
-        colors = sns.color_palette("hls", n_colors=len(pivot_df.columns))  # チャンネルごとに異なる色
-        labels = pivot_df.columns.tolist()
-
-        for i, col in enumerate(labels):
-            plt.bar(
-                pivot_df.index,
-                pivot_df[col],
-                bottom=bottom_vals,
-                color=colors[i],
-                label=col
-            )
-            bottom_vals += pivot_df[col].values
-
-        # x軸の日付ラベルを土日で赤字にする（祝日は本実装ではAPI等で判断）
-        ax = plt.gca()
-        for tick_label in ax.get_xticklabels():
-            # 文字列からdate型へ変換
-            try:
-                tick_date = datetime.strptime(tick_label.get_text(), "%Y-%m-%d").date()
-                if tick_date.weekday() >= 5:  # 土日
-                    tick_label.set_color("red")
-            except:
-                pass
-
-        plt.xlabel("日付")
-        plt.ylabel("使用時間 (時間)")
-        plt.title("直近1週間のチャンネル使用時間")
-
-        # 週の合計の平均ライン（総合計 / 7日）
-        weekly_total = pivot_df.sum(axis=1).sum()
-        avg_per_day = weekly_total / 7.0
-        plt.axhline(avg_per_day, color="black", linestyle="--", label=f"平均: {avg_per_day:.2f} h/日")
-
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.tight_layout()
-        img_path = "weekly_channel_usage.png"
-        plt.savefig(img_path, dpi=100)
-        plt.close()
-        return img_path
-
     @app_commands.command(name="weekly_usage", description="直近1週間の音声チャンネル使用時間を表示します。")
     async def weekly_usage(self, interaction: discord.Interaction):
-        df_logs = self.load_data()
-        df_sessions = self.calculate_study_sessions(df_logs)
-        pivot_df = self.get_weekly_channel_usage(df_sessions)
+        if not await self.defer_chart(interaction):
+            return
+        start_date = datetime.now().date() - timedelta(days=6)
+        with self.stage(interaction, "load"):
+            key = await asyncio.to_thread(self.chart_key, interaction.guild_id, "weekly_usage", (start_date,), start_date, start_date + timedelta(days=7))
+        if await self.send_cached_chart(interaction, key, filename="weekly_channel_usage.png"):
+            return
+
+        with self.stage(interaction, "compute"):
+            pivot_df = await asyncio.to_thread(self.get_weekly_channel_usage, interaction.guild_id)
 
         if pivot_df.empty or pivot_df.sum().sum() == 0:
-            await interaction.response.send_message("直近1週間のチャンネル使用記録がありません。")
+            await interaction.followup.send("直近1週間のチャンネル使用記録がありません。")
             return
 
-        img_path = self.plot_weekly_channel_usage(pivot_df)
-        await interaction.response.send_message(file=discord.File(img_path))
+        await self.send_chart(interaction, key, "plot_weekly_channel_usage", pivot_df, filename="weekly_channel_usage.png")
 
     # ─────────────────────────────────────────────────────
     # (3) これまでのチャンネル使用累計時間: 棒グラフ
     # ─────────────────────────────────────────────────────
-    def get_total_channel_usage(self, df_sessions):
+    def get_total_channel_usage(self, guild_id):
         """
         これまでに記録されたチャンネルごとの累計使用時間を取得
         """
-        if df_sessions.empty:
+        usage = self.load_rollups(guild_id).channel_usage()
+        if usage.empty:
             return pd.DataFrame()
 
-        usage_df = df_sessions.groupby("channel_id")["duration"].sum().reset_index()
+        usage_df = usage.groupby("channel_id")["duration_hour"].sum().reset_index()
+        usage_df = usage_df.rename(columns={"duration_hour": "duration"})
         usage_df.sort_values("duration", ascending=False, inplace=True)
         return usage_df
 
-    def plot_total_channel_usage(self, usage_df):
-        """
-        チャンネルごとの累計使用時間を棒グラフで可視化
-        ・上位3チャンネルを金銀銅でハイライトする例
-        ・バーに時間を表示
-        """
+    @app_commands.command(name="channel_total_usage", description="これまでのチャンネル使用累計時間を表示します。")
+    async def channel_total_usage(self, interaction: discord.Interaction):
+        if not await self.defer_chart(interaction):
+            return
+        with self.stage(interaction, "load"):
+            key = await asyncio.to_thread(self.chart_key, interaction.guild_id, "channel_total_usage", ())
+        if await self.send_cached_chart(interaction, key, filename="total_channel_usage.png"):
+            return
+
+        with self.stage(interaction, "compute"):
+            usage_df = await asyncio.to_thread(self.get_total_channel_usage, interaction.guild_id)
+
         if usage_df.empty:
-            return None
+            await interaction.followup.send("チャンネル使用データがありません。")
+            return
+
+        await self.send_chart(interaction, key, "plot_total_channel_usage", usage_df, filename="total_channel_usage.png")
 
-        plt.figure(figsize=(8, 6))
+    # 既存コマンド（studytime, rank, report）もそのまま残す
+    @app_commands.command(name="studytime", description="指定したユーザーの学習時間を集計してグラフを表示します。")
+    @app_commands.describe(user="対象ユーザー", period="集計期間: D(日)、W(週)、M(月)")
+    async def studytime(self, interaction: discord.Interaction, user: discord.Member = None, period: str = "D"):
+        if not await self.defer_chart(interaction):
+            return
+        user_id = user.id if user else None
+        with self.stage(interaction, "load"):
+            key = await asyncio.to_thread(self.chart_key, interaction.guild_id, "studytime", (user_id, period))
+        if await self.send_cached_chart(interaction, key, filename="study_time.png"):
+            return
 
-        # ハイライトの設定 (金銀銅 + 通常色)
-        colors = []
-        medals = {0: "gold", 1: "silver", 2: "darkorange"}  # 上位3位のみ
-        for i in range(len(usage_df)):
-            if i in medals.keys():
-                colors.append(medals[i])
+        with self.stage(interaction, "load"):
+            if user_id is None:
+                df_sessions = await asyncio.to_thread(self.load_sessions, interaction.guild_id)
             else:
-                colors.append("skyblue")
+                # 全セッションを読んで絞り込まず、そのユーザーの分だけを読む
+                df_sessions = await asyncio.to_thread(self.load_user_sessions, interaction.guild_id, user_id)
 
-        bar_container = plt.barh(
-            usage_df["channel_id"],
-            usage_df["duration"],
-            color=colors
-        )
-        plt.xlabel("累計使用時間 (時間)")
-        plt.title("これまでのチャンネル使用累計時間")
+        if df_sessions.empty:
+            await interaction.followup.send("指定された期間に学習記録がありません。")
+            return
 
-        # 棒に値を表示 (ツールチップ代わり)
-        for rect, val in zip(bar_container, usage_df["duration"]):
-            plt.text(val + 0.1, rect.get_y() + rect.get_height()/2,
-                    f"{val:.2f}h",
-                    va="center")
+        await self.send_chart(interaction, key, "plot_study_time", df_sessions, None, period, filename="study_time.png")
 
-        plt.tight_layout()
-        img_path = "total_channel_usage.png"
-        plt.savefig(img_path, dpi=100)
-        plt.close()
-        return img_path
+    # ─────────────────────────────────────────────────────
+    # (4) 曜日・時間帯ごとの学習時間: ヒートマップ
+    # ─────────────────────────────────────────────────────
+    def get_weekly_heatmap(self, guild_id, start_date, end_date, user_id=None):
+        """
+        [start_date, end_date) の曜日・時間帯ごとの合計時間（7×24、行は月曜日から）を取得
+        """
+        rollups = self.load_rollups(guild_id)
+        if user_id is None:
+            return rollups.weekly_heatmap(start_date, end_date)
+        return rollups.user_weekly_heatmap(user_id, start_date, end_date)
+
+    @app_commands.command(name="heatmap", description="曜日・時間帯ごとの学習時間をヒートマップで表示します。")
+    @app_commands.describe(user="対象ユーザー（省略時はサーバー全体）", weeks="集計する週数（今日まで）")
+    async def heatmap(self, interaction: discord.Interaction, user: discord.Member = None,
+                      weeks: app_commands.Range[int, 1, 52] = 4):
+        if not await self.defer_chart(interaction):
+            return
+        user_id = user.id if user else None
+        end_date = datetime.now().date() + timedelta(days=1)
+        start_date = end_date - timedelta(weeks=weeks)
+        title = f"{user.display_name + ' さんの' if user else ''}曜日・時間帯ごとの学習時間（直近{weeks}週間）"
+        with self.stage(interaction, "load"):
+            key = await asyncio.to_thread(self.chart_key, interaction.guild_id, "heatmap", (user_id, start_date, title), start_date, end_date)
+        if await self.send_cached_chart(interaction, key, filename="heatmap.png"):
+            return
 
-    @app_commands.command(name="channel_total_usage", description="これまでのチャンネル使用累計時間を表示します。")
-    async def channel_total_usage(self, interaction: discord.Interaction):
-        df_logs = self.load_data()
-        df_sessions = self.calculate_study_sessions(df_logs)
-        usage_df = self.get_total_channel_usage(df_sessions)
+        with self.stage(interaction, "compute"):
+            hours = await asyncio.to_thread(self.get_weekly_heatmap, interaction.guild_id, start_date, end_date, user_id)
 
-        if usage_df.empty:
-            await interaction.response.send_message("チャンネル使用データがありません。")
+        if hours.sum() <= 0:
+            await interaction.followup.send("指定された期間に学習記録がありません。")
             return
 
-        img_path = self.plot_total_channel_usage(usage_df)
-        await interaction.response.send_message(file=discord.File(img_path))
+        await self.send_chart(interaction, key, "plot_weekly_heatmap", hours, title, filename="heatmap.png")
 
-    # 既存コマンド（studytime, rank, report）もそのまま残す
-    @app_commands.command(name="studytime", description="指定したユーザーの学習時間を集計してグラフを表示します。")
-    @app_commands.describe(user="対象ユーザー", period="集計期間: D(日)、W(週)、M(月)")
-    async def studytime(self, interaction: discord.Interaction, user: discord.Member = None, period: str = "D"):
-        df_logs = self.load_data()
-        df_sessions = self.calculate_study_sessions(df_logs)
-        img_path = self.plot_study_time(df_sessions, user.id if user else None, period)
-
-        if img_path:
-            await interaction.response.send_message(file=discord.File(img_path))
-        else:
-            await interaction.response.send_message("指定された期間に学習記録がありません。")
-
-    def plot_study_time(self, df, user_id=None, period="D"):
-        if user_id:
-            df = df[df["user_id"] == user_id]
-
-        if df.empty:
-            return None
-
-        df_grouped = df.groupby(pd.Grouper(key="start_time", freq=period)).sum(numeric_only=True)
-        plt.figure(figsize=(10, 5))
-        df_grouped["duration"].plot(kind="line", color="skyblue")
-        plt.title("学習時間の推移")
-        plt.ylabel("学習時間 (時間)")
-        plt.xlabel("日付" if period == "D" else "週")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        img_path = "study_time.png"
-        plt.savefig(img_path)
-        plt.close()
-        return img_path
+    def open_sessions(self, guild_id):
+        """
+        VCLogger が持つギルドの入室中の一覧から、入室中のセッションを今までの滞在として返す（イベントループ上で呼ぶ）。
+        """
+        vc_logger = self.bot.get_cog("VCLogger")
+        if vc_logger is None:
+            return pd.DataFrame(columns=["user_id", "duration_hour"])
+        return open_session_usage(vc_logger.presence(guild_id).snapshot(), datetime.now())
+
+    def load_leaderboard(self, guild_id):
+        """
+        集計テーブルの変更を取り込んだギルドのランキングを返す。
+        """
+        leaderboard = get_leaderboard(guild_id)
+        leaderboard.sync(self.load_rollups(guild_id))
+        return leaderboard
 
     @app_commands.command(name="rank", description="サーバー内の学習時間ランキングを表示します。")
-    async def rank(self, interaction: discord.Interaction):
-        df_logs = self.load_data()
-        df_sessions = self.calculate_study_sessions(df_logs)
-        ranking_text = self.generate_ranking(df_sessions)
-        await interaction.response.send_message(f"**📊 学習時間ランキング**\n{ranking_text}")
-
-    def generate_ranking(self, df):
-        ranking = df.groupby("user_id")["duration"].sum().sort_values(ascending=False)
-        ranking_text = "\n".join([
-            f"{idx + 1}位: <@{user}> - {duration:.2f} 時間"
-            for idx, (user, duration) in enumerate(ranking.head(3).items())
+    @app_commands.describe(window="集計期間")
+    @app_commands.choices(window=[app_commands.Choice(name=label, value=w) for w, label in WINDOW_LABELS.items()])
+    async def rank(self, interaction: discord.Interaction, window: str = "all"):
+        # 入室中の一覧はイベントループ上で更新されるので、ここで取り出してから渡す
+        open_df = self.open_sessions(interaction.guild_id)
+        with self.stage(interaction, "compute"):
+            leaderboard = await asyncio.to_thread(self.load_leaderboard, interaction.guild_id)
+            ranking = leaderboard.top(window, 3, extra=open_hours(open_df, window_start(window)))
+        ranking_text = self.generate_ranking(ranking)
+        await interaction.response.send_message(f"**📊 学習時間ランキング（{WINDOW_LABELS[window]}）**\n{ranking_text}")
+
+    def generate_ranking(self, ranking):
+        return "\n".join([
+            f"{entry['rank']}位: <@{entry['user_id']}> - {entry['duration_hour']:.2f} 時間"
+            for entry in ranking
         ])
-        return ranking_text
+
+    @app_commands.command(name="myrank", description="自分（または指定したユーザー）の順位を期間ごとに表示します。")
+    @app_commands.describe(user="対象ユーザー")
+    async def myrank(self, interaction: discord.Interaction, user: discord.Member = None):
+        member = user or interaction.user
+        open_df = self.open_sessions(interaction.guild_id)
+        with self.stage(interaction, "compute"):
+            leaderboard = await asyncio.to_thread(self.load_leaderboard, interaction.guild_id)
+            lines = []
+            for window in WINDOWS:
+                extra = open_hours(open_df, window_start(window))
+                entry = leaderboard.rank(window, member.id, extra)
+                if entry is None:
+                    lines.append(f"- {WINDOW_LABELS[window]}: 記録なし")
+                else:
+                    lines.append(
+                        f"- {WINDOW_LABELS[window]}: {entry['rank']}位 / {leaderboard.total_users(window, extra)}人"
+                        f"（{entry['duration_hour']:.2f} 時間）"
+                    )
+        await interaction.response.send_message(f"**🏅 {member.display_name} さんの順位**\n" + "\n".join(lines))
+
+    def get_total_hours(self, guild_id, start_date, end_date):
+        """
+        [start_date, end_date) の合計時間。期間をまたぐセッションは0時で分けて、期間内の分だけを数える
+        """
+        return self.load_rollups(guild_id).daily_usage(start_date, end_date)["duration_hour"].sum()
 
     @app_commands.command(name="report", description="月次レポートを生成して表示します。")
     @app_commands.describe(year="対象年", month="対象月")
     async def report(self, interaction: discord.Interaction, year: int, month: int):
-        df_logs = self.load_data()
-        df_sessions = self.calculate_study_sessions(df_logs)
+        if not await self.defer_chart(interaction):
+            return
         start_date = datetime(year, month, 1)
         end_date = (start_date + timedelta(days=32)).replace(day=1)
-        df_month = df_sessions[(df_sessions["start_time"] >= start_date) & (df_sessions["start_time"] < end_date)]
+        with self.stage(interaction, "load"):
+            key = await asyncio.to_thread(self.chart_key, interaction.guild_id, "report", (year, month), start_date.date(), end_date.date())
+            df_month = await asyncio.to_thread(self.load_sessions, interaction.guild_id, start_date, end_date)
 
         if df_month.empty:
-            await interaction.response.send_message("指定された月に学習記録がありません。")
+            await interaction.followup.send("指定された月に学習記録がありません。")
             return
 
-        img_path = self.plot_study_time(df_month, period="D")
-        total_hours = df_month["duration"].sum()
+        total_hours = await asyncio.to_thread(self.get_total_hours, interaction.guild_id, start_date.date(), end_date.date())
         avg_hours = df_month["duration"].mean()
         max_hours = df_month["duration"].max()
 
@@ -372,12 +379,18 @@ class StudyTimeTracker(commands.Cog):
             f"- 最長学習時間: {max_hours:.2f} 時間"
         )
 
-        await interaction.response.send_message(report_text)
-        await interaction.followup.send(file=discord.File(img_path))
+        await interaction.followup.send(report_text)
+        if not await self.send_cached_chart(interaction, key, filename="study_time.png"):
+            await self.send_chart(interaction, key, "plot_study_time", df_month, None, "D", filename="study_time.png")
+
+    @commands.command()
+    async def chart_cache(self, ctx):
+        """グラフキャッシュのヒット率などを表示する（監視用）。"""
+        stats = self.chart_cache.stats()
+        await ctx.send(
+            f"🗂️ グラフキャッシュ: {stats['entries']} 件 / {stats['bytes'] / 1024:.0f} KB\n"
+            f"ヒット {stats['hits']} / ミス {stats['misses']}（ヒット率 {stats['hit_rate']:.0%}）/ 追い出し {stats['evictions']}"
+        )
 
 async def setup(bot):
     await bot.add_cog(StudyTimeTracker(bot))
-    await bot.tree.sync()
-
-
-
@@ -1,54 +1,284 @@
-from discord.ext import commands
+from discord.ext import commands, tasks
 from datetime import datetime
-import pandas as pd
+import asyncio
 import discord
 
+from core import config
+from core.event_writer import EventWriter
+from core.guild_settings import get_guild_settings
+from core.metrics import HANDLER_SECONDS, timed
+from core.rollups import get_rollups
+from core.session_tracker import SessionTracker
+from core.storage import PartitionedStorage, get_storage
+
+class LogNotifier:
+    """
+    ログ用テキストチャンネルへの入退室通知を window 秒ごとに1通へまとめる。
+
+    メンバーごとに「最初にいたチャンネル」と「最後にいるチャンネル」だけを覚えておき、
+    送るときは差分（参加・退出・移動）だけを書く。窓の中で入ってすぐ抜けたなど、
+    結局同じ場所に戻った出入りは省略して件数だけ添える。
+    送信に失敗した場合は間隔を倍にしながら max_retries 回まで送り直す。
+    """
+
+    # Discord のメッセージは 2000 文字まで
+    MAX_LENGTH = 1900
+
+    def __init__(self, get_channel, window: float = 15.0, max_retries: int = 5):
+        """
+        get_channel は送信先のチャンネル（なければ None）を返す関数。送るたびに呼ぶので設定の変更が反映される。
+        """
+        self.get_channel = get_channel
+        self.window = window
+        self.max_retries = max_retries
+        self._changes = {}  # member_id -> [display_name, 最初のチャンネル, 最後のチャンネル]
+        self._task = None
+        self._closing = asyncio.Event()
+
+    def add(self, member, before, after):
+        """
+        入退室を1件記録する。before / after はチャンネル（いなければ None）。
+        """
+        entry = self._changes.get(member.id)
+        if entry is None:
+            self._changes[member.id] = [member.display_name, before, after]
+        else:
+            entry[0] = member.display_name
+            entry[2] = after
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._changes and not self._closing.is_set():
+            try:
+                # close() が呼ばれたら窓の終わりを待たずに送る
+                await asyncio.wait_for(self._closing.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def close(self):
+        """
+        待機中の通知をすぐに送る（Bot の停止時）。送信中（再送の待ちを含む）の通知は、取り消さずに送り終えるまで待つ。
+        """
+        self._closing.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def summarize(self, changes: dict) -> list:
+        lines, collapsed = [], 0
+        for name, first, last in changes.values():
+            first_id = first.id if first else None
+            last_id = last.id if last else None
+            if first_id == last_id:
+                collapsed += 1
+            elif first is None:
+                lines.append(f"🔊 **{name}** が **{last.name}** に参加しました。")
+            elif last is None:
+                lines.append(f"📴 **{name}** が **{first.name}** から退出しました。")
+            else:
+                lines.append(f"🔀 **{name}** が **{first.name}** から **{last.name}** に移動しました。")
+        if collapsed:
+            lines.append(f"（短時間の出入り {collapsed} 件は省略しました）")
+        return lines
+
+    async def flush(self):
+        changes, self._changes = self._changes, {}
+        lines = self.summarize(changes)
+        # 長い場合は 2000 文字に収まるように分けて送る
+        message = ""
+        for line in lines:
+            if message and len(message) + len(line) + 1 > self.MAX_LENGTH:
+                await self.send(message)
+                message = ""
+            message = f"{message}\n{line}" if message else line
+        if message:
+            await self.send(message)
+
+    async def send(self, message: str):
+        delay = 1.0
+        for attempt in range(self.max_retries):
+            log_channel = self.get_channel()
+            if log_channel is None:
+                return
+            try:
+                await log_channel.send(message)
+                return
+            except (discord.Forbidden, discord.NotFound) as e:
+                # 権限がない・チャンネルがない場合は送り直しても成功しない
+                print(f"メッセージ送信エラー: {e}")
+                return
+            except discord.HTTPException as e:
+                print(f"メッセージ送信エラー（{delay:.0f}秒後に再送 {attempt + 1}/{self.max_retries}）: {e}")
+                await asyncio.sleep(delay)
+                delay *= 2
+        print(f"メッセージを送信できませんでした: {message[:100]}")
+
 class VCLogger(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.data_file = 'data/vc_logs.csv'
-        self.log_channel_id = 1343442260431470612  # 通知を送信するテキストチャンネルのID
+        # 通知先のチャンネルなどはギルドごとの設定（core/guild_settings.py）から読む
+        self.settings = get_guild_settings()
+        # 入退室の通知は LOG_NOTIFY_WINDOW 秒ごとに、ギルドごとに1通にまとめて送る
+        self.notifiers = {}
+        # イベントと確定したセッションはバックグラウンドスレッドでまとめて、ギルドごとの保存先（CSV / SQLite）に
+        # 書き込み、書き込みのたびに確定したセッションをそのギルドの日別の集計テーブルへ反映する
+        self.partitions = PartitionedStorage()
+        self.writer = EventWriter(
+            self.partitions,
+            batch_size=config.VC_LOG_BATCH_SIZE,
+            flush_interval=config.VC_LOG_FLUSH_INTERVAL,
+            on_flush=self.sync_rollups,
+            max_pending=config.VC_LOG_MAX_PENDING,
+        )
+        # ギルドごとのセッション状態。入室中の一覧（presence）は集計に入室中の時間を足すときにも使う
+        self.trackers = {}
+        self.loaded_guilds = set()
+        self.sweep_presence.change_interval(seconds=config.SESSION_SWEEP_INTERVAL)
+
+    async def cog_load(self):
+        # 通常は setup_hook（接続前）で読み込まれ、on_ready で入室中の一覧を作る。接続後に読み込み直した場合はここで作る
+        if self.bot.is_ready():
+            await self.sync_presence()
+
+    async def cog_unload(self):
+        # 入室中のセッションをいま閉じてから、キューに残ったイベントを書き切って終了する（bot.close() でも呼ばれる）
+        self.sweep_presence.cancel()
+        now = datetime.now()
+        for tracker in self.trackers.values():
+            self.record(*tracker.disconnect(now))
+        for notifier in self.notifiers.values():
+            await notifier.close()
+        await asyncio.to_thread(self.writer.close)
+
+    def sync_rollups(self):
+        """
+        セッションを書き込んだギルドの集計テーブルを更新する（ライタースレッドから呼ばれる）。
+        """
+        for guild_id in self.partitions.pop_touched():
+            get_rollups(guild_id).sync(get_storage(guild_id))
+
+    def tracker(self, guild_id: int) -> SessionTracker:
+        tracker = self.trackers.get(guild_id)
+        if tracker is None:
+            tracker = self.trackers[guild_id] = SessionTracker(guild_id)
+        return tracker
+
+    def presence(self, guild_id: int):
+        """
+        ギルドの入室中の一覧（PresenceIndex）。
+        """
+        return self.tracker(guild_id).presence
+
+    def log_channel(self, guild):
+        """
+        ギルドの設定にあるログ用チャンネル。別のギルドのチャンネルには送らない。
+        """
+        channel = self.bot.get_channel(self.settings.get(guild.id)["log_channel_id"])
+        if channel is None or getattr(channel, "guild", None) != guild:
+            return None
+        return channel
+
+    def notifier(self, guild) -> LogNotifier:
+        notifier = self.notifiers.get(guild.id)
+        if notifier is None:
+            notifier = self.notifiers[guild.id] = LogNotifier(
+                lambda: self.log_channel(guild), config.LOG_NOTIFY_WINDOW, config.LOG_NOTIFY_MAX_RETRIES
+            )
+        return notifier
+
+    def record(self, events, sessions):
+        """
+        状態遷移で出たイベントと確定したセッションを書き込みキューに積む。
+        """
+        for event in events:
+            self.writer.write(event)
+        for session in sessions:
+            self.writer.write_session(session)
+
+    @staticmethod
+    def voice_members(guild) -> dict:
+        """
+        ギルドのボイスチャンネルにいまいるメンバー（user_id -> (channel_id, channel_name)）。
+        """
+        current = {}
+        for channel in guild.voice_channels + guild.stage_channels:
+            for member in channel.members:
+                current[member.id] = (channel.id, channel.name)
+        return current
+
+    async def sync_presence(self):
+        """
+        各ギルドの入室中の一覧を、実際にボイスチャンネルにいるメンバーに合わせる。
+          - いるのに一覧にない（Bot の停止中に入った）→ いまの時刻で join を記録
+          - 一覧と違うチャンネルにいる → いまの時刻で移動として記録
+          - 一覧にあるのにいない → 起動直後は退出時刻が分からないので、
+            channel_id なしの leave で入室状態だけを破棄する（集計には入らない）。
+            再接続時は切断中に抜けたものとして、いまの時刻で閉じる
+        """
+        for guild in self.bot.guilds:
+            if guild.unavailable:
+                continue
+            first = guild.id not in self.loaded_guilds
+            tracker = self.tracker(guild.id)
+            if first:
+                # 初回は保存先の leave 待ち join から読み込む（前回の停止時に閉じられなかった分）。
+                # Bot が参加しているギルドの保存先はここで作っておく（統計コマンドなどの読み出し側は作らない）
+                storage = get_storage(guild.id, create=True)
+                tracker.presence.load(await asyncio.to_thread(storage.open_sessions))
+                self.loaded_guilds.add(guild.id)
+            self.record(*tracker.reconcile(self.voice_members(guild), datetime.now(), close_missing=not first))
+        print(f"入室中のユーザー: {sum(len(t.presence) for t in self.trackers.values())} 人")
+        if not self.sweep_presence.is_running():
+            self.sweep_presence.start()
+
+    @tasks.loop(seconds=60)
+    async def sweep_presence(self):
+        """
+        leave の取りこぼし対策。一覧にあるのにボイスチャンネルにいないユーザーのセッションを閉じる。
+        """
+        # 切断中・サーバー情報の読み込み中はメンバーが空に見えるので何もしない
+        if self.bot.is_closed() or not self.bot.is_ready():
+            return
+        now = datetime.now()
+        for guild in self.bot.guilds:
+            if guild.unavailable or guild.id not in self.loaded_guilds:
+                continue
+            self.record(*self.trackers[guild.id].reconcile(self.voice_members(guild), now))
 
     @commands.Cog.listener()
+    async def on_ready(self):
+        # 再接続時は、切断中に見逃した入退室を取り込み直す
+        await self.sync_presence()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        await self.sync_presence()
+
+    @commands.Cog.listener()
+    @timed(HANDLER_SECONDS, cog="VCLogger", event="on_voice_state_update")
     async def on_voice_state_update(self, member, before, after):
-        entry = None
-        message = None
+        if after.channel == before.channel:
+            # ミュート切り替えなど、チャンネルが変わらない更新
+            return
+        now = datetime.now()
+        tracker = self.tracker(member.guild.id)
 
+        # ログを保存（キューに積むだけで、書き込みはライタースレッドが行う）
+        # VC移動: 前のチャンネルのセッションを閉じて、移動先で新しく始める
+        if before.channel and after.channel:
+            self.record(*tracker.move(member.id, after.channel.id, after.channel.name, now))
         # VC参加
-        if after.channel and after.channel != before.channel:
-            entry = {
-                'user_id': member.id,
-                'timestamp': datetime.now(),
-                'action': 'join',
-                'channel_id': after.channel.id,
-                'channel_name': after.channel.name
-            }
-            message = f"🔊 **{member.display_name}** が **{after.channel.name}** に参加しました。"
-
+        elif after.channel:
+            self.record(*tracker.join(member.id, after.channel.id, after.channel.name, now))
         # VC退出
-        elif before.channel and not after.channel:
-            entry = {
-                'user_id': member.id,
-                'timestamp': datetime.now(),
-                'action': 'leave',
-                'channel_id': before.channel.id,
-                'channel_name': before.channel.name
-            }
-            message = f"📴 **{member.display_name}** が **{before.channel.name}** から退出しました。"
-
-        # ログをCSVに保存
-        if entry:
-            df = pd.DataFrame([entry])
-            df.to_csv(self.data_file, mode='a', header=not pd.io.common.file_exists(self.data_file), index=False)
-
-        # ログ用テキストチャンネルにメッセージを送信
-        if message:
-            log_channel = self.bot.get_channel(self.log_channel_id)
-            if log_channel:
-                try:
-                    await log_channel.send(message)
-                except discord.HTTPException as e:
-                    print(f"メッセージ送信エラー: {e}")
+        else:
+            self.record(*tracker.leave(member.id, before.channel.id, before.channel.name, now))
+
+        # ログ用テキストチャンネルへの通知（まとめて送る）
+        self.notifier(member.guild).add(member, before.channel, after.channel)
 
     @commands.command()
     async def register_vc(self, ctx, *, channel_name):
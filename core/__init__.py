@@ -0,0 +1,3 @@
+"""
+Bot (cogs/) と API (backend/) の両方から使う共通処理。
+"""
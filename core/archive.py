@@ -0,0 +1,336 @@
+"""
+CSV の保存先の古いログを、期間（月 / 週）ごとの圧縮ファイルに移す（ローテーション）。
+
+vc_logs.csv / vc_sessions.csv には今の期間の分だけを残し、それより前の行は
+data/archive/ の下に期間ごとの vc_logs_<期間>.csv.gz / vc_sessions_<期間>.csv.gz として置く。
+イベントは timestamp、セッションは end_time の期間に入れる。
+ただし期間をまたいで入室中のユーザーの join は、leave と突き合わせられるよう今のファイルに残す。
+セッションは今のファイルの先頭から続く行だけを移す（追記された順の位置を集計テーブルの差分のカーソルに使うため。
+時計が戻って前の期間の end_time で追記された行は、その前の行と一緒に次のローテーションで移す）。
+
+manifest.json に各期間のファイル・行数・時刻の範囲と、セッションの集計（開始日ごとの合計時間など）を記録する。
+読み出し側は manifest を見て、問い合わせの期間に重なるパーティションだけを開く。
+  - hot_from: これより前のイベントはアーカイブにある（持ち越した join を除き、今のファイルに残っていても読まない）
+  - hot_sessions: 今のセッションファイル（の inode）と、その作成時に前のファイルの先頭から移した行数（skip）。
+    ファイルの inode が違えば置き換え前のファイルなので、先頭の skip 行はアーカイブにあるものとして読まない
+ローテーションは「アーカイブを書く → manifest を書く → 今のファイルを置き換える」の順に行うので、
+途中で読んだ読み出し側も、途中で止まった場合も、同じセッションを二重に数えない。
+
+手動で実行する場合（Bot は期間が変わって最初の書き込みのときに自動で行う）:
+    python -m core.archive rotate
+    python -m core.archive list --guild-id 123456789012345678
+"""
+import argparse
+import importlib.util
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from core import config
+from core.metrics import CACHE_REQUESTS, ROWS_PARSED, STAGE_SECONDS
+from core.sessions import SESSION_COLUMNS, empty_sessions
+
+PERIODS = ("month", "week")
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+MANIFEST_NAME = "manifest.json"
+
+
+def period_start(ts: datetime, period: str) -> datetime:
+    """
+    ts を含む期間の始まり（月は1日、週は月曜日の 0 時）。
+    """
+    day = datetime(ts.year, ts.month, ts.day)
+    if period == "month":
+        return day.replace(day=1)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"不明なローテーションの期間です: {period}")
+
+
+def period_starts(times: pd.Series, period: str) -> pd.Series:
+    """
+    period_start を Series の各要素に適用したもの（日付ごとに1回だけ計算する）。
+    """
+    days = times.dt.normalize()
+    starts = {day: pd.Timestamp(period_start(day, period)) for day in days.unique()}
+    return days.map(starts)
+
+
+def next_period(start: datetime, period: str) -> datetime:
+    if period == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=7)
+
+
+def period_key(start: datetime, period: str) -> str:
+    if period == "month":
+        return f"{start:%Y-%m}"
+    year, week, _ = start.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _format_time(ts) -> str:
+    return pd.Timestamp(ts).isoformat(sep=" ")
+
+
+def read_raw(path: str, **kwargs) -> pd.DataFrame:
+    """
+    CSV を文字列のまま読む（ID の桁落ちや時刻の書式の変化を起こさずに書き戻すため）。
+    """
+    return pd.read_csv(path, dtype=str, keep_default_na=False, **kwargs)
+
+
+def session_summary(sessions: pd.DataFrame) -> dict:
+    """
+    manifest に書くセッションの集計。daily_hour は開始日ごとの合計時間。
+    """
+    if sessions.empty:
+        return {"sessions": 0, "users": 0, "total_hour": 0.0, "daily_hour": {}}
+    daily = sessions.groupby(sessions["start_time"].dt.strftime("%Y-%m-%d"))["duration_hour"].sum()
+    return {
+        "sessions": int(len(sessions)),
+        "users": int(sessions["user_id"].nunique()),
+        "total_hour": float(sessions["duration_hour"].sum()),
+        "daily_hour": {day: float(h) for day, h in daily.items()},
+    }
+
+
+class LogArchive:
+    """
+    ギルドの保存先の data/archive/（manifest と期間ごとの圧縮ファイル）。
+    開いたパーティションは cache_partitions 個まで、パース済みの DataFrame を残しておく。
+    """
+
+    def __init__(self, directory: str, compression: str = "gzip", cache_partitions: int = 3):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+            print("zstandard がインストールされていないため、アーカイブは gzip で圧縮します。")
+            compression = "gzip"
+        self.compression = compression
+        self.cache_partitions = cache_partitions
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_stat = None
+        self._frames = OrderedDict()
+
+    # ── manifest ─────────────────────────────────────────
+    def manifest(self) -> dict:
+        """
+        manifest の内容（ファイルが書き換わっていれば読み直す）。まだなければ空の manifest。
+        """
+        with self._lock:
+            try:
+                st = os.stat(self.manifest_path)
+            except FileNotFoundError:
+                self._manifest, self._manifest_stat = None, None
+                return {"hot_from": None, "partitions": []}
+            stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stat != self._manifest_stat:
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_stat = stat
+            return self._manifest
+
+    @property
+    def version(self):
+        self.manifest()
+        return self._manifest_stat
+
+    def hot_from(self, manifest: dict = None):
+        return _parse_time((manifest or self.manifest()).get("hot_from"))
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    # ── 読み出し ─────────────────────────────────────────
+    def session_rows(self, manifest: dict = None) -> int:
+        """
+        アーカイブにあるセッションの行数（今のセッションファイルの先頭の行が、追記された順で何行目の次か）。
+        """
+        return sum(p["sessions"]["rows"] for p in (manifest or self.manifest())["partitions"] if p.get("sessions"))
+
+    def sessions(self, start: datetime = None, end: datetime = None, manifest: dict = None) -> pd.DataFrame:
+        """
+        アーカイブにあるセッションのうち、start_time が [start, end) に入るもの。重なるパーティションだけを開く。
+        """
+        frames = []
+        for partition in (manifest or self.manifest())["partitions"]:
+            info = partition.get("sessions")
+            if not info:
+                continue
+            if start is not None and _parse_time(info["start_max"]) < start:
+                continue
+            if end is not None and _parse_time(info["start_min"]) >= end:
+                continue
+            frames.append(self._read_sessions(partition))
+        if not frames:
+            return empty_sessions()
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def daily_hour(self, start: datetime = None, end: datetime = None, manifest: dict = None) -> dict:
+        """
+        manifest の集計から、開始日ごとの合計時間（ファイルは開かない）。
+        """
+        start_day = start.strftime("%Y-%m-%d") if start is not None else None
+        end_day = end.strftime("%Y-%m-%d") if end is not None else None
+        totals = {}
+        for partition in (manifest or self.manifest())["partitions"]:
+            for day, h in partition.get("summary", {}).get("daily_hour", {}).items():
+                if (start_day is None or day >= start_day) and (end_day is None or day < end_day):
+                    totals[day] = totals.get(day, 0.0) + h
+        return totals
+
+    def _read_sessions(self, partition: dict) -> pd.DataFrame:
+        path = os.path.join(self.directory, partition["sessions"]["file"])
+        # 取り込み（core/import_logs.py）でアーカイブごと置き換わった場合も古い内容を返さないよう、ファイル自体も見る
+        st = os.stat(path)
+        key = (partition["sessions"]["file"], partition.get("revision", 0), st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            df = self._frames.get(key)
+            if df is not None:
+                self._frames.move_to_end(key)
+                CACHE_REQUESTS.inc(cache="archive", result="hit")
+                return df
+        CACHE_REQUESTS.inc(cache="archive", result="miss")
+        with STAGE_SECONDS.time(stage="csv_load"):
+            df = pd.read_csv(path)
+            for col in ("start_time", "end_time"):
+                df[col] = pd.to_datetime(df[col], format="ISO8601")
+        ROWS_PARSED.inc(len(df), source="archive")
+        with self._lock:
+            self._frames[key] = df
+            while len(self._frames) > self.cache_partitions:
+                self._frames.popitem(last=False)
+        return df
+
+    # ── 書き込み（CSVStorage.rotate から呼ぶ）──────────────
+    def add(self, events: pd.DataFrame, event_times: pd.Series, sessions: pd.DataFrame,
+            period: str, hot_from: datetime, hot_sessions: dict = None):
+        """
+        文字列のまま読んだ events / sessions を期間ごとのパーティションに追加し（既にある期間には足し込む）、
+        manifest の hot_from と hot_sessions を書き換える。event_times は events の timestamp を datetime にしたもの。
+        hot_sessions を渡さない場合（取り込みで新しく作る場合）は、今のセッションファイルが hot_from 以降に
+        終わった行だけであることを表す。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = dict(self.manifest())
+        partitions = {p["key"]: dict(p) for p in manifest.get("partitions", [])}
+
+        session_ends = pd.to_datetime(sessions["end_time"], format="ISO8601")
+        event_starts = period_starts(event_times, period)
+        session_starts = period_starts(session_ends, period)
+        for start in sorted(set(event_starts) | set(session_starts)):
+            key = period_key(start, period)
+            entry = partitions.get(key) or {
+                "key": key, "start": _format_time(start), "end": _format_time(next_period(start, period)),
+                "revision": 0,
+            }
+            entry["revision"] += 1
+            self._add_events(entry, events[(event_starts == start).to_numpy()], key)
+            self._add_sessions(entry, sessions[(session_starts == start).to_numpy()], key)
+            partitions[key] = entry
+
+        manifest["period"] = period
+        manifest["compression"] = self.compression
+        manifest["hot_from"] = _format_time(hot_from)
+        if hot_sessions is None:
+            manifest.pop("hot_sessions", None)
+        else:
+            manifest["hot_sessions"] = hot_sessions
+        manifest["partitions"] = sorted(partitions.values(), key=lambda p: p["start"])
+        self._write_manifest(manifest)
+
+    def _partition_file(self, kind: str, key: str) -> str:
+        return f"{kind}_{key}.csv{EXTENSIONS[self.compression]}"
+
+    def _merge(self, info: dict, rows: pd.DataFrame, order_column: str) -> pd.DataFrame:
+        if info:
+            existing = read_raw(os.path.join(self.directory, info["file"]))
+            rows = pd.concat([existing, rows], ignore_index=True).fillna("")
+        times = pd.to_datetime(rows[order_column], format="ISO8601")
+        return rows.iloc[times.argsort(kind="stable")]
+
+    def _write(self, rows: pd.DataFrame, file_name: str):
+        path = os.path.join(self.directory, file_name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        rows.to_csv(tmp_path, index=False, lineterminator="\n",
+                    compression={"method": self.compression})
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _add_events(self, entry: dict, rows: pd.DataFrame, key: str):
+        if rows.empty:
+            return
+        rows = self._merge(entry.get("events"), rows, "timestamp")
+        file_name = entry["events"]["file"] if entry.get("events") else self._partition_file("vc_logs", key)
+        self._write(rows, file_name)
+        entry["events"] = {
+            "file": file_name, "rows": int(len(rows)),
+            "first": rows["timestamp"].iloc[0], "last": rows["timestamp"].iloc[-1],
+        }
+
+    def _add_sessions(self, entry: dict, rows: pd.DataFrame, key: str):
+        if rows.empty:
+            return
+        rows = self._merge(entry.get("sessions"), rows, "end_time")[SESSION_COLUMNS]
+        file_name = entry["sessions"]["file"] if entry.get("sessions") else self._partition_file("vc_sessions", key)
+        self._write(rows, file_name)
+        parsed = rows.assign(
+            start_time=pd.to_datetime(rows["start_time"], format="ISO8601"),
+            end_time=pd.to_datetime(rows["end_time"], format="ISO8601"),
+            duration_hour=rows["duration_hour"].astype(float),
+        )
+        entry["sessions"] = {
+            "file": file_name, "rows": int(len(rows)),
+            "start_min": _format_time(parsed["start_time"].min()), "start_max": _format_time(parsed["start_time"].max()),
+            "end_min": _format_time(parsed["end_time"].min()), "end_max": _format_time(parsed["end_time"].max()),
+        }
+        entry["summary"] = session_summary(parsed)
+
+
+def main():
+    from core.storage import CSVStorage, get_storage
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rotate", "list"], help="rotate: 今の期間より前の行をアーカイブへ移す / list: 一覧")
+    parser.add_argument("--guild-id", type=int, default=None, help="対象のギルド（省略時は DEFAULT_GUILD_ID の保存先）")
+    parser.add_argument("--period", choices=PERIODS, default=None, help="期間（省略時は VC_LOG_ROTATE）")
+    args = parser.parse_args()
+
+    storage = get_storage(args.guild_id)
+    if not isinstance(storage, CSVStorage):
+        print("ローテーションは STORAGE_BACKEND=csv のときだけ使えます。")
+        return
+    if args.command == "rotate":
+        period = args.period or (config.VC_LOG_ROTATE if config.VC_LOG_ROTATE in PERIODS else "month")
+        events, sessions = storage.rotate(period=period)
+        print(f"イベント {events} 行・セッション {sessions} 行をアーカイブへ移しました（{storage.archive.directory}）。")
+    else:
+        manifest = storage.archive.manifest()
+        print(f"hot_from: {manifest.get('hot_from')}")
+        for p in manifest["partitions"]:
+            summary = p.get("summary", {})
+            print(
+                f"{p['key']}: イベント {(p.get('events') or {}).get('rows', 0):,} 行 / "
+                f"セッション {summary.get('sessions', 0):,} 件 / {summary.get('total_hour', 0.0):.1f} 時間 / "
+                f"ユーザー {summary.get('users', 0)} 人"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+from core.lru import SizedLRU
+
+
+class ChartCache(SizedLRU):
+    """
+    描画済みグラフ（PNG のバイト列）の LRU キャッシュ。
+
+    キーは (グラフの種類, パラメータ, データのバージョン)。バージョンには
+    RollupStore.version(期間) を使うので、その期間に新しいセッションが入るとキーが変わり、
+    古い画像は参照されなくなって LRU で追い出される。
+    合計サイズが max_bytes を超えたら古いものから捨てる。
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        super().__init__(max_bytes, name="chart")
@@ -0,0 +1,210 @@
+"""
+統計コマンドのグラフ描画。
+
+描画は重いので、Bot のイベントループではなく RenderPool（core/render_pool.py）の
+別プロセスで実行する。どの関数も集計済みの DataFrame を受け取り、
+PNG のバイト列を返す（ファイルには書かないので、同時に実行しても画像が混ざらない）。
+"""
+import io
+from datetime import datetime
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import japanize_matplotlib  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import seaborn as sns  # noqa: E402
+
+from core.intervals import split_sessions  # noqa: E402
+
+sns.set(style="whitegrid")
+japanize_matplotlib.japanize()
+
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+
+
+def to_png(**kwargs) -> bytes:
+    """
+    現在の図を PNG のバイト列にして閉じる。
+    """
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png", **kwargs)
+    plt.close()
+    return buf.getvalue()
+
+
+def plot_today_channel_usage(usage_df):
+    """
+    今日のチャンネル使用時間を棒グラフで可視化し、PNG のバイト列を返す
+    - カラーマップで使用時間が多いほど濃い色
+    - 閾値ラインの例として、全チャンネル平均を追加
+    """
+    # 空チェック
+    if usage_df.empty:
+        return None
+
+    usage_df.sort_values("duration", inplace=True, ascending=True)
+
+    # カラーマップを使用時間に応じてスケールさせる
+    norm = plt.Normalize(usage_df["duration"].min(), usage_df["duration"].max())
+    cmap = sns.light_palette("blue", as_cmap=True)
+
+    plt.figure(figsize=(8, 6))
+    bar_container = plt.barh(
+        usage_df["channel_id"],
+        usage_df["duration"],
+        color=[cmap(norm(val)) for val in usage_df["duration"]]
+    )
+
+    # 使用時間の平均にラインを引く (閾値ライン例)
+    avg_usage = usage_df["duration"].mean()
+    plt.axvline(avg_usage, color="red", linestyle="--", label=f"平均: {avg_usage:.2f}h")
+
+    plt.title("今日のチャンネル使用時間 (時間)")
+    plt.xlabel("使用時間 (時間)")
+    plt.legend()
+
+    # 棒に対して値を表示
+    for rect, val in zip(bar_container, usage_df["duration"]):
+        plt.text(val+0.01, rect.get_y() + rect.get_height()/2,
+                f"{val:.2f}h",
+                va="center", fontsize=8)
+
+    plt.tight_layout()
+    return to_png(dpi=100)
+
+
+def plot_weekly_channel_usage(pivot_df):
+    """
+    直近1週間分のチャンネル使用時間を積み上げ棒グラフで可視化
+    ・x軸のラベルで土日を赤字
+    ・平均使用時間ライン
+    """
+    if pivot_df.empty:
+        return None
+
+    plt.figure(figsize=(10, 6))
+
+    # 積み上げ棒グラフ
+    bottom_vals = np.zeros(len(pivot_df))
+    colors = sns.color_palette("hls", n_colors=len(pivot_df.columns))  # チャンネルごとに異なる色
+    labels = pivot_df.columns.tolist()
+
+    for i, col in enumerate(labels):
+        plt.bar(
+            pivot_df.index,
+            pivot_df[col],
+            bottom=bottom_vals,
+            color=colors[i],
+            label=col
+        )
+        bottom_vals += pivot_df[col].values
+
+    # x軸の日付ラベルを土日で赤字にする（祝日は本実装ではAPI等で判断）
+    ax = plt.gca()
+    for tick_label in ax.get_xticklabels():
+        # 文字列からdate型へ変換
+        try:
+            tick_date = datetime.strptime(tick_label.get_text(), "%Y-%m-%d").date()
+            if tick_date.weekday() >= 5:  # 土日
+                tick_label.set_color("red")
+        except:
+            pass
+
+    plt.xlabel("日付")
+    plt.ylabel("使用時間 (時間)")
+    plt.title("直近1週間のチャンネル使用時間")
+
+    # 週の合計の平均ライン（総合計 / 7日）
+    weekly_total = pivot_df.sum(axis=1).sum()
+    avg_per_day = weekly_total / 7.0
+    plt.axhline(avg_per_day, color="black", linestyle="--", label=f"平均: {avg_per_day:.2f} h/日")
+
+    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.tight_layout()
+    return to_png(dpi=100)
+
+
+def plot_total_channel_usage(usage_df):
+    """
+    チャンネルごとの累計使用時間を棒グラフで可視化
+    ・上位3チャンネルを金銀銅でハイライトする例
+    ・バーに時間を表示
+    """
+    if usage_df.empty:
+        return None
+
+    plt.figure(figsize=(8, 6))
+
+    # ハイライトの設定 (金銀銅 + 通常色)
+    colors = []
+    medals = {0: "gold", 1: "silver", 2: "darkorange"}  # 上位3位のみ
+    for i in range(len(usage_df)):
+        if i in medals.keys():
+            colors.append(medals[i])
+        else:
+            colors.append("skyblue")
+
+    bar_container = plt.barh(
+        usage_df["channel_id"],
+        usage_df["duration"],
+        color=colors
+    )
+    plt.xlabel("累計使用時間 (時間)")
+    plt.title("これまでのチャンネル使用累計時間")
+
+    # 棒に値を表示 (ツールチップ代わり)
+    for rect, val in zip(bar_container, usage_df["duration"]):
+        plt.text(val + 0.1, rect.get_y() + rect.get_height()/2,
+                f"{val:.2f}h",
+                va="center")
+
+    plt.tight_layout()
+    return to_png(dpi=100)
+
+
+def plot_study_time(df, user_id=None, period="D"):
+    if user_id:
+        df = df[df["user_id"] == user_id]
+
+    if df.empty:
+        return None
+
+    # 日をまたぐセッションは0時で分けて、それぞれの日の時間にする
+    days = split_sessions(df, "day")
+    df_grouped = days.groupby(pd.Grouper(key="bucket", freq=period))["duration_hour"].sum()
+    plt.figure(figsize=(10, 5))
+    df_grouped.plot(kind="line", color="skyblue")
+    plt.title("学習時間の推移")
+    plt.ylabel("学習時間 (時間)")
+    plt.xlabel("日付" if period == "D" else "週")
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return to_png()
+
+
+def plot_weekly_heatmap(hours, title):
+    """
+    曜日（行、月曜日から）× 時間帯（列）の合計時間（7×24）をヒートマップで可視化
+    """
+    hours = np.asarray(hours, dtype=float)
+    if hours.sum() <= 0:
+        return None
+
+    plt.figure(figsize=(12, 4.5))
+    ax = sns.heatmap(
+        pd.DataFrame(hours, index=WEEKDAY_LABELS, columns=range(24)),
+        cmap="YlOrRd", linewidths=0.5, cbar_kws={"label": "時間"},
+    )
+    # 土日を赤字
+    for tick_label in ax.get_yticklabels()[5:]:
+        tick_label.set_color("red")
+    plt.yticks(rotation=0)
+    plt.xlabel("時")
+    plt.ylabel("曜日")
+    plt.title(title)
+    plt.tight_layout()
+    return to_png(dpi=100)
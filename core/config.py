@@ -0,0 +1,99 @@
+"""
+Bot と API で共有する設定。値は環境変数（.env）から読み込む。
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# リポジトリ直下の data/ ディレクトリ
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(ROOT_DIR, "data"))
+VC_LOG_PATH = os.path.join(DATA_DIR, "vc_logs.csv")
+VC_SESSIONS_PATH = os.path.join(DATA_DIR, "vc_sessions.csv")
+
+# VCイベント書き込みのバッファ設定
+VC_LOG_BATCH_SIZE = int(os.getenv("VC_LOG_BATCH_SIZE", "100"))  # この件数たまったら書き込む
+VC_LOG_FLUSH_INTERVAL = float(os.getenv("VC_LOG_FLUSH_INTERVAL", "1.0"))  # 最大でこの秒数待ったら書き込む
+# 書き込みに失敗して再試行を待つ行の上限（イベント・セッションそれぞれ）。超えた分は古いものから捨てる
+VC_LOG_MAX_PENDING = int(os.getenv("VC_LOG_MAX_PENDING", "100000"))
+# fsync の方針: never(OSに任せる) / batch(書き込みごと) / interval(VC_LOG_FSYNC_INTERVAL 秒ごと)
+VC_LOG_FSYNC = os.getenv("VC_LOG_FSYNC", "interval")
+VC_LOG_FSYNC_INTERVAL = float(os.getenv("VC_LOG_FSYNC_INTERVAL", "30.0"))
+
+# 保存先: csv（data/vc_logs.csv）または sqlite（SQLITE_PATH）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "vc_logs.db"))
+
+# CSV のログのローテーション（core/archive.py）: month / week / off
+VC_LOG_ROTATE = os.getenv("VC_LOG_ROTATE", "month")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "gzip")  # gzip / zstd（zstandard が必要）
+ARCHIVE_CACHE_PARTITIONS = int(os.getenv("ARCHIVE_CACHE_PARTITIONS", "3"))  # パース済みで残しておくパーティション数
+
+# 日別の集計テーブル（core/rollups.py）の保存先
+ROLLUP_PATH = os.getenv("ROLLUP_PATH", os.path.join(DATA_DIR, "rollups.db"))
+
+# 日・時間の区切りの時間を計るタイムゾーン（core/intervals.py）。ログの時刻はこのタイムゾーンのローカル時刻として扱う。
+# 空にするとタイムゾーンなしの時刻の差をそのまま使う
+TIMEZONE = os.getenv("TIMEZONE", "Asia/Tokyo")
+
+# ギルドごとの保存先。DEFAULT_GUILD_ID のギルド（と guild_id なし）は上の data/ 直下のファイルを使い、
+# それ以外のギルドは GUILDS_DIR/<guild_id>/ に同じ名前のファイルを作る
+DEFAULT_GUILD_ID = int(os.getenv("DEFAULT_GUILD_ID")) if os.getenv("DEFAULT_GUILD_ID") else None
+GUILDS_DIR = os.getenv("GUILDS_DIR", os.path.join(DATA_DIR, "guilds"))
+
+# ギルドごとの設定（ログ用チャンネル・ロール名）の保存先と、設定がないギルドの既定値
+GUILD_SETTINGS_PATH = os.getenv("GUILD_SETTINGS_PATH", os.path.join(DATA_DIR, "guild_settings.json"))
+LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "1343442260431470612"))
+STUDY_ROLE_NAME = os.getenv("STUDY_ROLE_NAME", "勉強中")
+
+# ライブ配信（/api/v1/stream）で保存先を確認する間隔（秒）
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "1.0"))
+
+# API の集計を実行するスレッド数（同時に走る pandas の集計の上限）
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+
+# ユーザー別のセッション一覧（/api/v1/users/{user_id}/sessions）の1ページの上限と、
+# これを超えるページを何件ずつ読んで送るか
+USER_SESSIONS_MAX_LIMIT = int(os.getenv("USER_SESSIONS_MAX_LIMIT", "10000"))
+USER_SESSIONS_STREAM_ROWS = int(os.getenv("USER_SESSIONS_STREAM_ROWS", "1000"))
+
+# JSON に変換した API のレスポンス（core/response_cache.py）のキャッシュの上限（バイト）と、
+# gzip で圧縮して返すレスポンスの最小サイズ（バイト）
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+# 締まった過去の期間（先月以前の月次レポートなど）のレスポンスを、再検証せずにブラウザにキャッシュさせる秒数
+# （Cache-Control: max-age=...）。既定の 0 では他と同じく毎回 ETag（期間の集計の revision）で再検証させる。
+# 過去のログの取り込みや集計テーブルの作り直しで過去の期間も変わるので、長くしすぎないこと
+CLOSED_PERIOD_MAX_AGE = int(os.getenv("CLOSED_PERIOD_MAX_AGE", "0"))
+
+# 統計コマンドのグラフ描画用プロセスプール
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "8"))  # 実行中＋待ちの上限。超えたら断る
+
+# 描画済みグラフのキャッシュ（core/chart_cache.py）の上限（バイト）
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# 入室中のユーザーを実際のボイスチャンネルと突き合わせる間隔（秒）。leave を取りこぼした場合はこの間隔以内に閉じる
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# 「勉強中」ロールの付け外しの上限（ギルドごとに ROLE_UPDATE_PER 秒あたり ROLE_UPDATE_RATE 回）
+ROLE_UPDATE_RATE = int(os.getenv("ROLE_UPDATE_RATE", "10"))
+ROLE_UPDATE_PER = float(os.getenv("ROLE_UPDATE_PER", "10.0"))
+
+# ログ用テキストチャンネルへの入退室通知をまとめる間隔（秒）と、送信失敗時の再送回数
+LOG_NOTIFY_WINDOW = float(os.getenv("LOG_NOTIFY_WINDOW", "15"))
+LOG_NOTIFY_MAX_RETRIES = int(os.getenv("LOG_NOTIFY_MAX_RETRIES", "5"))
+
+# スラッシュコマンドの同期: auto（コマンドの定義が前回の同期から変わったときだけ）/ always / off
+COMMAND_SYNC = os.getenv("COMMAND_SYNC", "auto")
+COMMAND_SYNC_STATE_PATH = os.getenv("COMMAND_SYNC_STATE_PATH", os.path.join(DATA_DIR, "command_sync.json"))
+
+# Bot のメトリクス（core/metrics.py）の出力先。METRICS_PORT を指定すると METRICS_HOST:METRICS_PORT/metrics で、
+# METRICS_FILE を指定すると METRICS_INTERVAL 秒ごとにそのファイルへ書き出す（どちらも省略時は出力しない）
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+METRICS_FILE = os.getenv("METRICS_FILE") or None
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
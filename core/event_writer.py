@@ -0,0 +1,154 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from core.metrics import REGISTRY
+from core.storage import PartialWriteError
+
+_STOP = object()
+
+# イベントが起きてから保存先に書き込まれるまでの時間
+WRITE_LAG_SECONDS = REGISTRY.histogram(
+    "vc_event_write_lag_seconds", "イベントが起きてから保存先に書き込まれるまでの時間（秒）",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+class EventWriter:
+    """
+    VCイベントをメモリ上のキューに積み、バックグラウンドスレッドで保存先に書き込むライター。
+
+    write() / write_session() はキューに入れるだけなのでイベントループを止めない。
+    スレッド側は batch_size 件たまるか flush_interval 秒経つごとに
+    storage.append_events() / storage.append_sessions() でまとめて書き込む（fsync の方針は保存先が持つ）。
+    on_flush を渡すと、書き込みが成功するたびにライタースレッド上で呼ぶ。
+    書き込みに失敗した行は次回に再試行する（保存先が PartialWriteError を出したら、書き込めなかった行だけ）。
+    再試行を待つ行はイベント・セッションそれぞれ max_pending 件までで、超えた分は古いものから捨てて表示する。
+    close() で残りを書き切ってから終了する。
+    """
+
+    def __init__(self, storage, batch_size: int = 100, flush_interval: float = 1.0, on_flush=None,
+                 max_pending: int = 100_000):
+        self.storage = storage
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="vc-event-writer", daemon=True)
+        self._thread.start()
+        # close() が呼ばれずにプロセスが終了する場合も書き残しを出す
+        atexit.register(self.close)
+
+    def write(self, entry: dict):
+        """
+        イベントを1件キューに入れる。ブロックしない。
+        """
+        if self._closed:
+            raise RuntimeError("EventWriter は既に閉じられています。")
+        self._queue.put((False, entry))
+
+    def write_session(self, session: dict):
+        """
+        確定したセッションを1件キューに入れる。ブロックしない。
+        """
+        if self._closed:
+            raise RuntimeError("EventWriter は既に閉じられています。")
+        self._queue.put((True, session))
+
+    @property
+    def pending(self) -> int:
+        """
+        キューに入っていて、まだ書き込みを始めていない件数（おおよそ）。
+        """
+        return self._queue.qsize()
+
+    def close(self, timeout: float = None):
+        """
+        キューに残ったイベントをすべて書き込んでからスレッドを止める。
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+    def _run(self):
+        pending, pending_sessions = [], []
+        stopping = False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_interval
+            # batch_size 件たまるか、flush_interval 秒経つまで集める
+            while len(pending) + len(pending_sessions) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                is_session, row = item
+                (pending_sessions if is_session else pending).append(row)
+
+            if pending or pending_sessions:
+                # イベントを先に書く。失敗した側だけを次回に再試行する
+                written = pending
+                pending = self._flush(self.storage.append_events, pending)
+                if written and not pending:
+                    # バッチでいちばん古いイベントの待ち時間
+                    WRITE_LAG_SECONDS.observe((datetime.now() - written[0]["timestamp"]).total_seconds())
+                pending_sessions = self._flush(self.storage.append_sessions, pending_sessions)
+                pending = self._cap(pending, "イベント", "timestamp")
+                pending_sessions = self._cap(pending_sessions, "セッション", "end_time")
+                if not pending and not pending_sessions and self.on_flush is not None:
+                    try:
+                        self.on_flush()
+                    except Exception as e:
+                        print(f"VCログ書き込み後の処理でエラー: {e}")
+                if (pending or pending_sessions) and not stopping:
+                    # 書き込みに失敗した。少し待ってから再試行する
+                    time.sleep(self.flush_interval)
+
+        if pending or pending_sessions:
+            print(f"VCログ書き込みエラー: {len(pending)} 件のイベント、{len(pending_sessions)} 件のセッションを書き込めませんでした。")
+        try:
+            self.storage.close()
+        except Exception as e:
+            print(f"VCログ書き込みエラー: {e}")
+
+    def _flush(self, append, rows: list) -> list:
+        """
+        append(rows) で書き込み、書き込めなかった行を返す（次回に再試行する）。
+        一部のギルドだけ失敗した場合（PartialWriteError）はその行だけ、それ以外の失敗は rows をそのまま返す。
+        """
+        if not rows:
+            return rows
+        try:
+            append(rows)
+        except PartialWriteError as e:
+            print(f"VCログ書き込みエラー（{len(e.rows)}/{len(rows)} 件を再試行）: {e}")
+            return e.rows
+        except Exception as e:
+            print(f"VCログ書き込みエラー: {e}")
+            return rows
+        return []
+
+    def _cap(self, rows: list, label: str, time_key: str) -> list:
+        """
+        再試行を待つ行が max_pending 件を超えたら、古いものから捨てて件数と時刻の範囲を表示する。
+        """
+        excess = len(rows) - self.max_pending
+        if excess <= 0:
+            return rows
+        dropped = rows[:excess]
+        print(f"VCログ書き込みエラー: 再試行待ちが {self.max_pending} 件を超えたため、{label} {excess} 件を捨てました"
+              f"（{dropped[0].get(time_key)} 〜 {dropped[-1].get(time_key)}）。")
+        return rows[excess:]
@@ -0,0 +1,319 @@
+"""
+イベントログ（vc_logs.csv）をメモリ上に小さく持つための列指向の入れ物。
+
+DataFrame のまま持つと、行ごとに channel_name / action の文字列オブジェクトと
+object 型の列が残り、数百万行で数 GB になる。ここでは列ごとの NumPy 配列にして、
+値の種類が少ない列は辞書（添字 -> 値の表）で符号化する。
+
+  timestamps  int64   エポックからのマイクロ秒
+  users       uint*   user_ids の添字
+  channels    uint*   (channel_id, channel_name) の組の添字。名前が変わったチャンネルは別の組になる
+  actions     uint8   action_names の添字（0 = join, 1 = leave。欠損は MISSING_ACTION）
+  guilds      int*    guild_ids の添字（guild_id 列がないログ・空欄は -1）
+
+添字の列は表の大きさに合わせて最小の幅の整数にする（表が大きくなったら読み込み済みの分も広げる）。
+ユーザーが 65,535 人以下なら1行あたり 14 バイト（＋種類数に比例する表）。
+DataFrame が必要な処理には frame() / take() で必要な行だけを元の列の形に戻して渡す。
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from core.schema import LOG_COLUMNS
+
+ACTIONS = ("join", "leave")
+JOIN, LEAVE = 0, 1
+MISSING_ACTION = np.iinfo(np.uint8).max
+
+# 列の名前 -> 空のときの型（添字の列は表の大きさに合わせて狭くする）
+ARRAYS = {
+    "timestamps": np.int64,
+    "users": np.uint8,
+    "channels": np.uint8,
+    "actions": np.uint8,
+    "guilds": np.int8,
+}
+# 種類の少ない列は category として読み、値ごとに1回だけ変換する（行ごとの文字列を作らない）
+CATEGORY_COLUMNS = ("action", "channel_name", "channel_id", "guild_id")
+
+
+def _to_id(value) -> int:
+    """
+    CSV の ID の文字列を int にする。"123.0" のように小数で書かれたものも受け付ける。
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+
+class EventStore:
+    """
+    timestamp 順に追記されるイベントを、列ごとの配列のチャンクとして持つ。
+    チャンクが MAX_CHUNKS を超えたら1つにまとめる。スレッドセーフではない（LogCache のロックの内側で使う）。
+    """
+
+    MAX_CHUNKS = 64
+
+    def __init__(self, columns: list = None):
+        self.columns = list(columns or LOG_COLUMNS)
+        self.user_ids = []
+        self._user_codes = {}
+        # チャンネルの組の表: 添字 -> channel_id（欠損は None）/ names の添字（欠損は -1）
+        self.channel_ids = []
+        self._channel_name_codes = []
+        self._channel_codes = {}
+        self.names = []
+        self._name_codes = {}
+        self.action_names = list(ACTIONS)
+        self._action_codes = {name: i for i, name in enumerate(ACTIONS)}
+        self.guild_ids = []
+        self._guild_codes = {}
+        self._chunks = {name: [] for name in ARRAYS}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def nbytes(self) -> int:
+        """
+        配列の合計バイト数（表は含まない）。
+        """
+        return sum(chunk.nbytes for chunks in self._chunks.values() for chunk in chunks)
+
+    @property
+    def last_timestamp(self):
+        if not self._length:
+            return None
+        return pd.Timestamp(int(self._chunks["timestamps"][-1][-1]), unit="us")
+
+    def channel_names(self) -> dict:
+        """
+        channel_id -> 最後に記録されたチャンネル名。
+        """
+        table = {}
+        for channel_id, name_code in zip(self.channel_ids, self._channel_name_codes):
+            if channel_id is not None and name_code >= 0:
+                table[channel_id] = self.names[name_code]
+        return table
+
+    # ── 読み込み ─────────────────────────────────────────
+    def parse(self, data: bytes) -> dict:
+        """
+        ヘッダーなしの CSV のバイト列を、この入れ物の表で符号化した列の配列にする（timestamp 順に並べる）。
+        表には新しい値が足されるが、行は append() するまで増えない。
+        """
+        df = pd.read_csv(io.BytesIO(data), header=None, names=self.columns,
+                         dtype={col: "category" for col in self.columns if col in CATEGORY_COLUMNS})
+        n = len(df)
+        times = pd.to_datetime(df["timestamp"], format="ISO8601").dt.as_unit("us")
+        block = {
+            "timestamps": times.to_numpy().view(np.int64),
+            "users": self._encode(df["user_id"], self._user_code),
+            "channels": self._encode_channels(df),
+            "actions": self._encode_actions(df["action"]),
+            "guilds": (self._encode(df["guild_id"], self._guild_code) if "guild_id" in df.columns
+                       else np.full(n, -1, dtype=np.int32)),
+        }
+        timestamps = block["timestamps"]
+        if n > 1 and (timestamps[1:] < timestamps[:-1]).any():
+            order = np.argsort(timestamps, kind="stable")
+            block = {name: values[order] for name, values in block.items()}
+        return {
+            "timestamps": np.ascontiguousarray(block["timestamps"]),
+            "users": block["users"].astype(np.min_scalar_type(len(self.user_ids))),
+            "channels": block["channels"].astype(np.min_scalar_type(len(self.channel_ids))),
+            "actions": block["actions"],
+            "guilds": block["guilds"].astype(np.min_scalar_type(-len(self.guild_ids) - 1)),
+        }
+
+    @staticmethod
+    def _encode(values, code_of) -> np.ndarray:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values)
+        table = np.array([code_of(value) for value in uniques] + [-1], dtype=np.int32)
+        # 欠損（codes == -1）は table の最後の -1 になる
+        return table[codes]
+
+    def _user_code(self, user_id) -> int:
+        user_id = int(user_id)
+        code = self._user_codes.get(user_id)
+        if code is None:
+            code = self._user_codes[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return code
+
+    def _guild_code(self, guild_id) -> int:
+        guild_id = _to_id(guild_id)
+        code = self._guild_codes.get(guild_id)
+        if code is None:
+            code = self._guild_codes[guild_id] = len(self.guild_ids)
+            self.guild_ids.append(guild_id)
+        return code
+
+    def _channel_code(self, channel_id, name) -> int:
+        key = (channel_id, name)
+        code = self._channel_codes.get(key)
+        if code is None:
+            if name is None:
+                name_code = -1
+            else:
+                name_code = self._name_codes.get(name)
+                if name_code is None:
+                    name_code = self._name_codes[name] = len(self.names)
+                    self.names.append(name)
+            code = self._channel_codes[key] = len(self.channel_ids)
+            self.channel_ids.append(channel_id)
+            self._channel_name_codes.append(name_code)
+        return code
+
+    def _encode_channels(self, df: pd.DataFrame) -> np.ndarray:
+        # (ID, 名前) の組を小さい整数にまとめてから、組ごとに1回だけ表を引く
+        ids = df["channel_id"].astype("category")
+        id_codes, id_uniques = ids.cat.codes.to_numpy(), ids.cat.categories
+        names = df["channel_name"].astype("category")
+        name_codes = names.cat.codes.to_numpy().astype(np.int64)
+        categories = names.cat.categories
+        width = len(categories) + 1
+        keys, inverse = np.unique((id_codes.astype(np.int64) + 1) * width + (name_codes + 1), return_inverse=True)
+        table = np.empty(len(keys), dtype=np.int32)
+        for i, key in enumerate(keys):
+            id_code, name_code = divmod(int(key), width)
+            table[i] = self._channel_code(
+                _to_id(id_uniques[id_code - 1]) if id_code else None,
+                str(categories[name_code - 1]) if name_code else None,
+            )
+        return table[inverse.reshape(-1)]
+
+    def _encode_actions(self, actions: pd.Series) -> np.ndarray:
+        actions = actions.astype("category")
+        table = []
+        for name in actions.cat.categories:
+            name = str(name)
+            code = self._action_codes.get(name)
+            if code is None:
+                code = self._action_codes[name] = len(self.action_names)
+                self.action_names.append(name)
+            table.append(code)
+        table.append(MISSING_ACTION)
+        return np.array(table, dtype=np.uint8)[actions.cat.codes.to_numpy()]
+
+    def append(self, block: dict):
+        """
+        parse() の結果を後ろに足す。
+        """
+        size = len(block["timestamps"])
+        if not size:
+            return
+        for name in ARRAYS:
+            chunks = self._chunks[name]
+            if chunks and chunks[0].dtype != block[name].dtype:
+                # 表が大きくなって添字の幅が広がった
+                dtype = np.result_type(chunks[0], block[name])
+                self._chunks[name] = chunks = [chunk.astype(dtype) for chunk in chunks]
+                block[name] = block[name].astype(dtype)
+            chunks.append(block[name])
+        self._length += size
+        if len(self._chunks["timestamps"]) > self.MAX_CHUNKS:
+            self._compact()
+
+    def _compact(self):
+        for name, chunks in self._chunks.items():
+            if len(chunks) > 1:
+                self._chunks[name] = [np.concatenate(chunks)]
+
+    def sort(self):
+        """
+        全体を timestamp 順に並べ直す（同じ時刻の行は元の順のまま）。
+        """
+        self._compact()
+        if not self._length:
+            return
+        timestamps = self._chunks["timestamps"][0]
+        if (timestamps[1:] < timestamps[:-1]).any():
+            order = np.argsort(timestamps, kind="stable")
+            for name, chunks in self._chunks.items():
+                chunks[0] = chunks[0][order]
+
+    # ── 取り出し ─────────────────────────────────────────
+    def _slice(self, start: int, stop: int) -> dict:
+        parts = {name: [] for name in ARRAYS}
+        offset = 0
+        for i, chunk in enumerate(self._chunks["timestamps"]):
+            end = offset + len(chunk)
+            if end > start and offset < stop:
+                lo, hi = max(start - offset, 0), min(stop, end) - offset
+                for name in ARRAYS:
+                    parts[name].append(self._chunks[name][i][lo:hi])
+            offset = end
+        return {name: np.concatenate(values) if values else np.empty(0, dtype=ARRAYS[name])
+                for name, values in parts.items()}
+
+    def _gather(self, rows: np.ndarray) -> dict:
+        rows = np.asarray(rows, dtype=np.int64)
+        ends = np.cumsum([len(chunk) for chunk in self._chunks["timestamps"]])
+        which = np.searchsorted(ends, rows, side="right")
+        out = {name: np.empty(len(rows), dtype=chunks[0].dtype if chunks else ARRAYS[name])
+               for name, chunks in self._chunks.items()}
+        for i in np.unique(which):
+            mask = which == i
+            local = rows[mask] - (ends[i - 1] if i else 0)
+            for name in ARRAYS:
+                out[name][mask] = self._chunks[name][i][local]
+        return out
+
+    def frame(self, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        start 行目から stop 行目の手前までを、CSV を read_csv した場合と同じ列の DataFrame で返す。
+        channel_id / guild_id は Int64、action / channel_name は category 型。
+        """
+        stop = self._length if stop is None else min(stop, self._length)
+        return self._frame(self._slice(start, max(start, stop)))
+
+    def take(self, rows) -> pd.DataFrame:
+        """
+        rows（行番号の配列）の行を、その順に DataFrame で返す。
+        """
+        return self._frame(self._gather(rows))
+
+    def _frame(self, block: dict) -> pd.DataFrame:
+        channels = block["channels"]
+        name_codes = np.asarray(self._channel_name_codes, dtype=np.int64)
+        actions = block["actions"].astype(np.int16)
+        actions[actions == MISSING_ACTION] = -1
+        data = {}
+        for col in self.columns:
+            if col == "user_id":
+                data[col] = np.asarray(self.user_ids, dtype=np.int64)[block["users"]]
+            elif col == "timestamp":
+                data[col] = block["timestamps"].view("datetime64[us]")
+            elif col == "action":
+                data[col] = pd.Categorical.from_codes(actions, categories=self.action_names)
+            elif col == "channel_id":
+                data[col] = pd.array(self.channel_ids, dtype="Int64").take(channels)
+            elif col == "channel_name":
+                data[col] = pd.Categorical.from_codes(name_codes[channels] if len(channels) else channels,
+                                                      categories=self.names)
+            elif col == "guild_id":
+                data[col] = pd.array(self.guild_ids, dtype="Int64").take(block["guilds"], allow_fill=True)
+        return pd.DataFrame(data, columns=self.columns)
+
+    def last_joins(self, rows: np.ndarray) -> np.ndarray:
+        """
+        rows（行番号の昇順）のうち、ユーザーごとに最後の join / leave が join の行番号を昇順で返す。
+        leave 待ちの join（入室中のユーザー）を、追記分の行番号と合わせて渡して持ち越す用。
+        """
+        if not len(rows):
+            return np.empty(0, dtype=np.int64)
+        block = self._gather(rows)
+        moves = np.flatnonzero((block["actions"] == JOIN) | (block["actions"] == LEAVE))
+        users = block["users"][moves]
+        # 逆順で最初に出てくる位置 = そのユーザーの最後の join / leave
+        _, last = np.unique(users[::-1], return_index=True)
+        last = moves[len(moves) - 1 - last]
+        last = np.sort(last[block["actions"][last] == JOIN])
+        return np.asarray(rows, dtype=np.int64)[last]
@@ -0,0 +1,64 @@
+"""
+ギルドごとの設定（ログ用チャンネル・「勉強中」ロールの名前）。
+
+data/guild_settings.json に {"<guild_id>": {"log_channel_id": ..., "role_name": ...}} の形で保存する。
+設定のない項目は .env の LOG_CHANNEL_ID / STUDY_ROLE_NAME を使う。
+"""
+import json
+import os
+import threading
+
+from core import config
+
+
+class GuildSettings:
+    KEYS = ("log_channel_id", "role_name")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._settings = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._settings = json.load(f)
+
+    @staticmethod
+    def defaults() -> dict:
+        return {"log_channel_id": config.LOG_CHANNEL_ID, "role_name": config.STUDY_ROLE_NAME}
+
+    def get(self, guild_id: int) -> dict:
+        return {**self.defaults(), **self._settings.get(str(guild_id), {})}
+
+    def update(self, guild_id: int, **values):
+        """
+        指定した項目だけを変更して保存する。値に None を渡すと既定値に戻す。
+        """
+        with self._lock:
+            current = dict(self._settings.get(str(guild_id), {}))
+            for key, value in values.items():
+                if key not in self.KEYS:
+                    raise KeyError(f"不明な設定項目です: {key}")
+                if value is None:
+                    current.pop(key, None)
+                else:
+                    current[key] = value
+            self._settings[str(guild_id)] = current
+
+            # 書き込み途中で落ちても壊れないよう、一時ファイルに書いてから置き換える
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._settings, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def get_guild_settings() -> GuildSettings:
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            _settings = GuildSettings(config.GUILD_SETTINGS_PATH)
+        return _settings
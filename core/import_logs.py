@@ -0,0 +1,746 @@
+"""
+過去のログ（任意の数の CSV）を保存先へまとめて取り込むツール。
+
+data/vc_logs copy.csv や data/vc_logs_stash.csv のような手元のログや、ほかの Bot から書き出したログを、
+ファイル全体をメモリに載せずに取り込む。どのファイルも chunk_rows 行ずつ読み、次の順に処理する。
+  1. 列を LOG_COLUMNS に揃える（migrate_csv と同じく channel 列は channel_name として扱い、
+     channel_id / channel_name の欠けている側は他の行から補う。--column で列名の対応も指定できる。
+     チャンネル ID を記録していない古いログは、--channel で名前から ID を指定できる。
+     ID を補えなかった入退室はセッションにできないので、チャンネル名ごとの行数を報告する）
+  2. timestamp を "YYYY-MM-DD HH:MM:SS.ffffff" のローカル時刻に揃える
+     （タイムゾーン付きの時刻・UNIX 時間（秒 / ミリ秒 / マイクロ秒）も変換する。読めない行は数えて捨てる）
+  3. チャンクごとに timestamp 順に並べて一時ファイル（ラン）に書き、すべてのランを1行ずつマージする（外部ソート）
+  4. 同じ (user_id, timestamp, action, channel_id) のイベントは1つにする（保存先にある行を優先する）
+保存先にある既存のイベントも同じようにランにしてマージするので、取り込んだログは既存のログの間に時刻順に入る。
+セッションはマージした全イベントから作り直し（calculate_sessions と同じ規則）、
+最後に集計テーブルを作り直す（ランキングなどは集計テーブルの変更から追従する）。
+
+メモリに載るのは1チャンク分と、ユーザーごとの入室状態・チャンネル名の対応表、
+CSV の保存先のアーカイブに書く1期間分（core/archive.py と同じ単位）だけ。
+ランとマージの結果は保存先と同じディレクトリの一時ディレクトリに書く（入力と同程度の空き容量が要る）。
+
+保存先への反映:
+  - csv: 取り込み前のファイル（vc_logs.csv / vc_sessions.csv / archive/）は import_backup/<日時>/ に移す。
+    ローテーションが有効なら、今の期間より前の分はアーカイブのパーティションとして書く
+  - sqlite: 1つのトランザクションで、新しいイベントの追加とセッション・入室中の一覧の置き換えを行う
+取り込み中に Bot が書き込んだ分は、反映の直前に取り込み結果の後ろに足す（止めずに実行できる）。
+
+実行例:
+    python -m core.import_logs "data/vc_logs copy.csv" data/vc_logs_stash.csv
+    python -m core.import_logs export.csv --column time=timestamp --column event=action --timezone Asia/Tokyo
+    python -m core.import_logs "data/vc_logs copy.csv" --channel "おべんきょ=1343562343010926593"
+    python -m core.import_logs big/*.csv.gz --guild-id 123456789012345678 --dry-run
+"""
+import argparse
+import csv
+import heapq
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from operator import itemgetter
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from core import config
+from core.archive import LogArchive, next_period, period_start
+from core.intervals import timezone
+from core.rollups import get_rollups
+from core.schema import LOG_COLUMNS
+from core.sessions import SESSION_COLUMNS
+from core.storage import CSVStorage, SQLiteStorage, file_lock, get_storage
+
+CHUNK_ROWS = 200_000
+# 同時に開くランの数の上限。超える場合は先にいくつかずつマージしてまとめる
+MAX_OPEN_RUNS = 64
+# ランの列。timestamp（固定長の文字列なので文字列の大小がそのまま時刻順）と origin（0: 保存先 / 1: 取り込むファイル）で並べる
+RUN_COLUMNS = ["timestamp", "origin", "user_id", "action", "channel_id", "channel_name", "guild_id"]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+TZ_SUFFIX = r"(?:Z|[+-]\d{2}:?\d{2})$"
+TZ_SPLIT = r"^(.*?)(Z|[+-]\d{2}:?\d{2})$"
+FIXED_TIMESTAMP = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{6}")
+ACTIONS = ("join", "leave")
+
+
+def _rate(rows: int, seconds: float) -> str:
+    return f"{rows:,} 行 / {seconds:.1f} 秒（{rows / max(seconds, 1e-9):,.0f} 行/秒）"
+
+
+# ── 正規化 ───────────────────────────────────────────────
+def normalize_timestamps(values: pd.Series, tz) -> pd.Series:
+    """
+    時刻の文字列を TIMESTAMP_FORMAT のローカル時刻（tz）の文字列にする。読めないものは欠損。
+      - タイムゾーンなし: そのまま（Bot のログと同じくローカル時刻とみなす）
+      - タイムゾーン付き: tz に変換してタイムゾーンを外す
+      - 数値: UNIX 時間。桁数で秒 / ミリ秒 / マイクロ秒を判断する
+    """
+    # Bot のログの大部分は既にこの書式なので、パースせずにそのまま使う
+    fixed = [bool(FIXED_TIMESTAMP.fullmatch(v)) for v in values]
+    if all(fixed):
+        return values
+    out = values.where(fixed)
+    values = values[[not f for f in fixed]].str.strip()
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[us]")
+    numeric = values.str.fullmatch(r"\d+(?:\.\d+)?")
+    aware = ~numeric & values.str.contains(TZ_SUFFIX, regex=True)
+    naive = ~numeric & ~aware & (values != "")
+    if naive.any():
+        ts = pd.to_datetime(values[naive], format="ISO8601", errors="coerce")
+        failed = ts.isna()
+        if failed.any():
+            # 2025/02/23 23:44 のような ISO 8601 でない書式
+            ts[failed] = pd.to_datetime(values[naive][failed], format="mixed", errors="coerce")
+        parsed[naive] = ts.dt.as_unit("us")
+    if aware.any():
+        # 時差付きのまま読むと遅いので、時差を切り離して読み、UTC に直してから tz に変換する
+        parts = values[aware].str.extract(TZ_SPLIT)
+        offsets = {text: _utc_offset(text) for text in parts[1].unique()}
+        ts = pd.to_datetime(parts[0], format="ISO8601", errors="coerce") - parts[1].map(offsets)
+        parsed[aware] = ts.dt.tz_localize("UTC").dt.tz_convert(tz).dt.tz_localize(None).dt.as_unit("us")
+    if numeric.any():
+        numbers = values[numeric].astype(float)
+        for unit, low, high in (("s", 0, 1e11), ("ms", 1e11, 1e14), ("us", 1e14, float("inf"))):
+            selected = (numbers >= low) & (numbers < high)
+            if not selected.any():
+                continue
+            raw = values[numeric][selected]
+            # 整数はそのまま、小数（秒の端数）はマイクロ秒に丸める
+            amounts = raw.astype("int64") if raw.str.isdigit().all() else numbers[selected]
+            ts = pd.to_datetime(amounts, unit=unit, utc=True, errors="coerce").dt.round("us")
+            parsed[selected[selected].index] = ts.dt.tz_convert(tz).dt.tz_localize(None).dt.as_unit("us")
+    valid = parsed.notna().to_numpy()
+    # strftime より速い numpy の書式化（"YYYY-MM-DDTHH:MM:SS.ffffff"）
+    text = np.datetime_as_string(parsed[valid].to_numpy(dtype="datetime64[us]"), unit="us")
+    out.loc[parsed.index[valid]] = np.char.replace(text, "T", " ")
+    return out
+
+
+def _utc_offset(text: str) -> pd.Timedelta:
+    if text == "Z":
+        return pd.Timedelta(0)
+    sign = -1 if text[0] == "-" else 1
+    digits = text[1:].replace(":", "")
+    return sign * pd.Timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+
+
+def _normalize_id(value: str) -> str:
+    value = value.strip()
+    # 浮動小数点で書き出された ID（"123.0"）も整数の文字列にする。桁の多い ID は float にしない
+    head, dot, tail = value.partition(".")
+    return head if dot and head.isdigit() and tail.strip("0") == "" else value
+
+
+def _normalize_ids(values: pd.Series) -> list:
+    return [v if v.isdigit() or not v else _normalize_id(v) for v in values]
+
+
+class Normalizer:
+    """
+    いろいろな列構成の CSV のチャンク（文字列のまま読んだもの）を RUN_COLUMNS に揃える。
+    channel_id と channel_name の対応は、事前に scan() した全ファイルの行から作る（channel_map で指定した名前が優先）。
+    ID を補えなかった入退室の行数は、チャンネル名ごとに unresolved に数える。
+    """
+
+    def __init__(self, column_map: dict = None, guild_id: int = None, tz=None, channel_map: dict = None):
+        self.column_map = column_map or {}
+        self.guild_id = "" if guild_id is None else str(guild_id)
+        self.tz = tz
+        self.channel_map = {name: _normalize_id(str(channel_id)) for name, channel_id in (channel_map or {}).items()}
+        self.id_by_name = dict(self.channel_map)
+        self.name_by_id = {}
+        self.invalid = 0
+        self.unresolved = {}
+
+    def _columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.rename(columns=self.column_map)
+        if "channel" in df.columns and "channel_name" not in df.columns:
+            df = df.rename(columns={"channel": "channel_name"})
+        return df.reindex(columns=LOG_COLUMNS, fill_value="")
+
+    def scan(self, df: pd.DataFrame):
+        """
+        channel_id と channel_name が両方ある行から対応表を作る（後から読んだ行を優先する）。
+        """
+        df = self._columns(df)
+        known = df[(df["channel_id"] != "") & (df["channel_name"] != "")]
+        ids = _normalize_ids(known["channel_id"])
+        self.id_by_name.update(zip(known["channel_name"], ids))
+        self.id_by_name.update(self.channel_map)
+        self.name_by_id.update(zip(ids, known["channel_name"]))
+
+    def __call__(self, df: pd.DataFrame, origin: int) -> pd.DataFrame:
+        df = self._columns(df)
+        df["user_id"] = _normalize_ids(df["user_id"])
+        df["channel_id"] = _normalize_ids(df["channel_id"])
+        df["guild_id"] = [v or self.guild_id for v in _normalize_ids(df["guild_id"])]
+        df["action"] = [v if v in ACTIONS else v.strip().lower() for v in df["action"]]
+        df["timestamp"] = normalize_timestamps(df["timestamp"], self.tz)
+
+        missing_id = df["channel_id"] == ""
+        df.loc[missing_id, "channel_id"] = df.loc[missing_id, "channel_name"].map(self.id_by_name).fillna("")
+        missing_name = df["channel_name"] == ""
+        df.loc[missing_name, "channel_name"] = df.loc[missing_name, "channel_id"].map(self.name_by_id).fillna("")
+
+        valid = (
+            df["timestamp"].notna()
+            & pd.Series([v.isdigit() for v in df["user_id"]], index=df.index)
+            & df["action"].isin(ACTIONS)
+        )
+        self.invalid += int((~valid).sum())
+        df = df[valid].assign(origin=str(origin))
+        unresolved = df.loc[df["channel_id"] == "", "channel_name"]
+        for name, rows in unresolved.value_counts().items():
+            self.unresolved[name] = self.unresolved.get(name, 0) + int(rows)
+        return df[RUN_COLUMNS]
+
+
+# ── 入力 ─────────────────────────────────────────────────
+def read_chunks(path: str, chunk_rows: int):
+    """
+    CSV を文字列のまま chunk_rows 行ずつ読む（.gz などの圧縮ファイルも可）。
+    1行ずつの処理が多いので、pandas の文字列型ではなく Python の str の配列（object）にする。
+    """
+    return pd.read_csv(path, dtype=object, keep_default_na=False, chunksize=chunk_rows)
+
+
+class CSVSource:
+    """
+    CSV の保存先の既存のイベント。アーカイブのパーティションと、開始時点の vc_logs.csv（その時点のサイズまで）。
+    """
+
+    def __init__(self, storage: CSVStorage, staging_dir: str):
+        self.storage = storage
+        self.manifest = storage.archive.manifest()
+        self.archive_version = storage.archive.version
+        self.hot = {}
+        for name, path in (("events", storage.path), ("sessions", storage.sessions_path)):
+            try:
+                st = os.stat(path)
+                self.hot[name] = (st.st_ino, st.st_size)
+            except FileNotFoundError:
+                self.hot[name] = (None, 0)
+        # 読んでいる間にも追記されるので、開始時点までのバイト列を写しておく
+        self.hot_copy = os.path.join(staging_dir, "hot_events.csv")
+        with open(self.hot_copy, "wb") as out:
+            if self.hot["events"][0] is not None:
+                with open(storage.path, "rb") as f:
+                    _copy_bytes(f, out, self.hot["events"][1])
+
+    def paths(self) -> list:
+        paths = [
+            os.path.join(self.storage.archive.directory, p["events"]["file"])
+            for p in self.manifest["partitions"] if p.get("events")
+        ]
+        if os.path.getsize(self.hot_copy):
+            paths.append(self.hot_copy)
+        return paths
+
+    def chunks(self, chunk_rows: int):
+        for path in self.paths():
+            yield from read_chunks(path, chunk_rows)
+
+
+class SQLiteSource:
+    """
+    SQLite の保存先の既存のイベント（開始時点の最大の id まで）。
+    """
+
+    def __init__(self, storage: SQLiteStorage):
+        self.storage = storage
+        conn = storage.connection()
+        self.max_event_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self.max_session_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sessions").fetchone()[0]
+
+    def chunks(self, chunk_rows: int):
+        cursor = self.storage.connection().execute(
+            f"SELECT {', '.join(LOG_COLUMNS)} FROM events WHERE id <= ? ORDER BY id", (self.max_event_id,),
+        )
+        while rows := cursor.fetchmany(chunk_rows):
+            yield pd.DataFrame(
+                [["" if v is None else str(v) for v in row] for row in rows], columns=LOG_COLUMNS,
+            )
+
+
+def _copy_bytes(src, dst, length: int = None):
+    remaining = length
+    while remaining is None or remaining > 0:
+        block = src.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+        if not block:
+            break
+        dst.write(block)
+        if remaining is not None:
+            remaining -= len(block)
+
+
+# ── 外部ソート ───────────────────────────────────────────
+class RunWriter:
+    """
+    チャンクを timestamp 順に並べて、ヘッダーなしの CSV（ラン）として書く。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.paths = []
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        # 同じ時刻の行は元の順（同じファイル内の leave → join など）を保つ
+        df = df.sort_values(["timestamp", "origin"], kind="stable")
+        path = os.path.join(self.directory, f"run_{len(self.paths):06d}.csv")
+        df.to_csv(path, header=False, index=False, lineterminator="\n")
+        self.paths.append(path)
+        self.rows += len(df)
+
+
+def _read_run(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.reader(f)
+
+
+def merge_runs(paths: list, directory: str):
+    """
+    ランを (timestamp, origin) 順にマージした行を返す。同じ値の行は paths の順（＝読んだ順）。
+    ランが MAX_OPEN_RUNS を超える場合は、先に MAX_OPEN_RUNS 個ずつマージしたランにまとめる。
+    """
+    level = 0
+    while len(paths) > MAX_OPEN_RUNS:
+        merged = []
+        for i in range(0, len(paths), MAX_OPEN_RUNS):
+            group = paths[i:i + MAX_OPEN_RUNS]
+            path = os.path.join(directory, f"merge_{level}_{i // MAX_OPEN_RUNS:06d}.csv")
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f, lineterminator="\n").writerows(
+                    heapq.merge(*(_read_run(p) for p in group), key=itemgetter(0, 1))
+                )
+            for p in group:
+                os.remove(p)
+            merged.append(path)
+        paths, level = merged, level + 1
+    return heapq.merge(*(_read_run(p) for p in paths), key=itemgetter(0, 1))
+
+
+# ── マージ・セッションの計算 ─────────────────────────────
+class MergeResult:
+    def __init__(self):
+        self.events = 0
+        self.new_events = 0
+        self.duplicates = 0
+        self.sessions = 0
+        # チャンネル ID を補えなかったためにセッションにできなかった leave
+        self.unresolved = 0
+        # 最後まで leave のない join（ユーザーごと）
+        self.open_joins = {}
+        # boundary の時点で入室中だった join の (user_id, timestamp, action, channel_id)
+        self.carried = set()
+
+
+def merge_events(rows, events_path: str, sessions_path: str, boundary: str = None) -> MergeResult:
+    """
+    時刻順の行から重複を除いて events_path に書き、セッションを sessions_path に書く（end_time 順）。
+    ペアリングの規則は calculate_sessions と同じ:
+      join はそのユーザーの直前の join を上書きし、leave は直前の join と同じチャンネルのときだけセッションになる。
+      leave の後は状態を破棄する。チャンネル ID を補えなかった join / leave はセッションにできないので、
+      その leave の数を unresolved に数える。
+    """
+    result = MergeResult()
+    seen_time, seen = None, set()
+    with open(events_path, "w", newline="", encoding="utf-8") as ef, \
+            open(sessions_path, "w", newline="", encoding="utf-8") as sf:
+        events_out = csv.writer(ef, lineterminator="\n")
+        sessions_out = csv.writer(sf, lineterminator="\n")
+        events_out.writerow(RUN_COLUMNS)
+        sessions_out.writerow(SESSION_COLUMNS)
+        for row in rows:
+            ts, origin, user_id, action, channel_id, channel_name, _ = row
+            # 重複は同じ時刻の行どうしにしかないので、今の時刻の行のキーだけを覚えておく
+            if ts != seen_time:
+                if boundary is not None and seen_time is not None and seen_time < boundary <= ts:
+                    result.carried = {_event_key(join) for join in result.open_joins.values()}
+                seen_time, seen = ts, set()
+            key = (user_id, action, channel_id)
+            if key in seen:
+                result.duplicates += 1
+                continue
+            seen.add(key)
+            events_out.writerow(row)
+            result.events += 1
+            result.new_events += origin == "1"
+
+            if action == "join":
+                result.open_joins[user_id] = row
+                continue
+            join = result.open_joins.pop(user_id, None)
+            if join is None:
+                continue
+            if channel_id == "" or join[4] == "":
+                result.unresolved += 1
+                continue
+            if join[4] != channel_id:
+                continue
+            start, end = datetime.fromisoformat(join[0]), datetime.fromisoformat(ts)
+            sessions_out.writerow(
+                [user_id, channel_id, channel_name, join[0], ts, (end - start).total_seconds() / 3600.0]
+            )
+            result.sessions += 1
+        if boundary is not None and (seen_time is None or seen_time < boundary):
+            result.carried = {_event_key(join) for join in result.open_joins.values()}
+    return result
+
+
+def _event_key(row) -> tuple:
+    return row[2], row[0], row[3], row[4]
+
+
+def _staged_rows(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        yield from reader
+
+
+# ── 保存先への反映 ───────────────────────────────────────
+def _header(path: str, default: list) -> list:
+    """
+    既存のファイルのヘッダーの列（なければ default）。取り込み中の追記分をそのまま足せるよう列を合わせる。
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            header = f.readline().strip().split(",")
+    except FileNotFoundError:
+        return default
+    return header if set(header) <= set(default) else default
+
+
+def install_csv(storage: CSVStorage, source: CSVSource, staging_dir: str, events_path: str, sessions_path: str,
+                result: MergeResult, boundary: datetime, chunk_rows: int) -> str:
+    """
+    マージ結果から新しい vc_logs.csv / vc_sessions.csv / archive/ を作り、取り込み前のものと入れ替える。
+    取り込み前のファイルを移したバックアップのディレクトリを返す。
+    """
+    period = storage.rotate_period
+    boundary_text = boundary.strftime(TIMESTAMP_FORMAT) if boundary is not None else None
+    archive_dir = os.path.join(staging_dir, "archive")
+    archive = LogArchive(archive_dir, storage.archive.compression)
+    event_columns = _header(storage.path, LOG_COLUMNS)
+    session_columns = _header(storage.sessions_path, SESSION_COLUMNS)
+    hot_events = os.path.join(staging_dir, "vc_logs.csv")
+    hot_sessions = os.path.join(staging_dir, "vc_sessions.csv")
+
+    def flush(kind: str, rows: list):
+        if not rows:
+            return
+        if kind == "events":
+            events = pd.DataFrame(rows, columns=RUN_COLUMNS)[LOG_COLUMNS]
+            sessions = pd.DataFrame(columns=SESSION_COLUMNS)
+            times = pd.to_datetime(events["timestamp"], format="ISO8601")
+        else:
+            events = pd.DataFrame(columns=LOG_COLUMNS)
+            sessions = pd.DataFrame(rows, columns=SESSION_COLUMNS)
+            times = pd.Series([], dtype="datetime64[us]")
+        archive.add(events, times, sessions, period, boundary)
+        rows.clear()
+
+    # イベント: boundary より前（持ち越す入室中の join を除く）はアーカイブへ、残りは今のファイルへ
+    positions = {name: i for i, name in enumerate(RUN_COLUMNS)}
+    with open(hot_events, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f, lineterminator="\n")
+        out.writerow(event_columns)
+        pending, pending_end = [], None
+        for row in _staged_rows(events_path):
+            if boundary_text is not None and row[0] < boundary_text and _event_key(row) not in result.carried:
+                if pending_end is not None and row[0] >= pending_end:
+                    flush("events", pending)
+                if not pending:
+                    start = period_start(datetime.fromisoformat(row[0]), period)
+                    pending_end = next_period(start, period).strftime(TIMESTAMP_FORMAT)
+                pending.append(row)
+                if len(pending) >= chunk_rows * 10:
+                    # 1期間が大きすぎる場合は分けて書く（LogArchive.add が同じパーティションに足し込む）
+                    flush("events", pending)
+                continue
+            out.writerow([row[positions[col]] for col in event_columns])
+        flush("events", pending)
+
+    # セッション: boundary より前に終わったものはアーカイブへ
+    with open(hot_sessions, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f, lineterminator="\n")
+        out.writerow(session_columns)
+        pending, pending_end = [], None
+        for row in _staged_rows(sessions_path):
+            if boundary_text is not None and row[4] < boundary_text:
+                if pending_end is not None and row[4] >= pending_end:
+                    flush("sessions", pending)
+                if not pending:
+                    start = period_start(datetime.fromisoformat(row[4]), period)
+                    pending_end = next_period(start, period).strftime(TIMESTAMP_FORMAT)
+                pending.append(row)
+                if len(pending) >= chunk_rows * 10:
+                    flush("sessions", pending)
+                continue
+            out.writerow([dict(zip(SESSION_COLUMNS, row)).get(col, "") for col in session_columns])
+        flush("sessions", pending)
+    if boundary is not None and not os.path.exists(archive.manifest_path):
+        # アーカイブに移す行がなくても、今のファイルが boundary からであることを記録する
+        archive.add(pd.DataFrame(columns=LOG_COLUMNS), pd.Series([], dtype="datetime64[us]"),
+                    pd.DataFrame(columns=SESSION_COLUMNS), period, boundary)
+
+    backup_dir = os.path.join(os.path.dirname(os.path.abspath(storage.path)), "import_backup",
+                              datetime.now().strftime("%Y%m%d-%H%M%S"))
+    with file_lock(storage.lock_path):
+        # 取り込み中にローテーションされていたら、読んだ内容が古いのでやり直してもらう
+        if storage.archive.version != source.archive_version:
+            raise RuntimeError("取り込み中にログのローテーションが行われました。もう一度実行してください。")
+        for name, path, staged in (("events", storage.path, hot_events), ("sessions", storage.sessions_path, hot_sessions)):
+            inode, size = source.hot[name]
+            if inode is None:
+                continue
+            st = os.stat(path)
+            if st.st_ino != inode or st.st_size < size:
+                raise RuntimeError(f"取り込み中に {path} が置き換えられました。もう一度実行してください。")
+            # 取り込み中に Bot が追記した分を後ろに足す
+            with open(path, "rb") as src, open(staged, "ab") as dst:
+                src.seek(size)
+                _copy_bytes(src, dst)
+
+        os.makedirs(backup_dir)
+        for path in (storage.path, storage.sessions_path):
+            if os.path.exists(path):
+                os.replace(path, os.path.join(backup_dir, os.path.basename(path)))
+        if os.path.isdir(storage.archive.directory):
+            os.replace(storage.archive.directory, os.path.join(backup_dir, os.path.basename(storage.archive.directory)))
+        if os.path.isdir(archive_dir):
+            os.replace(archive_dir, storage.archive.directory)
+        os.replace(hot_sessions, storage.sessions_path)
+        os.replace(hot_events, storage.path)
+    return backup_dir
+
+
+def install_sqlite(storage: SQLiteStorage, source: SQLiteSource, events_path: str, sessions_path: str,
+                   result: MergeResult, chunk_rows: int):
+    """
+    1つのトランザクションで、新しいイベントを追加し、セッションと入室中の一覧を置き換える。
+    取り込み開始後に Bot が書き込んだセッション・イベントは残す。
+    """
+    def ids(value: str):
+        return int(value) if value else None
+
+    def batches(rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    conn = storage.connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        latest_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        new_events = (
+            (int(user_id), ts, action, ids(channel_id), channel_name or None, ids(guild_id))
+            for ts, origin, user_id, action, channel_id, channel_name, guild_id in _staged_rows(events_path)
+            if origin == "1"
+        )
+        for batch in batches(new_events):
+            conn.executemany(
+                "INSERT INTO events (user_id, timestamp, action, channel_id, channel_name, guild_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch,
+            )
+
+        conn.execute("DELETE FROM sessions WHERE id <= ?", (source.max_session_id,))
+        sessions = (
+            (int(user_id), ids(channel_id), channel_name or None, start, end, float(hours))
+            for user_id, channel_id, channel_name, start, end, hours in _staged_rows(sessions_path)
+        )
+        for batch in batches(sessions):
+            conn.executemany(
+                "INSERT INTO sessions (user_id, channel_id, channel_name, start_time, end_time, duration_hour) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch,
+            )
+
+        conn.execute("DELETE FROM open_sessions")
+        conn.executemany(
+            "INSERT INTO open_sessions (user_id, channel_id, channel_name, start_time) VALUES (?, ?, ?, ?)",
+            [(int(row[2]), ids(row[4]), row[5] or None, row[0]) for row in result.open_joins.values()],
+        )
+        # 取り込み開始後の Bot のイベントで、入室中の一覧を進める（append_events と同じ規則）
+        later = conn.execute(
+            "SELECT user_id, timestamp, action, channel_id, channel_name FROM events WHERE id > ? AND id <= ? ORDER BY id",
+            (source.max_event_id, latest_id),
+        ).fetchall()
+        for user_id, ts, action, channel_id, channel_name in later:
+            if action == "join":
+                conn.execute(
+                    "INSERT OR REPLACE INTO open_sessions (user_id, channel_id, channel_name, start_time) VALUES (?, ?, ?, ?)",
+                    (user_id, channel_id, channel_name, ts),
+                )
+            elif action == "leave":
+                conn.execute("DELETE FROM open_sessions WHERE user_id = ?", (user_id,))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# ── 実行 ─────────────────────────────────────────────────
+def import_logs(paths: list, guild_id: int = None, column_map: dict = None, tz=None,
+                chunk_rows: int = CHUNK_ROWS, dry_run: bool = False, channel_map: dict = None) -> dict:
+    """
+    paths の CSV をギルドの保存先へ取り込み、件数と所要時間を返す。
+    channel_map は {チャンネル名: チャンネル ID}（ID を記録していないログ用）。
+    """
+    storage = get_storage(guild_id, create=True)
+    # ログの時刻は config.TIMEZONE のローカル時刻として扱う（core/intervals.py と同じ）
+    tz = tz or timezone() or datetime.now().astimezone().tzinfo
+    normalizer = Normalizer(column_map, guild_id, tz, channel_map)
+    store_dir = os.path.dirname(os.path.abspath(storage.path))
+    os.makedirs(store_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".import_", dir=store_dir)
+    stats = {"files": {}}
+    t_start = time.perf_counter()
+    try:
+        if isinstance(storage, CSVStorage):
+            source = CSVSource(storage, staging_dir)
+            existing_paths = source.paths()
+        elif isinstance(storage, SQLiteStorage):
+            source = SQLiteSource(storage)
+            existing_paths = []
+        else:
+            raise TypeError(f"取り込みに対応していない保存先です: {type(storage).__name__}")
+
+        # 1. チャンネル ID と名前の対応表（既存のログを後に読み、今の名前を優先する）
+        t0 = time.perf_counter()
+        scanned = 0
+        for path in list(paths) + existing_paths:
+            for chunk in read_chunks(path, chunk_rows):
+                normalizer.scan(chunk)
+                scanned += len(chunk)
+        if isinstance(source, SQLiteSource):
+            rows = storage.connection().execute(
+                "SELECT DISTINCT channel_id, channel_name FROM events WHERE channel_id IS NOT NULL AND channel_name IS NOT NULL"
+            ).fetchall()
+            normalizer.scan(pd.DataFrame([[str(i), n] for i, n in rows], columns=["channel_id", "channel_name"]))
+        stats["scan"] = (scanned, time.perf_counter() - t0)
+
+        # 2. チャンクごとに並べてランに書く（既存のイベントを先に書き、同じ時刻では既存の行を優先する）
+        t0 = time.perf_counter()
+        runs = RunWriter(staging_dir)
+        existing = 0
+        for chunk in source.chunks(chunk_rows):
+            existing += len(chunk)
+            runs.write(normalizer(chunk, origin=0))
+        for path in paths:
+            rows, invalid = 0, normalizer.invalid
+            for chunk in read_chunks(path, chunk_rows):
+                rows += len(chunk)
+                runs.write(normalizer(chunk, origin=1))
+            stats["files"][path] = (rows, normalizer.invalid - invalid)
+        stats["existing"] = existing
+        stats["invalid"] = normalizer.invalid
+        stats["unresolved"] = normalizer.unresolved
+        stats["sort"] = (runs.rows, time.perf_counter() - t0)
+
+        # 3. マージして重複を除き、セッションを作り直す
+        t0 = time.perf_counter()
+        boundary = None
+        if isinstance(storage, CSVStorage) and storage.rotate_period is not None:
+            boundary = period_start(datetime.now(), storage.rotate_period)
+        events_path = os.path.join(staging_dir, "events.csv")
+        sessions_path = os.path.join(staging_dir, "sessions.csv")
+        result = merge_events(
+            merge_runs(runs.paths, staging_dir), events_path, sessions_path,
+            boundary.strftime(TIMESTAMP_FORMAT) if boundary is not None else None,
+        )
+        stats["merge"] = (runs.rows, time.perf_counter() - t0)
+        stats["result"] = result
+        if dry_run or result.new_events == 0:
+            # 新しいイベントがなければ保存先はそのまま
+            stats["total"] = time.perf_counter() - t_start
+            return stats
+
+        # 4. 保存先に反映し、集計テーブルを作り直す
+        t0 = time.perf_counter()
+        if isinstance(source, CSVSource):
+            stats["backup"] = install_csv(
+                storage, source, staging_dir, events_path, sessions_path, result, boundary, chunk_rows,
+            )
+        else:
+            install_sqlite(storage, source, events_path, sessions_path, result, chunk_rows)
+        stats["install"] = (result.events, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        stats["rollups"] = (get_rollups(guild_id).rebuild(storage), time.perf_counter() - t0)
+        stats["total"] = time.perf_counter() - t_start
+        return stats
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="取り込む CSV（.gz なども可）")
+    parser.add_argument("--guild-id", type=int, default=config.DEFAULT_GUILD_ID,
+                        help="取り込み先のギルド（guild_id 列がない行もこのギルドのものとする）")
+    parser.add_argument("--column", action="append", default=[], metavar="SRC=DST",
+                        help="列名の対応（例: time=timestamp）。複数指定できる")
+    parser.add_argument("--channel", action="append", default=[], metavar="NAME=ID",
+                        help="チャンネル ID のない行のチャンネル名に対応する ID（例: 自習室=123456789012345678）。複数指定できる")
+    parser.add_argument("--timezone", default=None, help="タイムゾーン付きの時刻・UNIX 時間を変換する先（省略時は TIMEZONE の設定）")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="一度に読む行数")
+    parser.add_argument("--dry-run", action="store_true", help="件数を数えるだけで、保存先には書き込まない")
+    args = parser.parse_args()
+
+    column_map = dict(item.split("=", 1) for item in args.column)
+    channel_map = dict(item.rsplit("=", 1) for item in args.channel)
+    tz = ZoneInfo(args.timezone) if args.timezone else None
+    missing = [path for path in args.files if not os.path.exists(path)]
+    if missing:
+        print(f"ファイルが見つかりません: {', '.join(missing)}")
+        return
+
+    try:
+        stats = import_logs(args.files, args.guild_id, column_map, tz, args.chunk_rows, args.dry_run, channel_map)
+    except (RuntimeError, sqlite3.OperationalError) as e:
+        print(f"取り込みを中止しました: {e}")
+        return
+
+    for path, (rows, invalid) in stats["files"].items():
+        print(f"読み込み: {path}  {rows:,} 行（読めない行 {invalid:,}）")
+    result = stats["result"]
+    print(f"対応表の作成: {_rate(*stats['scan'])}")
+    print(f"並べ替え: {_rate(*stats['sort'])}（既存のイベント {stats['existing']:,} 行を含む）")
+    print(f"マージ: {_rate(*stats['merge'])}")
+    print(
+        f"  イベント {result.events:,} 行（新しく取り込む {result.new_events:,} 行 / 重複 {result.duplicates:,} 行 / "
+        f"読めない行 {stats['invalid']:,}）、セッション {result.sessions:,} 件、入室中 {len(result.open_joins):,} 人"
+    )
+    if stats["unresolved"]:
+        names = "、".join(f"{name or '(名前なし)'} {rows:,} 行" for name, rows in sorted(stats["unresolved"].items()))
+        print(f"  チャンネル ID を補えなかった行: {names}")
+        print(f"  → これらの入退室はセッションにできません（leave {result.unresolved:,} 行）。"
+              f"--channel \"名前=ID\" で ID を指定すると取り込めます")
+    if args.dry_run:
+        print(f"--dry-run のため保存先には書き込みませんでした（{stats['total']:.1f} 秒）。")
+        return
+    if not result.new_events:
+        print("新しいイベントはありませんでした。保存先は変更していません。")
+        return
+    print(f"保存先への反映: {_rate(*stats['install'])}")
+    if stats.get("backup"):
+        print(f"  取り込み前のファイルは {stats['backup']} に移しました。")
+    count, seconds = stats["rollups"]
+    print(f"集計テーブルの作り直し: セッション {count:,} 件 / {seconds:.1f} 秒")
+    total_rows = sum(rows for rows, _ in stats["files"].values())
+    print(f"合計: 取り込んだファイルの {_rate(total_rows, stats['total'])}")
+
+
+if __name__ == "__main__":
+    main()
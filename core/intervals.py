@@ -0,0 +1,121 @@
+"""
+セッションの区間を日・時間の区切りで分ける（日をまたぐセッションの集計と、時間帯別の集計用）。
+
+[start_time, end_time) をローカル時刻の0時（unit="day"）または毎時0分（unit="hour"）で切り、
+区切りごとの時間にする。23:00〜翌1:00 のセッションは前日に1時間・翌日に1時間となる。
+Python のループは使わず、区間ごとの区切りの数だけ行を np.repeat で増やしてまとめて計算する。
+
+ログの時刻はタイムゾーンなしのローカル時刻なので、そのまま0時・毎時0分で区切る。
+config.TIMEZONE（例: Asia/Tokyo）を設定すると、各区切りの時間をそのタイムゾーンで実際に経過した時間にする
+（夏時間の切り替えがあるタイムゾーンでも、1時間の区切りが2時間や0時間にならない）。
+"""
+from datetime import date
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from core import config
+
+# 1区切りの長さ（マイクロ秒）
+UNITS = {"day": 86_400_000_000, "hour": 3_600_000_000}
+US_PER_HOUR = UNITS["hour"]
+# 1970-01-01 は木曜日（weekday() == 3）
+EPOCH_WEEKDAY = 3
+
+
+def timezone():
+    """
+    区切りの時間を計るタイムゾーン（config.TIMEZONE）。設定されていなければ None。
+    """
+    return ZoneInfo(config.TIMEZONE) if config.TIMEZONE else None
+
+
+def _to_utc(local: np.ndarray, tz) -> np.ndarray:
+    """
+    ローカル時刻（マイクロ秒）を tz の UTC のマイクロ秒にする。Python の datetime（fold=0）と同じく、
+    夏時間の終わりで2回ある時刻は1回目、始まりで飛ばされる時刻は切り替え前の時差の時刻として扱う。
+    """
+    index = pd.DatetimeIndex(local.view("datetime64[us]"))
+    utc = index.tz_localize(tz, ambiguous=np.ones(len(index), dtype=bool), nonexistent=pd.Timedelta(hours=1))
+    return utc.as_unit("us").asi8
+
+
+def split_intervals(start, end, unit: str = "day", tz=None):
+    """
+    区間 [start, end) を unit（"day" / "hour"）の区切りで分ける。
+    start / end は同じ長さの datetime64 の配列（タイムゾーンなしのローカル時刻、欠損なし）。
+    (区間の番号, 区切りの開始時刻 datetime64[us], 時間[h]) の配列を返す。区間の番号の順に並ぶ。
+    長さ0の区間は、始まりを含む区切りの0時間になる。tz を省略すると timezone() を使う。
+    """
+    step = UNITS[unit]
+    tz = timezone() if tz is None else tz
+    s = np.asarray(start, dtype="datetime64[us]").view("int64")
+    e = np.maximum(np.asarray(end, dtype="datetime64[us]").view("int64"), s)
+
+    first = s // step
+    counts = np.maximum((e - 1) // step, first) - first + 1
+    index = np.repeat(np.arange(len(s)), counts)
+    # 区間の中で何番目の区切りか
+    offset = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    bucket = (first[index] + offset) * step
+    piece_start = np.maximum(s[index], bucket)
+    piece_end = np.minimum(e[index], bucket + step)
+
+    if tz is None:
+        hours = (piece_end - piece_start) / US_PER_HOUR
+    else:
+        hours = np.maximum(_to_utc(piece_end, tz) - _to_utc(piece_start, tz), 0) / US_PER_HOUR
+    return index, bucket.view("datetime64[us]"), hours
+
+
+def split_sessions(sessions: pd.DataFrame, unit: str = "day", columns=(), tz=None) -> pd.DataFrame:
+    """
+    セッションを unit の区切りに分け、columns の列と bucket（区切りの開始時刻）・duration_hour を返す。
+    """
+    if sessions.empty:
+        return pd.DataFrame({
+            **{col: sessions[col] for col in columns},
+            "bucket": pd.Series(dtype="datetime64[us]"),
+            "duration_hour": pd.Series(dtype=float),
+        })
+    index, bucket, hours = split_intervals(sessions["start_time"].to_numpy(), sessions["end_time"].to_numpy(), unit, tz)
+    pieces = sessions[list(columns)].iloc[index].reset_index(drop=True)
+    pieces["bucket"] = bucket
+    pieces["duration_hour"] = hours
+    return pieces
+
+
+def hours_since(sessions: pd.DataFrame, start_day: date = None, tz=None) -> np.ndarray:
+    """
+    各セッションのうち start_day 以降の時間[h]（入室中のセッションを期間の集計に足す用）。
+    start_day が None なら全体の時間。
+    """
+    if sessions.empty:
+        return np.zeros(0)
+    index, bucket, hours = split_intervals(sessions["start_time"].to_numpy(), sessions["end_time"].to_numpy(), "day", tz)
+    if start_day is not None:
+        hours = np.where(bucket >= np.datetime64(start_day, "us"), hours, 0.0)
+    return np.bincount(index, weights=hours, minlength=len(sessions))
+
+
+def clip_buckets(bucket, hours, start_day: date = None, end_day: date = None):
+    """
+    区切りのうち [start_day, end_day) にあるものだけの (bucket, hours) を返す。
+    """
+    mask = np.ones(len(bucket), dtype=bool)
+    if start_day is not None:
+        mask &= bucket >= np.datetime64(start_day, "us")
+    if end_day is not None:
+        mask &= bucket < np.datetime64(end_day, "us")
+    return bucket[mask], hours[mask]
+
+
+def hour_of_week(bucket, hours) -> np.ndarray:
+    """
+    毎時の区切り（bucket）ごとの時間を、(曜日, 時) の 7×24 の合計にする。行は月曜日から。
+    """
+    us = np.asarray(bucket, dtype="datetime64[us]").view("int64")
+    days = us // UNITS["day"]
+    cell = (days + EPOCH_WEEKDAY) % 7 * 24 + (us - days * UNITS["day"]) // US_PER_HOUR
+    return np.bincount(cell, weights=np.asarray(hours, dtype=float), minlength=7 * 24).reshape(7, 24)
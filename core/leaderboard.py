@@ -0,0 +1,243 @@
+"""
+ユーザーの学習時間ランキング（今日 / 直近7日 / 直近30日 / 全期間）。
+
+集計テーブル（core/rollups.py）の日付・ユーザー別の合計から、期間ごとに
+「ユーザー -> 合計時間」と、それを降順に並べたリストをメモリ上に持つ。
+  - 上位 K 件・ページ分け: 並べたリストの切り出し
+  - あるユーザーの順位: 二分探索（O(log n)）
+同じ時間のユーザーは同じ順位（1, 2, 2, 4, ...）。
+
+sync() は集計テーブルの revision を見て、前回以降に値が変わった日だけを読み直し、
+その日の差分を各期間に足す。日付が変わると、期間から外れた日の分を引く。
+そのため直近 RETAIN_DAYS 日分は日別の値も持っておく。
+それより古い日が変わった場合（集計テーブルの作り直しなど）は全体を読み直す。
+
+日をまたぐセッションは集計テーブルと同じく0時で分け、それぞれの日の時間として数える。
+入室中のセッションは集計テーブルにないので、必要なら extra（ユーザー -> 追加の時間）で上乗せする。
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+
+import pandas as pd
+
+from core import config
+from core.intervals import hours_since
+
+# 期間の名前 -> 日数（今日を含む）。None は全期間
+WINDOWS = {"day": 1, "week": 7, "month": 30, "all": None}
+WINDOW_LABELS = {"day": "今日", "week": "直近7日間", "month": "直近30日間", "all": "全期間"}
+RETAIN_DAYS = max(days for days in WINDOWS.values() if days)
+# 浮動小数点の誤差で残ったごく小さい値は 0 とみなす
+EPSILON = 1e-9
+
+
+def window_start(window: str, today: date = None):
+    """
+    期間の最初の日（全期間なら None）。
+    """
+    days = WINDOWS[window]
+    if days is None:
+        return None
+    return (today or date.today()) - timedelta(days=days - 1)
+
+
+def open_hours(open_sessions: pd.DataFrame, start_day: date = None) -> dict:
+    """
+    入室中のセッション（user_id, start_time, end_time）のうち start_day 以降の時間を
+    ユーザーごとの時間にする（extra 用）。前日から続いているセッションは start_day の0時からの分を数える。
+    """
+    if open_sessions is None or open_sessions.empty:
+        return {}
+    hours = pd.Series(hours_since(open_sessions, start_day), index=open_sessions.index)
+    return {int(uid): float(h) for uid, h in hours.groupby(open_sessions["user_id"]).sum().items() if h > 0}
+
+
+class RankedTotals:
+    """
+    ユーザーごとの合計時間と、(−時間, user_id) を昇順（= 時間の降順）に並べたリスト。
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._keys = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def reset(self, totals: dict):
+        self.totals = {uid: h for uid, h in totals.items() if h > EPSILON}
+        self._keys = sorted((-h, uid) for uid, h in self.totals.items())
+
+    def add(self, user_id: int, hours: float):
+        old = self.totals.get(user_id)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+        new = (old or 0.0) + hours
+        if new > EPSILON:
+            self.totals[user_id] = new
+            insort(self._keys, (-new, user_id))
+        else:
+            self.totals.pop(user_id, None)
+
+    def count_above(self, hours: float) -> int:
+        """
+        hours より長いユーザーの数。
+        """
+        return bisect_left(self._keys, (-hours,))
+
+    def top(self, limit: int, offset: int = 0) -> list:
+        return [(uid, -neg) for neg, uid in self._keys[offset:offset + limit]]
+
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.revision = None
+        self.today = None
+        # 直近 RETAIN_DAYS 日分の 日付 -> {user_id: 時間}
+        self.days = {}
+        self.windows = {window: RankedTotals() for window in WINDOWS}
+
+    # ── 更新 ─────────────────────────────────────────────
+    def sync(self, rollups, today: date = None):
+        """
+        集計テーブルの変更と日付の変化を取り込む。rollups は sync 済みのものを渡す。
+        """
+        today = today or date.today()
+        with self._lock, rollups.snapshot():
+            revision = rollups.revision
+            if self.revision is None or revision < self.revision or today < self.today:
+                self._load(rollups, revision, today)
+                return
+            if today != self.today:
+                self._advance(today)
+            if revision == self.revision:
+                return
+            changed = rollups.changed_days(self.revision)
+            if any(day <= today - timedelta(days=RETAIN_DAYS) for day in changed):
+                self._load(rollups, revision, today)
+                return
+            rows = rollups.daily_user_usage(days=changed)
+            for day in changed:
+                self._set_day(day, rows[rows["date"] == day])
+            self.revision = revision
+
+    def _load(self, rollups, revision: int, today: date):
+        """
+        全期間の合計と直近 RETAIN_DAYS 日分の日別の値を読み直す。
+        """
+        self.today = today
+        self.revision = revision
+        self.days = {}
+        rows = rollups.daily_user_usage(today - timedelta(days=RETAIN_DAYS - 1))
+        for (day, uid, h) in rows.itertuples(index=False):
+            self.days.setdefault(day, {})[int(uid)] = float(h)
+        for window, ranked in self.windows.items():
+            if WINDOWS[window] is None:
+                totals = rollups.user_usage()
+                ranked.reset({int(uid): float(h) for uid, h in totals.itertuples(index=False)})
+            else:
+                start = window_start(window, today)
+                totals = {}
+                for day, users in self.days.items():
+                    if day >= start:
+                        for uid, h in users.items():
+                            totals[uid] = totals.get(uid, 0.0) + h
+                ranked.reset(totals)
+
+    def _advance(self, today: date):
+        """
+        日付が変わったので、期間から外れた日の分を引く。
+        """
+        for window, ranked in self.windows.items():
+            if WINDOWS[window] is None:
+                continue
+            old_start, new_start = window_start(window, self.today), window_start(window, today)
+            for day, users in self.days.items():
+                if old_start <= day < new_start:
+                    for uid, h in users.items():
+                        ranked.add(uid, -h)
+        oldest = today - timedelta(days=RETAIN_DAYS - 1)
+        self.days = {day: users for day, users in self.days.items() if day >= oldest}
+        self.today = today
+
+    def _set_day(self, day: date, rows: pd.DataFrame):
+        """
+        day の日別の値を rows に置き換え、差分を day を含む期間に足す。
+        """
+        new = {int(uid): float(h) for uid, h in zip(rows["user_id"], rows["duration_hour"])}
+        old = self.days.get(day, {})
+        delta = {uid: h - old.get(uid, 0.0) for uid, h in new.items()}
+        for uid, h in old.items():
+            if uid not in new:
+                delta[uid] = -h
+        self.days[day] = new
+        for window, ranked in self.windows.items():
+            start = window_start(window, self.today)
+            if start is None or day >= start:
+                for uid, h in delta.items():
+                    if h:
+                        ranked.add(uid, h)
+
+    # ── 問い合わせ ───────────────────────────────────────
+    def top(self, window: str, limit: int = 10, offset: int = 0, extra: dict = None) -> list:
+        """
+        offset 番目から limit 件の [{"rank", "user_id", "duration_hour"}, ...]。
+        """
+        with self._lock:
+            ranked = self.windows[window]
+            if not extra:
+                entries = ranked.top(limit, offset)
+            else:
+                # extra のないユーザーの順番は変わらないので、上位から必要な分だけ取り出して混ぜる
+                others = [(uid, h) for uid, h in ranked.top(offset + limit + len(extra)) if uid not in extra]
+                boosted = [(uid, ranked.totals.get(uid, 0.0) + h) for uid, h in extra.items()]
+                entries = sorted(others + boosted, key=lambda e: (-e[1], e[0]))[offset:offset + limit]
+            return [
+                {"rank": self._count_above(ranked, h, extra, uid) + 1, "user_id": uid, "duration_hour": h}
+                for uid, h in entries
+            ]
+
+    def rank(self, window: str, user_id: int, extra: dict = None):
+        """
+        user_id の {"rank", "user_id", "duration_hour"}。記録がなければ None。
+        """
+        with self._lock:
+            ranked = self.windows[window]
+            hours = ranked.totals.get(user_id, 0.0) + (extra or {}).get(user_id, 0.0)
+            if hours <= EPSILON:
+                return None
+            return {"rank": self._count_above(ranked, hours, extra, user_id) + 1, "user_id": user_id,
+                    "duration_hour": hours}
+
+    def total_users(self, window: str, extra: dict = None) -> int:
+        with self._lock:
+            ranked = self.windows[window]
+            return len(ranked) + sum(1 for uid in (extra or {}) if uid not in ranked.totals)
+
+    @staticmethod
+    def _count_above(ranked: RankedTotals, hours: float, extra: dict, user_id: int) -> int:
+        count = ranked.count_above(hours)
+        for uid, h in (extra or {}).items():
+            if uid != user_id:
+                base = ranked.totals.get(uid, 0.0)
+                count += (base + h > hours) - (base > hours)
+        return count
+
+
+_leaderboards = {}
+_leaderboards_lock = threading.Lock()
+
+
+def get_leaderboard(guild_id: int = None) -> Leaderboard:
+    """
+    ギルドのランキングを返す。プロセス内でギルドごとに1つのインスタンスを共有する。
+    """
+    if guild_id == config.DEFAULT_GUILD_ID:
+        guild_id = None
+    with _leaderboards_lock:
+        leaderboard = _leaderboards.get(guild_id)
+        if leaderboard is None:
+            leaderboard = _leaderboards[guild_id] = Leaderboard()
+        return leaderboard
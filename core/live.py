@@ -0,0 +1,128 @@
+"""
+VCイベントのライブ配信（API の /api/v1/stream 用）。
+
+1つの監視タスクが保存先を poll_interval 秒ごとに確認し（CSV なら os.stat、
+SQLite なら主キーでの範囲検索だけなので軽い）、新しいイベントがあったときだけ
+差分メッセージを作って全購読者のキューに配る。
+接続しているダッシュボードが何枚あっても、イベント1回につき計算は1回で済む。
+
+メッセージ（dict の "type" で区別）:
+  session_opened  join があった      {user_id, channel_id, channel_name, start_time}
+  session_closed  セッションが確定した {user_id, channel_id, channel_name, start_time, end_time, duration_hour}
+  today_usage     今日のチャンネル別合計が変わった {data: [...]}
+  reset           取りこぼしがあった。クライアントは全体を取り直す
+"""
+import asyncio
+
+import pandas as pd
+
+
+class LiveFeed:
+    def __init__(self, storage, rollups, totals, poll_interval: float = 1.0, queue_size: int = 100):
+        """
+        totals は今日のチャンネル別合計（today_usage の data）を返す関数。
+        """
+        self.storage = storage
+        self.rollups = rollups
+        self.totals = totals
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+
+        self._subscribers = set()
+        self._cursor = None
+        self._session_cursor = None
+        self._task = None
+
+    # ── 購読 ─────────────────────────────────────────────
+    def subscribe(self) -> asyncio.Queue:
+        """
+        購読者のキューを登録する。最初の購読で監視タスクを起動する。
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def publish(self, message: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 読み出しが追いつかない購読者は、溜まった分を捨てて取り直してもらう
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "reset"})
+
+    # ── 監視 ─────────────────────────────────────────────
+    async def _watch(self):
+        await asyncio.to_thread(self._start)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                messages = await asyncio.to_thread(self._poll)
+            except Exception as e:
+                print(f"ライブ配信の更新エラー: {e}")
+                continue
+            for message in messages:
+                self.publish(message)
+
+    def _start(self):
+        _, self._cursor = self.storage.events_since(None)
+        self._session_cursor = self.storage.session_cursor()
+        self.rollups.sync(self.storage)
+
+    def _poll(self) -> list:
+        events, self._cursor = self.storage.events_since(self._cursor)
+        if events is None:
+            # ログが読み直された。差分は作れないので取り直してもらう
+            self._start()
+            return [{"type": "reset"}]
+        if events.empty:
+            return []
+
+        messages = []
+        for row in events[events["action"] == "join"].itertuples(index=False):
+            messages.append({
+                "type": "session_opened",
+                "user_id": int(row.user_id),
+                "channel_id": None if pd.isna(row.channel_id) else int(row.channel_id),
+                "channel_name": None if pd.isna(row.channel_name) else row.channel_name,
+                "start_time": row.timestamp.isoformat(),
+            })
+
+        closed, self._session_cursor = self.storage.sessions_since(self._session_cursor)
+        if closed is None:
+            # 読んでいないセッションがアーカイブへ移った・保存先が作り直された
+            self._start()
+            return [{"type": "reset"}]
+        if not closed.empty:
+            for row in closed.itertuples(index=False):
+                messages.append({
+                    "type": "session_closed",
+                    "user_id": int(row.user_id),
+                    "channel_id": int(row.channel_id),
+                    "channel_name": row.channel_name,
+                    "start_time": row.start_time.isoformat(),
+                    "end_time": row.end_time.isoformat(),
+                    "duration_hour": float(row.duration_hour),
+                })
+            self.rollups.sync(self.storage)
+            messages.append({"type": "today_usage", "data": self.totals()})
+        return messages
@@ -0,0 +1,309 @@
+import ctypes
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from core.eventstore import EventStore
+from core.metrics import CACHE_REQUESTS, ROWS_PARSED, STAGE_SECONDS
+from core.schema import LOG_COLUMNS
+from core.sessions import calculate_sessions, empty_sessions
+
+
+def _read_lines(f, size: int = None):
+    """
+    f の今の位置から、改行で終わるバイト列を size バイト程度ずつ返す。最後の改行より後（書き込み途中の行）は返さない。
+    """
+    rest = b""
+    while True:
+        data = f.read(size) if size else f.read()
+        if not data:
+            return
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        rest = data[end:]
+        if end:
+            yield data[:end]
+        if not size:
+            return
+
+
+def _trim_heap():
+    """
+    malloc が解放後も抱えているメモリを OS に返す（全件を読み直したあと用。glibc 以外では何もしない）。
+    """
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class LogCache:
+    """
+    vc_logs.csv をプロセス内に保持し、追記された分だけを読み込むキャッシュ。
+
+    ファイルの inode・読み込み済みバイト位置を覚えておき、
+    リクエストのたびに新しく追記されたバイト列だけをパースして EventStore（列ごとの配列）に足す。
+    入室中（leave 待ち）のユーザーの join も行番号で持ち越すので、追記分だけで更新できる。
+    ファイルのローテーション・切り詰め・時刻の逆行を検出したときは全件を読み直す。
+    """
+
+    # メトリクスのラベル（vc_rows_parsed_total の source など）
+    SOURCE = "events"
+    # 全件を読み直すとき、一度に読んでパースするバイト数（None なら一度に全部）。
+    # 途中の DataFrame や文字列が大きくならないよう、20 万行程度ずつ EventStore に足す
+    READ_BYTES = 16 * 2**20
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # 読み込み済みのイベントを捨てるたびに増える。events_since() のカーソルが古くなったことの検出用
+        self.generation = 0
+        self.event_count = 0
+        self._reset()
+
+    def _reset(self):
+        if self.event_count:
+            self.generation += 1
+        self.inode = None
+        self.offset = 0
+        self.columns = LOG_COLUMNS
+        self.last_timestamp = None
+        self.event_count = 0
+        self._store = EventStore(self.columns)
+        # leave 待ちの join の行番号（ユーザーごとに最後のイベントが join のもの）と、その DataFrame
+        self._pending = np.empty(0, dtype=np.int64)
+        self._pending_frame = None
+
+    @property
+    def version(self):
+        """
+        読み込み済みデータを表すトークン。データが変わると値も変わる。
+        """
+        return (self.inode, self.offset)
+
+    def events(self) -> pd.DataFrame:
+        """
+        最新化したうえで、timestamp 順に並んだイベント全体を返す。
+        """
+        with self._lock:
+            self._refresh()
+            return self._store.frame()
+
+    def events_since(self, cursor):
+        """
+        cursor 以降に追記されたイベントと、次回用のカーソルを返す。
+        cursor は前回の戻り値（初回は None）。ファイルが読み直されていた場合や
+        初回は、その時点までのイベントを送らずに (None, 新しいカーソル) を返す。
+        """
+        with self._lock:
+            self._refresh()
+            new_cursor = (self.generation, self.event_count)
+            if cursor is None or cursor[0] != self.generation:
+                return None, new_cursor
+
+            return self._store.frame(cursor[1]), new_cursor
+
+    def sessions(self) -> pd.DataFrame:
+        """
+        最新化したうえで、イベント全体を突き合わせたセッションを返す（保持はしないので毎回計算する）。
+        """
+        with self._lock:
+            self._refresh()
+            events = self._store.frame()
+        with STAGE_SECONDS.time(stage="sessionize"):
+            return calculate_sessions(events)
+
+    def open_joins(self) -> pd.DataFrame:
+        """
+        最新化したうえで、leave 待ちの join 行（入室中のユーザー）を返す。
+        """
+        with self._lock:
+            self._refresh()
+            if self._pending_frame is None:
+                self._pending_frame = self._store.take(self._pending)
+            return self._pending_frame
+
+    def refresh(self):
+        """
+        追記分を取り込む。
+        """
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self.inode is not None:
+                self._reset()
+            return
+
+        if self.inode != (st.st_dev, st.st_ino) or st.st_size < self.offset or not self._tail_intact():
+            CACHE_REQUESTS.inc(cache=f"{self.SOURCE}_log", result="reload")
+            return self._full_reload()
+        if st.st_size == self.offset:
+            CACHE_REQUESTS.inc(cache=f"{self.SOURCE}_log", result="unchanged")
+            return
+        CACHE_REQUESTS.inc(cache=f"{self.SOURCE}_log", result="append")
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        consumed = data.rfind(b"\n") + 1
+        if consumed == 0:
+            # 書き込み途中の行しかない
+            return
+
+        new_rows = self._parse(data[:consumed])
+        first = self._first_time(new_rows)
+        if self.last_timestamp is not None and first is not None and first < self.last_timestamp:
+            # 過去の時刻の行が追記された場合、全体の並び順が変わるので読み直す
+            return self._full_reload()
+
+        self.offset += consumed
+        self._append(new_rows)
+
+    def _tail_intact(self) -> bool:
+        """
+        読み込み済み位置の直前が改行のままか確認する（同じ inode での書き換え検出用）。
+        """
+        if self.offset == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(self.offset - 1)
+            return f.read(1) == b"\n"
+
+    def _full_reload(self):
+        self._reset()
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            header = f.readline()
+            if not header.endswith(b"\n"):
+                # ヘッダー行の書き込み途中。inode を覚えずに次回も全件読み込みにする
+                return
+
+            self.inode = (st.st_dev, st.st_ino)
+            self.columns = header.decode("utf-8").strip().split(",")
+            self._store = EventStore(self.columns)
+            self.offset = len(header)
+            in_order = True
+            for data in _read_lines(f, self.READ_BYTES):
+                rows = self._parse(data)
+                first = self._first_time(rows)
+                if self.last_timestamp is not None and first is not None and first < self.last_timestamp:
+                    in_order = False
+                self.offset += len(data)
+                self._append(rows)
+        if not in_order:
+            self._sort()
+        _trim_heap()
+
+    def _sort(self):
+        """
+        ファイルが timestamp 順になっていなかったときに、読み込んだ全体を並べ直す。
+        """
+        self._store.sort()
+        self.last_timestamp = self._store.last_timestamp
+        self._pending = self._store.last_joins(np.arange(len(self._store), dtype=np.int64))
+        self._pending_frame = None
+
+    def _parse(self, data: bytes) -> dict:
+        if not data:
+            return {}
+        with STAGE_SECONDS.time(stage="csv_load"):
+            block = self._store.parse(data)
+        ROWS_PARSED.inc(len(block["timestamps"]), source=self.SOURCE)
+        return block
+
+    def _first_time(self, block: dict):
+        if not block or not len(block["timestamps"]):
+            return None
+        return pd.Timestamp(int(block["timestamps"][0]), unit="us")
+
+    def _append(self, block: dict):
+        if not block or not len(block["timestamps"]):
+            return
+
+        start = len(self._store)
+        self._store.append(block)
+        self.event_count = len(self._store)
+        self.last_timestamp = self._store.last_timestamp
+        # 前回までの leave 待ち join と追記分から、次回に持ち越す join を選び直す
+        rows = np.concatenate([self._pending, np.arange(start, len(self._store), dtype=np.int64)])
+        self._pending = self._store.last_joins(rows)
+        self._pending_frame = None
+
+
+class SessionLogCache(LogCache):
+    """
+    確定済みセッションの CSV（vc_sessions.csv）を追記分だけ読み込むキャッシュ。
+    ファイルの扱いは LogCache と同じで、行はそのままセッションとして DataFrame で持つ（突き合わせは不要）。
+    行はファイルに追記された順のまま持つ（その位置を集計テーブルの差分のカーソルに使うので、end_time では並べ替えない）。
+    追記分は塊のまま溜めておき、読み出すときに1つの DataFrame につなぐ（追記のたびに全体をコピーしない）。
+    """
+
+    # 時刻として読む列
+    TIME_COLUMNS = ["start_time", "end_time"]
+    SOURCE = "sessions"
+    READ_BYTES = None
+    # 読み出されないまま溜まった追記分の塊がこれを超えたら、塊どうしを先につないでおく
+    MAX_CHUNKS = 64
+
+    def _reset(self):
+        super()._reset()
+        self._sessions = empty_sessions()
+        # _sessions の後ろに続く、まだつないでいない追記分
+        self._chunks = []
+
+    def sessions(self) -> pd.DataFrame:
+        """
+        最新化したうえで、確定済みのセッション全体を返す。
+        """
+        with self._lock:
+            self._refresh()
+            return self._frame()
+
+    def snapshot(self) -> tuple:
+        """
+        最新化したうえで、(確定済みのセッション全体, 読んだファイルの inode) を返す。
+        """
+        with self._lock:
+            self._refresh()
+            return self._frame(), self.inode
+
+    def _parse(self, data: bytes) -> pd.DataFrame:
+        if not data:
+            return pd.DataFrame(columns=self.columns)
+        with STAGE_SECONDS.time(stage="csv_load"):
+            df = pd.read_csv(io.BytesIO(data), header=None, names=self.columns)
+            for col in self.TIME_COLUMNS:
+                df[col] = pd.to_datetime(df[col], format="ISO8601")
+        ROWS_PARSED.inc(len(df), source=self.SOURCE)
+        return df
+
+    def _first_time(self, new_sessions: pd.DataFrame):
+        # 過去の end_time の行が追記されても、読み直さずにそのまま後ろに足す
+        return None
+
+    def _append(self, new_sessions: pd.DataFrame):
+        if new_sessions.empty:
+            return
+
+        self.event_count += len(new_sessions)
+        self.last_timestamp = new_sessions["end_time"].iloc[-1]
+        self._chunks.append(new_sessions)
+        if len(self._chunks) > self.MAX_CHUNKS:
+            self._chunks = [pd.concat(self._chunks, ignore_index=True)]
+
+    def _frame(self) -> pd.DataFrame:
+        """
+        読み込み済みのセッション全体（溜まっている追記分があれば、ここで一度だけつなぐ）。
+        """
+        if self._chunks:
+            frames = self._chunks if self._sessions.empty else [self._sessions, *self._chunks]
+            self._sessions = pd.concat(frames, ignore_index=True)
+            self._chunks = []
+        return self._sessions
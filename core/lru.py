@@ -0,0 +1,65 @@
+"""
+合計サイズで上限を決める LRU キャッシュ。描画済みグラフ（core/chart_cache.py）と
+API のレスポンス（core/response_cache.py）で共有する。
+"""
+import threading
+from collections import OrderedDict
+
+from core.metrics import CACHE_REQUESTS
+
+
+class SizedLRU:
+    """
+    値の合計サイズ（sizeof(値)）が max_bytes を超えたら、古く使われたものから捨てる LRU キャッシュ。
+    max_bytes より大きい値は置かない。name はメトリクス（CACHE_REQUESTS の cache ラベル）に使う。
+    Bot のイベントループと API のスレッドプールのどちらからも使えるようロックを取る。
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, name: str = "lru", sizeof=len):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._items.move_to_end(key)
+                self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if value is None else "hit")
+        return value
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= self.sizeof(old)
+            self._items[key] = value
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,269 @@
+"""
+Prometheus のテキスト形式で出せるメトリクス（カウンター・ゲージ・ヒストグラム）。
+
+Bot と API はそれぞれのプロセスで REGISTRY に記録し、
+  - API: GET /metrics
+  - Bot: METRICS_PORT のローカル HTTP ポート、または METRICS_FILE への定期書き出し
+    （node_exporter の textfile collector で読める形式）
+で出力する。外部ライブラリには依存しない。どのメソッドもスレッドから呼んでよい。
+
+共通で使うメトリクス:
+  vc_stage_seconds{stage}             処理段階ごとの時間（csv_load / sessionize / aggregate / serialize）
+  vc_rows_parsed_total{source}        ログから読み込んだ行数（events / sessions）
+  vc_cache_requests_total{cache,result}  キャッシュの参照結果（hit / miss。logcache は unchanged / append / reload）
+  vc_bot_handler_seconds{cog,event}   Bot のイベントハンドラー（on_voice_state_update など）の時間
+  vc_bot_command_seconds{command,stage}  スラッシュコマンドの段階ごとの時間
+"""
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or (float(value).is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metric:
+    """
+    collect（ラベルの値のタプル -> 値 の dict を返す関数）を渡すと、記録した値の代わりに
+    出力のたびにその関数で値を取りにいく（他のオブジェクトが持っている件数などを出す用）。
+    """
+
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        (名前の後ろに付ける文字列, ラベルの dict, 値) を返す。
+        """
+        if self.collect is not None:
+            try:
+                items = list(self.collect().items())
+            except Exception as e:
+                print(f"メトリクス {self.name} の取得でエラー: {e}")
+                return
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            if value is not None:
+                yield "", dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        with ブロックの実行時間を記録する（例外で抜けた場合も記録する）。
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name: str, documentation: str, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"メトリクス {name} は別の種類・ラベルで登録済みです。")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=(), collect=None) -> Counter:
+        return self._collecting(self._get(Counter, name, documentation, labelnames), collect)
+
+    def gauge(self, name: str, documentation: str, labelnames=(), collect=None) -> Gauge:
+        return self._collecting(self._get(Gauge, name, documentation, labelnames), collect)
+
+    @staticmethod
+    def _collecting(metric: Metric, collect):
+        # 同じ名前で登録し直した場合（拡張の再読み込みなど）は新しい関数に差し替える
+        if collect is not None:
+            metric.collect = collect
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "vc_stage_seconds", "処理段階ごとの時間（秒）", ["stage"],
+)
+ROWS_PARSED = REGISTRY.counter(
+    "vc_rows_parsed_total", "ログファイルから読み込んだ行数", ["source"],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "vc_cache_requests_total", "キャッシュの参照回数（result は hit / miss など）", ["cache", "result"],
+)
+
+# Bot 用
+HANDLER_SECONDS = REGISTRY.histogram(
+    "vc_bot_handler_seconds", "Bot のイベントハンドラーの実行時間（秒）", ["cog", "event"],
+)
+COMMAND_SECONDS = REGISTRY.histogram(
+    "vc_bot_command_seconds", "スラッシュコマンドの段階（load / compute / render）ごとの時間（秒）", ["command", "stage"],
+)
+STARTUP_SECONDS = REGISTRY.gauge(
+    "vc_bot_startup_seconds", "Bot のプロセス開始から起動の各段階（core/startup.py）までの秒数", ["phase"],
+)
+
+
+def timed(histogram: Histogram, **labels):
+    """
+    コルーチン関数の実行時間を histogram に記録するデコレーター（イベントハンドラー用）。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ─────────────────────────────────────────────────────
+# 出力（Bot 用）
+# ─────────────────────────────────────────────────────
+async def serve(registry: Registry, host: str, port: int) -> asyncio.AbstractServer:
+    """
+    GET /metrics に registry の内容を返す最小限の HTTP サーバーを起動する。
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # ヘッダーは読み捨てる
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, registry.render().encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def write_file(registry: Registry, path: str):
+    """
+    registry の内容を path に書く。読み手が書きかけのファイルを見ないよう、一時ファイルから置き換える。
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
@@ -0,0 +1,94 @@
+"""
+data/ にある既存の CSV ログを SQLite の保存先へ移行するツール（1回だけ実行する想定）。
+
+古いログは列構成がまちまちなので、次のように揃えてから取り込む。
+  - channel 列しかないもの      → channel_name として扱い、他のログから channel_id を補う
+  - channel_name 列がないもの   → 他のログから channel_name を補う
+  - 同じ (user_id, timestamp, action, channel_id) の重複行は1行にする
+  - guild_id 列がないものは --guild-id（省略時は DEFAULT_GUILD_ID）で埋める
+すべてのファイルを timestamp 順に並べてからセッションを計算し、
+イベント・セッション・leave 待ちの join をまとめて書き込む。
+
+実行例:
+    python -m core.migrate_csv                     # data/*.csv を SQLITE_PATH へ
+    python -m core.migrate_csv data/vc_logs.csv --db data/vc_logs.db
+    python -m core.migrate_csv data/guilds/123/vc_logs.csv --guild-id 123   # ギルドの保存先へ
+"""
+import argparse
+import glob
+import os
+
+import pandas as pd
+
+from core import config
+from core.schema import LOG_COLUMNS
+from core.sessions import calculate_sessions, pending_joins
+from core.storage import SQLiteStorage, partition_path
+
+
+def read_log(path: str, guild_id: int = None) -> pd.DataFrame:
+    """
+    列構成の違う CSV を LOG_COLUMNS の形に揃えて読み込む。
+    """
+    df = pd.read_csv(path, dtype={"user_id": "Int64", "channel_id": "Int64", "guild_id": "Int64"})
+    if "channel" in df.columns and "channel_name" not in df.columns:
+        df = df.rename(columns={"channel": "channel_name"})
+    df = df.reindex(columns=LOG_COLUMNS)
+    df["channel_id"] = df["channel_id"].astype("Int64")
+    df["guild_id"] = df["guild_id"].astype("Int64")
+    if guild_id is not None:
+        df["guild_id"] = df["guild_id"].fillna(guild_id)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    return df
+
+
+def merge_logs(paths: list, guild_id: int = None) -> pd.DataFrame:
+    frames = [read_log(path, guild_id) for path in paths]
+    df = pd.concat(frames, ignore_index=True)
+
+    # channel_id と channel_name の対応を、両方そろっている行から作って欠けている側を補う
+    known = df.dropna(subset=["channel_id", "channel_name"]).drop_duplicates("channel_name", keep="last")
+    id_by_name = known.set_index("channel_name")["channel_id"]
+    known = known.drop_duplicates("channel_id", keep="last")
+    name_by_id = known.set_index("channel_id")["channel_name"]
+    df["channel_id"] = df["channel_id"].fillna(df["channel_name"].map(id_by_name)).astype("Int64")
+    df["channel_name"] = df["channel_name"].fillna(df["channel_id"].map(name_by_id))
+
+    df = df.drop_duplicates(["user_id", "timestamp", "action", "channel_id"])
+    df = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="取り込む CSV（省略時は DATA_DIR/*.csv）")
+    parser.add_argument("--guild-id", type=int, default=config.DEFAULT_GUILD_ID, help="guild_id 列がない行のギルド")
+    parser.add_argument("--db", default=None, help="移行先の SQLite ファイル（省略時はギルドの保存先）")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(config.DATA_DIR, "*.csv")))
+    # vc_sessions.csv はイベントではないので対象にしない
+    paths = [path for path in paths if os.path.basename(path) != os.path.basename(config.VC_SESSIONS_PATH)]
+    args.db = args.db or partition_path(args.guild_id, config.SQLITE_PATH, create=True)
+    if not paths:
+        print("取り込む CSV が見つかりません。")
+        return
+
+    storage = SQLiteStorage(args.db)
+    if storage.version[1]:
+        print(f"{args.db} には既にイベントがあります。空のデータベースを指定してください。")
+        return
+
+    events = merge_logs(paths, args.guild_id)
+    sessions = calculate_sessions(events)
+    open_joins = pending_joins(events)
+
+    storage.import_frames(events, sessions, open_joins)
+    storage.close()
+    for path in paths:
+        print(f"読み込み: {path}")
+    print(f"{len(events)} 件のイベント、{len(sessions)} 件のセッションを {args.db} に移行しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+入室中（leave 待ち）のユーザーの一覧。
+
+VCLogger が join / leave のたびに更新し、起動時はサーバーのボイスチャンネルの
+メンバーから作り直す。入室中のセッションはログの最後まで読まないと分からないが、
+この一覧を使えば「今の滞在時間」を入室中の人数分の計算だけで集計に足せる。
+API のプロセスは保存先の open_sessions()（CSV はキャッシュ済みの leave 待ち join、
+SQLite は open_sessions テーブル）から同じ形の一覧を読む。
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from core.sessions import SESSION_COLUMNS
+
+OPEN_COLUMNS = ["user_id", "channel_id", "channel_name", "start_time"]
+
+
+class PresenceIndex:
+    def __init__(self):
+        # user_id -> (channel_id, channel_name, start_time)
+        self._members = {}
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._members
+
+    def get(self, user_id):
+        return self._members.get(user_id)
+
+    def items(self):
+        return list(self._members.items())
+
+    def join(self, user_id: int, channel_id: int, channel_name: str, start_time: datetime):
+        self._members[user_id] = (channel_id, channel_name, start_time)
+
+    def leave(self, user_id: int):
+        """
+        退出したユーザーを取り除き、入室時の (channel_id, channel_name, start_time) を返す。
+        """
+        return self._members.pop(user_id, None)
+
+    def load(self, open_sessions: pd.DataFrame):
+        """
+        保存先の open_sessions() の内容で置き換える。
+        """
+        self._members = {
+            int(row.user_id): (
+                None if pd.isna(row.channel_id) else int(row.channel_id),
+                None if pd.isna(row.channel_name) else row.channel_name,
+                row.start_time.to_pydatetime(),
+            )
+            for row in open_sessions.itertuples(index=False)
+        }
+
+    def snapshot(self) -> pd.DataFrame:
+        """
+        入室中のユーザーを OPEN_COLUMNS の DataFrame で返す。
+        """
+        rows = [(user_id, *entry) for user_id, entry in self._members.items()]
+        df = pd.DataFrame(rows, columns=OPEN_COLUMNS)
+        df["start_time"] = pd.to_datetime(df["start_time"])
+        return df
+
+
+def open_session_usage(open_sessions: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    """
+    入室中のセッションを now で区切った確定済みセッションと同じ形（SESSION_COLUMNS）で返す。
+    集計結果に足せば、入室中の時間も含めた値になる。チャンネルの分からない行は除く。
+    """
+    df = open_sessions.dropna(subset=["channel_id"])
+    df = df[df["start_time"] <= now]
+    end_time = pd.Series(pd.Timestamp(now), index=df.index)
+    df = df.assign(end_time=end_time, duration_hour=(end_time - df["start_time"]).dt.total_seconds() / 3600.0)
+    return df.reindex(columns=SESSION_COLUMNS)
@@ -0,0 +1,84 @@
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class RenderPoolBusy(Exception):
+    """
+    描画待ちが上限に達している。呼び出し側は「混み合っています」と返す。
+    """
+
+
+# 描画関数のあるモジュール。Bot のプロセスでは読み込まない（matplotlib などの import に時間がかかるため）
+CHARTS_MODULE = "core.charts"
+
+
+def _warm_up():
+    # ワーカー起動時に matplotlib などを読み込んでおき、最初の描画を速くする
+    importlib.import_module(CHARTS_MODULE)
+
+
+def _call(name: str, *args):
+    return getattr(importlib.import_module(CHARTS_MODULE), name)(*args)
+
+
+def _ready():
+    return None
+
+
+class RenderPool:
+    """
+    グラフ描画用のプロセスプール。
+
+    描画（matplotlib）はイベントループを止めないよう別プロセスで行い、PNG のバイト列を受け取る。
+    描画関数は core/charts.py の関数名で指定し、ワーカーの中で読み込む。
+    実行中＋待ちの件数が max_pending に達したら RenderPoolBusy を投げ、
+    コマンドの連打でワーカーの待ち行列が際限なく伸びないようにする。
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+
+    @property
+    def busy(self) -> bool:
+        return self.pending >= self.max_pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Bot はスレッドを持つので、fork ではなく spawn でワーカーを作る
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            )
+        return self._executor
+
+    async def warm(self):
+        """
+        ワーカーをすべて起動して描画モジュールを読み込ませておく（最初のグラフのコマンドを速くする）。
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, _ready) for _ in range(self.max_workers)))
+
+    async def render(self, name: str, *args) -> bytes:
+        """
+        core/charts.py の name(*args) をワーカープロセスで実行して結果を返す。
+        """
+        if self.busy:
+            raise RenderPoolBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), _call, name, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
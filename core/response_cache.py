@@ -0,0 +1,33 @@
+import gzip
+
+from core.lru import SizedLRU
+
+
+class EncodedBody:
+    """
+    JSON に変換したレスポンスのバイト列と、その gzip 圧縮。
+    min_gzip_bytes より小さいものは圧縮しない（gzip は None）。
+    """
+
+    def __init__(self, raw: bytes, min_gzip_bytes: int = 1024):
+        self.raw = raw
+        # 毎回同じバイト列になるよう mtime を固定する（ETag は圧縮前後で別にしている）
+        self.gzip = gzip.compress(raw, compresslevel=6, mtime=0) if len(raw) >= min_gzip_bytes else None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.raw) + (len(self.gzip) if self.gzip is not None else 0)
+
+
+class ResponseCache(SizedLRU):
+    """
+    API のレスポンス（EncodedBody）の LRU キャッシュ。
+
+    キーはレスポンスの ETag（backend/main.py の data_etag / closed_etag）。データのバージョンや日付が変わると
+    ETag が変わり、古いレスポンスは参照されなくなって LRU で追い出される。
+    締まった過去の期間（先月以前の月次レポートなど）は RollupStore.version(期間) をバージョンにするので、
+    その期間の集計が変わらない限り1回だけ計算すればよい。合計サイズ（raw と gzip）が max_bytes を超えたら古いものから捨てる。
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        super().__init__(max_bytes, name="response", sizeof=lambda body: body.nbytes)
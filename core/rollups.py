@@ -0,0 +1,522 @@
+"""
+日別の集計テーブル（ロールアップ）。
+
+(日, チャンネル)・(日, ユーザー)・(日, 時) ごとの合計時間を SQLite に保存しておき、
+今日の使用時間・週間グラフ・累計・ランキング・月次レポート・時間帯のヒートマップをここから答える。
+問い合わせのコストは「期間の日数 × チャンネル数」程度で、ログの件数には依存しない。
+
+日をまたぐセッションは0時で分けて、それぞれの日に入れる（core/intervals.py）。
+(日, 時) の集計は毎時0分で分けた時間。
+sync() は保存先から前回以降に追記されたセッションだけを取り出して加算する。
+どこまで加算したかは保存先のカーソル（SQLite は sessions の id、CSV は追記された順の行数。
+storage.session_cursor() を参照）として保存しているので、Bot と API の両方が sync() しても二重には数えず、
+時計が戻ったあとや別のプロセスが過去の end_time で書いたセッションも取りこぼさない。
+差分がもう読めない場合（未取り込みの行がアーカイブへ移った、保存先が作り直された）は保存先から作り直す。
+取り込みのたびに revision を1つ進め、値が変わった日に記録しておくので、
+version(start_day, end_day) で「その期間の集計が最後に変わった時点」が分かる（グラフのキャッシュ用）。
+
+ユーザー別のタイムライン用に、確定したセッションを (user_id, start_time) の索引付きで
+user_sessions にも写しておく。あるユーザーのセッションの一覧・集計はこの索引の範囲だけを読むので、
+コストはそのユーザーのセッション数で決まり、ログ全体の件数には依存しない。
+
+集計の形式が古い（LAYOUT より前の）集計テーブルは、最初の sync() で保存先から作り直す。
+
+集計テーブルも保存先と同じくギルドごとに分かれている（get_rollups(guild_id)）。
+
+壊れた場合はログから作り直せる:
+    python -m core.rollups rebuild
+    python -m core.rollups rebuild --guild-id 123456789012345678
+"""
+import argparse
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from core import config
+from core.intervals import clip_buckets, hour_of_week, split_intervals, split_sessions
+from core.metrics import STAGE_SECONDS
+from core.storage import get_storage, partition_path
+
+# format_timestamp と同じ形式（文字列の大小がそのまま時刻順になる）
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class RollupStore:
+    # 集計の形式。1: 開始日にまとめて入れる / 2: 日をまたぐセッションを分け、(日, 時) の集計と user_sessions を持つ
+    # 3: 取り込んだ位置を end_time（watermark）ではなく保存先のカーソルで持つ
+    LAYOUT = 3
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS daily_channel (
+        day TEXT NOT NULL,
+        channel_id INTEGER,
+        channel_name TEXT,
+        duration_hour REAL NOT NULL,
+        PRIMARY KEY (day, channel_id, channel_name)
+    );
+    CREATE TABLE IF NOT EXISTS daily_user (
+        day TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        duration_hour REAL NOT NULL,
+        PRIMARY KEY (day, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS day_revision (
+        day TEXT PRIMARY KEY,
+        revision INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS hourly (
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        duration_hour REAL NOT NULL,
+        PRIMARY KEY (day, hour)
+    );
+    CREATE TABLE IF NOT EXISTS user_sessions (
+        user_id INTEGER NOT NULL,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL,
+        channel_id INTEGER,
+        channel_name TEXT,
+        duration_hour REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_sessions_user_start ON user_sessions (user_id, start_time);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._layout_ready = False
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def cursor(self):
+        """
+        保存先のセッションをどこまで加算したか（storage.session_cursor() の値。まだ何も取り込んでいなければ None）。
+        """
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'cursor'").fetchone()
+        return int(row[0]) if row else None
+
+    @property
+    def revision(self) -> int:
+        """
+        最後の取り込みの revision（まだ何も取り込んでいなければ 0）。
+        """
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
+    def changed_days(self, since_revision: int) -> list:
+        """
+        revision が since_revision より後に変わった日の一覧。
+        """
+        rows = self.connection().execute(
+            "SELECT day FROM day_revision WHERE revision > ? ORDER BY day", (since_revision,)
+        ).fetchall()
+        return [date.fromisoformat(day) for day, in rows]
+
+    @contextmanager
+    def snapshot(self):
+        """
+        with の中の問い合わせが、同じ時点の集計を読むようにする（途中で他のプロセスが取り込んでも混ざらない）。
+        """
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            conn.execute("COMMIT")
+
+    def version(self, start_day: date = None, end_day: date = None) -> int:
+        """
+        [start_day, end_day) のどこかの集計が最後に変わった revision。変わっていなければ同じ値を返す。
+        """
+        where, params = self._where(start_day, end_day)
+        row = self.connection().execute(f"SELECT MAX(revision) FROM day_revision {where}", params).fetchone()
+        return row[0] or 0
+
+    def _next_revision(self, conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        revision = int(row[0]) + 1 if row else 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)", (str(revision),))
+        return revision
+
+    # ── 更新 ─────────────────────────────────────────────
+    def sync(self, storage) -> int:
+        """
+        保存先から、カーソルより後に追記されたセッションを取り込む。取り込んだ件数を返す。
+        """
+        if not self._layout_ready:
+            self._upgrade(storage)
+        cursor = self.cursor
+        sessions, next_cursor = storage.sessions_since(cursor or 0)
+        if sessions is not None and sessions.empty:
+            return 0
+
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 別プロセスが先に取り込んでいる場合があるので、ロックを取ってから確かめて読み直す
+            current = self.cursor
+            if current != cursor:
+                sessions, next_cursor = storage.sessions_since(current or 0)
+            if sessions is None:
+                print("集計テーブルに取り込んでいないセッションが読めないため、保存先から作り直します。")
+                count = self._rebuild(conn, storage)
+            else:
+                if not sessions.empty:
+                    with STAGE_SECONDS.time(stage="aggregate"):
+                        self._add(conn, sessions)
+                    self._set_cursor(conn, next_cursor)
+                count = len(sessions)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def _upgrade(self, storage):
+        """
+        形式の古い（LAYOUT より前の）集計テーブルなら、保存先から作り直す。
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()
+            if row is None or int(row[0]) < self.LAYOUT:
+                # 何か取り込み済み（LAYOUT 2 までは watermark、3 からは cursor を持つ）なら作り直す
+                if conn.execute("SELECT 1 FROM meta WHERE key IN ('watermark', 'cursor')").fetchone():
+                    print("集計テーブルの形式が古いため、保存先から作り直します。")
+                    self._rebuild(conn, storage)
+                else:
+                    self._set_layout(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._layout_ready = True
+
+    def _set_layout(self, conn: sqlite3.Connection):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('layout', ?)", (str(self.LAYOUT),))
+
+    @staticmethod
+    def _set_cursor(conn: sqlite3.Connection, cursor: int):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('cursor', ?)", (str(cursor),))
+
+    @staticmethod
+    def _add_user_sessions(conn: sqlite3.Connection, sessions: pd.DataFrame):
+        # 索引の順に並べてから入れると、索引の更新が同じページにまとまって速い
+        sessions = sessions.sort_values(["user_id", "start_time"], kind="stable")
+        channel_id = sessions["channel_id"].astype("Int64").astype(object)
+        channel_name = sessions["channel_name"].astype(object)
+        conn.executemany(
+            "INSERT INTO user_sessions (user_id, start_time, end_time, channel_id, channel_name, duration_hour) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            zip(
+                sessions["user_id"].astype("int64").tolist(),
+                sessions["start_time"].dt.strftime(TIMESTAMP_FORMAT).tolist(),
+                sessions["end_time"].dt.strftime(TIMESTAMP_FORMAT).tolist(),
+                channel_id.where(channel_id.notna(), None).tolist(),
+                channel_name.where(channel_name.notna(), None).tolist(),
+                sessions["duration_hour"].astype(float).tolist(),
+            ),
+        )
+
+    def _add(self, conn: sqlite3.Connection, sessions: pd.DataFrame):
+        # 日をまたぐセッションは日ごとに分けて、それぞれの日に入れる
+        days = split_sessions(sessions, "day", columns=["user_id", "channel_id", "channel_name"])
+        days = days.rename(columns={"bucket": "day"})
+
+        revision = self._next_revision(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO day_revision (day, revision) VALUES (?, ?)",
+            [(day, revision) for day in days["day"].drop_duplicates().dt.strftime("%Y-%m-%d")],
+        )
+
+        # 行ごとに Timestamp を文字列にすると遅いので、列ごとにまとめて変換する
+        by_channel = days.groupby(["day", "channel_id", "channel_name"], dropna=False)["duration_hour"].sum().reset_index()
+        channel_id = by_channel["channel_id"].astype("Int64").astype(object)
+        channel_name = by_channel["channel_name"].astype(object)
+        conn.executemany(
+            "INSERT INTO daily_channel (day, channel_id, channel_name, duration_hour) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (day, channel_id, channel_name) "
+            "DO UPDATE SET duration_hour = duration_hour + excluded.duration_hour",
+            zip(
+                by_channel["day"].dt.strftime("%Y-%m-%d").tolist(),
+                channel_id.where(channel_id.notna(), None).tolist(),
+                channel_name.where(channel_name.notna(), None).tolist(),
+                by_channel["duration_hour"].astype(float).tolist(),
+            ),
+        )
+
+        by_user = days.groupby(["day", "user_id"])["duration_hour"].sum().reset_index()
+        conn.executemany(
+            "INSERT INTO daily_user (day, user_id, duration_hour) VALUES (?, ?, ?) "
+            "ON CONFLICT (day, user_id) DO UPDATE SET duration_hour = duration_hour + excluded.duration_hour",
+            zip(
+                by_user["day"].dt.strftime("%Y-%m-%d").tolist(),
+                by_user["user_id"].astype("int64").tolist(),
+                by_user["duration_hour"].astype(float).tolist(),
+            ),
+        )
+
+        # 毎時0分で分けた時間を (日, 時) ごとに足す
+        _, bucket, hours = split_intervals(sessions["start_time"].to_numpy(), sessions["end_time"].to_numpy(), "hour")
+        by_hour = pd.Series(hours).groupby(bucket).sum()
+        conn.executemany(
+            "INSERT INTO hourly (day, hour, duration_hour) VALUES (?, ?, ?) "
+            "ON CONFLICT (day, hour) DO UPDATE SET duration_hour = duration_hour + excluded.duration_hour",
+            zip(
+                by_hour.index.strftime("%Y-%m-%d").tolist(),
+                by_hour.index.hour.tolist(),
+                by_hour.astype(float).tolist(),
+            ),
+        )
+        self._add_user_sessions(conn, sessions)
+
+    def rebuild(self, storage) -> int:
+        """
+        集計テーブルを空にして、保存先の全セッションから作り直す。
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count = self._rebuild(conn, storage)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._layout_ready = True
+        return count
+
+    def _rebuild(self, conn: sqlite3.Connection, storage) -> int:
+        for table in ("daily_channel", "daily_user", "hourly", "user_sessions"):
+            conn.execute(f"DELETE FROM {table}")
+        # LAYOUT 2 までの watermark は使わない
+        conn.execute("DELETE FROM meta WHERE key = 'watermark'")
+        # 読んでいる間に追記された行は次の sync() で取り込むので、先にカーソルを決めてそこまでを読む
+        cursor = storage.session_cursor()
+        # 全件を一度に読まないよう、少しずつ足し込む
+        count = 0
+        for sessions in storage.session_chunks(until=cursor):
+            if sessions.empty:
+                continue
+            self._add(conn, sessions)
+            count += len(sessions)
+        self._set_cursor(conn, cursor)
+        self._set_layout(conn)
+        # 作り直す前の日の値を使ったキャッシュも無効にする
+        conn.execute("UPDATE day_revision SET revision = ?", (self._next_revision(conn),))
+        return count
+
+    # ── 問い合わせ ───────────────────────────────────────
+    # 期間は日付で [start_day, end_day) を指定する
+    def _query(self, sql: str, params=(), date_columns=()) -> pd.DataFrame:
+        with STAGE_SECONDS.time(stage="aggregate"):
+            df = pd.read_sql_query(sql, self.connection(), params=params)
+            for col in date_columns:
+                df[col] = pd.to_datetime(df[col]).dt.date
+        return df
+
+    @staticmethod
+    def _where(start_day: date, end_day: date):
+        clauses, params = [], []
+        if start_day is not None:
+            clauses.append("day >= ?")
+            params.append(start_day.isoformat())
+        if end_day is not None:
+            clauses.append("day < ?")
+            params.append(end_day.isoformat())
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def channel_usage(self, start_day: date = None, end_day: date = None) -> pd.DataFrame:
+        where, params = self._where(start_day, end_day)
+        return self._query(
+            f"SELECT channel_id, channel_name, SUM(duration_hour) AS duration_hour FROM daily_channel {where} "
+            "GROUP BY channel_id, channel_name ORDER BY channel_id, channel_name",
+            params,
+        )
+
+    def daily_channel_usage(self, start_day: date, end_day: date) -> pd.DataFrame:
+        where, params = self._where(start_day, end_day)
+        return self._query(
+            f"SELECT day AS date, channel_id, channel_name, duration_hour FROM daily_channel {where} "
+            "ORDER BY day, channel_id, channel_name",
+            params, date_columns=["date"],
+        )
+
+    def daily_usage(self, start_day: date, end_day: date) -> pd.DataFrame:
+        where, params = self._where(start_day, end_day)
+        return self._query(
+            f"SELECT day AS date, SUM(duration_hour) AS duration_hour FROM daily_channel {where} "
+            "GROUP BY day ORDER BY day",
+            params, date_columns=["date"],
+        )
+
+    def daily_user_usage(self, start_day: date = None, end_day: date = None, days: list = None) -> pd.DataFrame:
+        """
+        日付・ユーザー別の合計。days を渡すとその日だけ。
+        """
+        where, params = self._where(start_day, end_day)
+        if days is not None:
+            where = f"{where} {'AND' if where else 'WHERE'} day IN ({', '.join('?' * len(days))})"
+            params += [day.isoformat() for day in days]
+        return self._query(
+            f"SELECT day AS date, user_id, duration_hour FROM daily_user {where} ORDER BY day, user_id",
+            params, date_columns=["date"],
+        )
+
+    def user_usage(self, start_day: date = None, end_day: date = None) -> pd.DataFrame:
+        where, params = self._where(start_day, end_day)
+        return self._query(
+            f"SELECT user_id, SUM(duration_hour) AS duration_hour FROM daily_user {where} "
+            "GROUP BY user_id ORDER BY user_id",
+            params,
+        )
+
+    # ── ユーザー別のタイムライン ─────────────────────────
+    # user_sessions の (user_id, start_time) の索引の範囲だけを読むので、コストはそのユーザーのセッション数で決まる
+    @staticmethod
+    def _user_where(user_id: int, start_day: date, end_day: date):
+        # 'YYYY-MM-DD' は同じ日の 'YYYY-MM-DD HH:MM:SS.ffffff' より小さいので、日付のまま比べられる
+        clauses, params = ["user_id = ?"], [user_id]
+        if start_day is not None:
+            clauses.append("start_time >= ?")
+            params.append(start_day.isoformat())
+        if end_day is not None:
+            clauses.append("start_time < ?")
+            params.append(end_day.isoformat())
+        return clauses, params
+
+    def user_session_rows(self, user_id: int, start_day: date = None, end_day: date = None, after: tuple = None,
+                          limit: int = None, descending: bool = False) -> list:
+        """
+        ユーザーの [start_day, end_day) に始まったセッションを start_time 順に limit 件返す。
+        各行は (id, start_time, end_time, channel_id, channel_name, duration_hour) で、時刻は保存形式の文字列。
+        after に前のページの最後の行の (start_time, id) を渡すと、その続きから返す（カーソル）。
+        """
+        clauses, params = self._user_where(user_id, start_day, end_day)
+        if after is not None:
+            clauses.append(f"(start_time, rowid) {'<' if descending else '>'} (?, ?)")
+            params += list(after)
+        direction = "DESC" if descending else "ASC"
+        sql = (
+            "SELECT rowid, start_time, end_time, channel_id, channel_name, duration_hour FROM user_sessions "
+            f"WHERE {' AND '.join(clauses)} ORDER BY start_time {direction}, rowid {direction}"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with STAGE_SECONDS.time(stage="aggregate"):
+            return self.connection().execute(sql, params).fetchall()
+
+    def user_sessions(self, user_id: int, start_day: date = None, end_day: date = None) -> pd.DataFrame:
+        """
+        ユーザーの [start_day, end_day) に始まったセッションを、保存先の sessions() と同じ列で返す。
+        """
+        clauses, params = self._user_where(user_id, start_day, end_day)
+        df = self._query(
+            "SELECT user_id, channel_id, channel_name, start_time, end_time, duration_hour FROM user_sessions "
+            f"WHERE {' AND '.join(clauses)} ORDER BY start_time, rowid",
+            params,
+        )
+        for col in ("start_time", "end_time"):
+            df[col] = pd.to_datetime(df[col], format="ISO8601")
+        return df
+
+    def user_summary(self, user_id: int, start_day: date = None, end_day: date = None) -> dict:
+        """
+        ユーザーの [start_day, end_day) に始まったセッションの集計。
+        totals は件数・合計・最長・最初の開始・最後の終了・記録のある日数、
+        channels はチャンネル別の合計（多い順）、daily はその時間を0時で分けた日別の合計（日付順）。
+        """
+        sessions = self.user_sessions(user_id, start_day, end_day)
+        with STAGE_SECONDS.time(stage="aggregate"):
+            days = split_sessions(sessions, "day")
+            daily = days.groupby("bucket")["duration_hour"].sum()
+            daily = pd.DataFrame({"date": daily.index.date, "duration_hour": daily.to_numpy()})
+            channels = (
+                sessions.groupby(["channel_id", "channel_name"], dropna=False)["duration_hour"]
+                .agg(duration_hour="sum", sessions="count")
+                .reset_index()
+                .sort_values("duration_hour", ascending=False, kind="stable")
+            )
+        totals = {
+            "sessions": len(sessions),
+            "total_hour": float(sessions["duration_hour"].sum()),
+            "longest_hour": float(sessions["duration_hour"].max()) if len(sessions) else 0.0,
+            "first_start": sessions["start_time"].min() if len(sessions) else None,
+            "last_end": sessions["end_time"].max() if len(sessions) else None,
+            "active_days": int((daily["duration_hour"] > 0).sum()),
+        }
+        return {"totals": totals, "channels": channels, "daily": daily}
+
+    # ── 時間帯のヒートマップ ─────────────────────────────
+    def weekly_heatmap(self, start_day: date = None, end_day: date = None) -> np.ndarray:
+        """
+        [start_day, end_day) の (曜日, 時) ごとの合計時間。7×24 の配列で、行は月曜日から。
+        """
+        where, params = self._where(start_day, end_day)
+        df = self._query(f"SELECT day, hour, duration_hour FROM hourly {where}", params)
+        bucket = pd.to_datetime(df["day"]).to_numpy() + pd.to_timedelta(df["hour"], unit="h").to_numpy()
+        return hour_of_week(bucket, df["duration_hour"].to_numpy())
+
+    def user_weekly_heatmap(self, user_id: int, start_day: date = None, end_day: date = None) -> np.ndarray:
+        """
+        ユーザーの [start_day, end_day) の (曜日, 時) ごとの合計時間（weekly_heatmap と同じ形）。
+        前日に始まって start_day にまたがるセッションも含めるため、1日前に始まった分から読む。
+        """
+        sessions = self.user_sessions(user_id, start_day - timedelta(days=1) if start_day else None, end_day)
+        _, bucket, hours = split_intervals(sessions["start_time"].to_numpy(), sessions["end_time"].to_numpy(), "hour")
+        return hour_of_week(*clip_buckets(bucket, hours, start_day, end_day))
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_rollups(guild_id: int = None, create: bool = False) -> RollupStore:
+    """
+    ギルドの集計テーブルを返す。プロセス内でギルドごとに1つのインスタンスを共有する。
+    まだ保存先がないギルドは get_storage() と同じく、create=True でなければ FileNotFoundError。
+    """
+    if guild_id == config.DEFAULT_GUILD_ID:
+        guild_id = None
+    with _rollups_lock:
+        rollups = _rollups.get(guild_id)
+        if rollups is None:
+            rollups = _rollups[guild_id] = RollupStore(partition_path(guild_id, config.ROLLUP_PATH, create))
+        return rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "sync"], help="rebuild: 全件から作り直す / sync: 差分を取り込む")
+    parser.add_argument("--guild-id", type=int, default=None, help="対象のギルド（省略時は DEFAULT_GUILD_ID の保存先）")
+    args = parser.parse_args()
+
+    rollups, storage = get_rollups(args.guild_id), get_storage(args.guild_id)
+    if args.command == "rebuild":
+        count = rollups.rebuild(storage)
+        print(f"{count} 件のセッションから集計テーブルを作り直しました。")
+    else:
+        count = rollups.sync(storage)
+        print(f"{count} 件のセッションを取り込みました。")
+
+
+if __name__ == "__main__":
+    main()
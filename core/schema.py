@@ -0,0 +1,6 @@
+"""
+ログファイルの列定義。pandas に依存しないモジュールからも使えるようにここにまとめる。
+"""
+
+# vc_logs.csv の列。guild_id はギルドごとの保存先に分ける前のログにはない
+LOG_COLUMNS = ["user_id", "timestamp", "action", "channel_id", "channel_name", "guild_id"]
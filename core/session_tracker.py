@@ -0,0 +1,120 @@
+"""
+ユーザーごとのセッション状態機械（VCLogger 用）。
+
+ボイスチャンネルの状態変化を受け取り、保存先に書くイベント（join / leave）と
+確定したセッションを返す。保存先はイベントを後から突き合わせ直さなくても、
+返されたセッションをそのまま sessions に追記すればよい。
+
+  join        入室。すでに別のチャンネルにいる扱いなら、移動として前のセッションを閉じる
+  move        移動。前のチャンネルで leave、新しいチャンネルで join を記録してセッションを閉じる
+  leave       退出。入室中ならセッションを閉じる
+  disconnect  Bot の停止。入室中のセッションをすべてその時刻で閉じる
+  reconcile   実際のボイスチャンネルのメンバーと突き合わせる（leave の取りこぼし対策）
+
+ユーザーは複数のギルドで同時に入室できるので、ギルドごとに1つ作る。
+返すイベントとセッションには guild_id が付く（書き込み先のギルドの振り分けに使う）。
+"""
+from datetime import datetime
+
+from core.presence import PresenceIndex
+
+
+class SessionTracker:
+    def __init__(self, guild_id: int = None, presence: PresenceIndex = None):
+        self.guild_id = guild_id
+        self.presence = presence if presence is not None else PresenceIndex()
+
+    # ── 状態遷移 ─────────────────────────────────────────
+    # いずれも (書き込むイベントのリスト, 確定したセッションのリスト) を返す
+    def join(self, user_id: int, channel_id: int, channel_name: str, timestamp: datetime):
+        entry = self.presence.get(user_id)
+        if entry is not None:
+            if entry[0] == channel_id:
+                # 同じチャンネルへの重複した join は無視する
+                return [], []
+            return self.move(user_id, channel_id, channel_name, timestamp)
+        self.presence.join(user_id, channel_id, channel_name, timestamp)
+        return [self._event(user_id, timestamp, "join", channel_id, channel_name)], []
+
+    def move(self, user_id: int, channel_id: int, channel_name: str, timestamp: datetime):
+        events, sessions = self.leave(user_id, None, None, timestamp)
+        self.presence.join(user_id, channel_id, channel_name, timestamp)
+        events.append(self._event(user_id, timestamp, "join", channel_id, channel_name))
+        return events, sessions
+
+    def leave(self, user_id: int, channel_id: int, channel_name: str, timestamp: datetime):
+        """
+        入室中でなければ、渡されたチャンネルで leave だけを記録する（従来どおり）。
+        """
+        entry = self.presence.leave(user_id)
+        if entry is None:
+            if channel_id is None:
+                return [], []
+            return [self._event(user_id, timestamp, "leave", channel_id, channel_name)], []
+        return self._close(user_id, entry, timestamp)
+
+    def discard(self, user_id: int, timestamp: datetime):
+        """
+        退出時刻が分からない入室状態を、集計に入れずに破棄する（channel_id なしの leave を記録）。
+        """
+        if self.presence.leave(user_id) is None:
+            return [], []
+        return [self._event(user_id, timestamp, "leave", None, None)], []
+
+    def disconnect(self, timestamp: datetime):
+        events, sessions = [], []
+        for user_id, _ in self.presence.items():
+            e, s = self.leave(user_id, None, None, timestamp)
+            events += e
+            sessions += s
+        return events, sessions
+
+    def reconcile(self, current: dict, timestamp: datetime, close_missing: bool = True):
+        """
+        current（user_id -> (channel_id, channel_name)）に状態を合わせる。
+          - current にいない入室中のユーザー: close_missing なら timestamp で閉じ、そうでなければ破棄する
+          - 入室中でない / 別のチャンネルにいるユーザー: timestamp で join（移動）する
+        """
+        events, sessions = [], []
+        for user_id, _ in self.presence.items():
+            if user_id not in current:
+                if close_missing:
+                    e, s = self.leave(user_id, None, None, timestamp)
+                else:
+                    e, s = self.discard(user_id, timestamp)
+                events += e
+                sessions += s
+        for user_id, (channel_id, channel_name) in current.items():
+            e, s = self.join(user_id, channel_id, channel_name, timestamp)
+            events += e
+            sessions += s
+        return events, sessions
+
+    # ── 内部 ─────────────────────────────────────────────
+    def _close(self, user_id: int, entry: tuple, timestamp: datetime):
+        channel_id, channel_name, start_time = entry
+        leave = self._event(user_id, timestamp, "leave", channel_id, channel_name)
+        if channel_id is None:
+            return [leave], []
+
+        end_time = max(timestamp, start_time)
+        session = {
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "channel_name": channel_name,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration_hour": (end_time - start_time).total_seconds() / 3600.0,
+            "guild_id": self.guild_id,
+        }
+        return [leave], [session]
+
+    def _event(self, user_id, timestamp, action, channel_id, channel_name) -> dict:
+        return {
+            "user_id": user_id,
+            "timestamp": timestamp,
+            "action": action,
+            "channel_id": channel_id,
+            "channel_name": channel_name,
+            "guild_id": self.guild_id,
+        }
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+SESSION_COLUMNS = ["user_id", "channel_id", "channel_name", "start_time", "end_time", "duration_hour"]
+
+
+def empty_sessions() -> pd.DataFrame:
+    """
+    セッションが1件もないときに返す空のDataFrame。
+    """
+    return pd.DataFrame(columns=SESSION_COLUMNS)
+
+
+def calculate_sessions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    join と leave のペアからボイスチャット滞在時間を計算する。
+    iterrows() で1行ずつ状態を追う従来の実装と同じ結果を、
+    ユーザーごとの安定ソートと1行ずらし(shift)の比較だけで求める。
+
+    ペアリングのルール（従来の実装と同じ）:
+      - join はそのユーザーの直前の join を上書きする
+      - leave は直前の join と同じチャンネルのときだけセッションになる
+      - leave の後は状態を破棄する（チャンネル不一致でも破棄）
+      - 対応する join がない leave は無視する
+
+    df は timestamp で並べ替え済みであること（行の並び順で処理する）。
+    結果として
+      user_id, channel_id, channel_name, start_time, end_time, duration_hour
+    のデータを leave の発生順で返す。channel_name は df に列があるときのみ含む。
+    """
+    has_name = "channel_name" in df.columns
+    columns = SESSION_COLUMNS if has_name else [c for c in SESSION_COLUMNS if c != "channel_name"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    actions = df["action"].to_numpy()
+    events = df[(actions == "join") | (actions == "leave")]
+    if events.empty:
+        return pd.DataFrame(columns=columns)
+
+    # ユーザーごとにまとめる。安定ソートなのでユーザー内の順序は元のまま
+    user_codes, _ = pd.factorize(events["user_id"], use_na_sentinel=False)
+    order = np.argsort(user_codes, kind="stable")
+
+    codes_s = user_codes[order]
+    is_join_s = (events["action"].to_numpy() == "join")[order]
+    # チャンネルも符号化して比較する。欠損(-1)はどのチャンネルとも一致しない
+    channel_codes, _ = pd.factorize(events["channel_id"])
+    channels_s = channel_codes[order]
+
+    # leave の直前（同じユーザー）が join なら、それが有効な入室状態
+    # 直前が leave なら状態は既に破棄されている
+    paired = (
+        ~is_join_s[1:]
+        & is_join_s[:-1]
+        & (codes_s[1:] == codes_s[:-1])
+        & (channels_s[1:] == channels_s[:-1])
+        & (channels_s[1:] != -1)
+    )
+    leave_s = np.flatnonzero(paired) + 1
+
+    # 元の行位置に戻し、leave の発生順に並べる
+    leave_pos = order[leave_s]
+    join_pos = order[leave_s - 1]
+    by_leave = np.argsort(leave_pos, kind="stable")
+    leave_pos = leave_pos[by_leave]
+    join_pos = join_pos[by_leave]
+
+    leaves = events.iloc[leave_pos]
+    start_time = events["timestamp"].iloc[join_pos].reset_index(drop=True)
+    end_time = leaves["timestamp"].reset_index(drop=True)
+
+    sessions = pd.DataFrame({
+        "user_id": leaves["user_id"].reset_index(drop=True),
+        "channel_id": leaves["channel_id"].reset_index(drop=True),
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration_hour": (end_time - start_time).dt.total_seconds() / 3600.0,
+    })
+    if has_name:
+        sessions.insert(2, "channel_name", leaves["channel_name"].reset_index(drop=True))
+    return sessions
+
+
+def pending_joins(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    まだ leave していない join 行（ユーザーごとに最後の join/leave が join のもの）を返す。
+    df の続きのイベントとペアリングするときに、先頭に付けて使う。
+    """
+    moves = df[df["action"].isin(["join", "leave"])]
+    last = moves.drop_duplicates("user_id", keep="last")
+    return last[last["action"] == "join"]
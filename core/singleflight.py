@@ -0,0 +1,42 @@
+"""
+同じ計算を同時に何度も実行しないための single-flight（asyncio 用）。
+
+run(key, start) は、同じ key の計算が実行中ならその完了を待って同じ結果を返し、
+なければ start() で計算を始める。終わった計算は覚えておかない（結果のキャッシュではない）ので、
+key には計算の種類・パラメータに加えてデータのバージョンを含めておけば、
+古いデータの結果を後から来たリクエストに返すことはない。
+"""
+import asyncio
+
+from core.metrics import CACHE_REQUESTS
+
+
+class SingleFlight:
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._inflight = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key, start):
+        """
+        start は awaitable（コルーチンや Future）を返す関数。例外も待っている全員に伝わる。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            CACHE_REQUESTS.inc(cache=self.name, result="executed")
+            task = asyncio.ensure_future(start())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            CACHE_REQUESTS.inc(cache=self.name, result="shared")
+        # 待っているリクエストの1つが切断されても、計算自体は取り消さない
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 誰も待っていなかった場合に「例外が取り出されていない」警告を出さない
+            task.exception()
@@ -0,0 +1,97 @@
+"""
+Bot の起動まわり: 起動時間の計測と、スラッシュコマンドの同期の省略。
+
+起動時間はプロセスの開始（/proc にあればインタープリターの起動、なければこのモジュールの読み込み）から
+各段階（import / login / 拡張の読み込み / コマンドの同期 / ready など）までの秒数で記録し、
+vc_bot_startup_seconds{phase} にも出す。
+
+tree.sync() はすべてのグローバルコマンドを Discord に登録し直すうえ、レート制限も厳しい。
+コマンドの定義（名前・説明・引数・権限など）のハッシュを COMMAND_SYNC_STATE_PATH に残しておき、
+前回の同期から変わったときだけ同期する。
+"""
+import hashlib
+import json
+import os
+import time
+
+from core import config
+from core.metrics import STARTUP_SECONDS
+
+
+def process_start_time() -> float:
+    """
+    このプロセスが始まった時刻（time.time() と同じ基準）。/proc のない環境では今の時刻。
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime "))
+        return boot_time + started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, StopIteration, ValueError, IndexError):
+        return time.time()
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started_at = process_start_time()
+        self.phases = []
+
+    def mark(self, phase: str) -> float:
+        """
+        プロセスの開始から今までの秒数を phase として記録して返す。
+        """
+        elapsed = time.time() - self.started_at
+        self.phases.append((phase, elapsed))
+        STARTUP_SECONDS.set(elapsed, phase=phase)
+        return elapsed
+
+    def report(self) -> str:
+        lines = ["起動時間（プロセスの開始から）:"]
+        previous = 0.0
+        for phase, elapsed in self.phases:
+            lines.append(f"  {phase:<28} {elapsed:7.2f} 秒 (+{elapsed - previous:.2f})")
+            previous = elapsed
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+def command_tree_hash(tree) -> str:
+    """
+    コマンドツリーに登録されたグローバルコマンドの定義のハッシュ。
+    """
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c["type"], c["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _read_state(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+async def sync_commands(tree, application_id: int, mode: str = None, path: str = None) -> bool:
+    """
+    mode が auto ならコマンドの定義が前回の同期から変わったときだけ、always なら毎回 tree.sync() する。
+    同期したら True。前回のハッシュはアプリケーション（Bot）ごとに path に保存する。
+    """
+    mode = mode or config.COMMAND_SYNC
+    path = path or config.COMMAND_SYNC_STATE_PATH
+    if mode == "off":
+        return False
+    digest = command_tree_hash(tree)
+    state = _read_state(path)
+    if mode == "auto" and state.get(str(application_id)) == digest:
+        return False
+    await tree.sync()
+    state[str(application_id)] = digest
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return True
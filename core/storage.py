@@ -0,0 +1,830 @@
+"""
+VCログの保存先。CSV と SQLite のどちらかを設定(STORAGE_BACKEND)で選ぶ。
+
+どちらも同じメソッドを持ち、書き込み側(VCLogger)は append_events() と、
+SessionTracker が確定させたセッションの append_sessions()、
+読み出し側(API・統計コマンド)は期間を指定した集計メソッドを呼ぶ。
+セッションは書き込み時に確定済みなので、読み出し側でイベントを突き合わせ直すことはない。
+集計結果はいずれも duration_hour 列（時間単位）を持つ DataFrame で返す。
+期間は start_time が [start, end) に入るセッションを対象にする。
+
+保存先はギルドごとに分かれている（get_storage(guild_id)）。
+あるギルドの集計はそのギルドのファイル / データベースだけを読む。
+
+CSV の古い期間の行は、月 / 週ごとの圧縮ファイルに移される（core/archive.py）。
+"""
+import csv
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from core import config
+from core.archive import PERIODS, LogArchive, period_start, read_raw
+from core.logcache import LogCache, SessionLogCache
+from core.metrics import REGISTRY
+from core.presence import OPEN_COLUMNS
+from core.schema import LOG_COLUMNS
+from core.sessions import SESSION_COLUMNS, empty_sessions, pending_joins
+
+
+def format_timestamp(ts: datetime) -> str:
+    """
+    SQLite に保存する時刻文字列。桁を揃えておくと文字列の大小比較がそのまま時刻順になる。
+    """
+    return ts.isoformat(sep=" ", timespec="microseconds")
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    プロセス間の排他ロック（追記とローテーションが同時に走らないようにする）。fcntl のない環境では何もしない。
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class CSVStorage:
+    """
+    イベントを data/vc_logs.csv、確定済みセッションを data/vc_sessions.csv に追記し、
+    それぞれ LogCache / SessionLogCache 経由で読み出す保存先。
+
+    vc_sessions.csv がまだない場合（セッションを別に書く前のログ）は、
+    最初に vc_logs.csv のイベントを突き合わせて作る。
+
+    rotate が month / week のときは、期間が変わって最初の書き込みの前に、
+    前の期間までの行を archive_dir へ移す（rotate()）。セッションの読み出しはアーカイブも含む。
+    """
+
+    def __init__(self, path: str, sessions_path: str = None, fsync: str = "interval", fsync_interval: float = 30.0,
+                 archive_dir: str = None, rotate: str = "off", compression: str = "gzip",
+                 cache_partitions: int = 3):
+        self.path = path
+        self.sessions_path = sessions_path or os.path.join(os.path.dirname(path), "vc_sessions.csv")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._last_fsync = time.monotonic()
+        self.lock_path = f"{path}.lock"
+        self.rotate_period = rotate if rotate in PERIODS else None
+        # ローテーションを確認済みの期間の始まり（期間が変わるまでは確認しない）
+        self._checked_period = None
+        self.archive = LogArchive(
+            archive_dir or os.path.join(os.path.dirname(path), "archive"), compression, cache_partitions,
+        )
+        self._cache = LogCache(path)
+        self._sessions_cache = SessionLogCache(self.sessions_path)
+        if not os.path.exists(self.sessions_path):
+            self._bootstrap_sessions()
+
+    @property
+    def version(self):
+        return self._cache.version + self._sessions_cache.version + (self.archive.version,)
+
+    @property
+    def files(self) -> dict:
+        return {"events": self.path, "sessions": self.sessions_path}
+
+    @property
+    def last_event_time(self):
+        """
+        読み込み済みの最後のイベントの時刻（まだ読み込んでいなければ None）。
+        """
+        return self._cache.last_timestamp
+
+    def _bootstrap_sessions(self):
+        """
+        既存のイベントログからセッションファイルを作る。Bot と API が同時に起動しても
+        片方だけが作るように、一時ファイルを書いてから os.link で置く（既にあれば何もしない）。
+        """
+        sessions = self._cache.sessions()
+        tmp_path = f"{self.sessions_path}.{os.getpid()}.tmp"
+        sessions.to_csv(tmp_path, columns=SESSION_COLUMNS, index=False, lineterminator="\n")
+        try:
+            os.link(tmp_path, self.sessions_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    # ── 書き込み ─────────────────────────────────────────
+    def append_events(self, rows: list):
+        """
+        イベントを plain な CSV 行として追記する。fsync は fsync ポリシーに従う。
+        """
+        self._maybe_rotate()
+        with file_lock(self.lock_path):
+            self._append_rows(self.path, LOG_COLUMNS, rows)
+
+    def append_sessions(self, rows: list):
+        """
+        確定したセッションを vc_sessions.csv に追記する。
+        """
+        self._maybe_rotate()
+        with file_lock(self.lock_path):
+            self._append_rows(self.sessions_path, SESSION_COLUMNS, rows)
+
+    def _maybe_rotate(self):
+        if self.rotate_period is None:
+            return
+        current = period_start(datetime.now(), self.rotate_period)
+        if current == self._checked_period:
+            return
+        try:
+            self.rotate(current)
+        except Exception as e:
+            # 書き込みは止めない。次の書き込みでもう一度試す
+            print(f"ログのローテーションでエラー: {e}")
+            return
+        self._checked_period = current
+
+    def rotate(self, boundary: datetime = None, period: str = None) -> tuple:
+        """
+        boundary（省略時は今の期間の始まり）より前のイベント・セッションをアーカイブへ移す。
+        boundary より前に始まって入室中のままの join は今のファイルに残す。
+        セッションは今のファイルの先頭から続く boundary より前に終わった行だけを移す（session_cursor() を参照）。
+        戻り値は (アーカイブへ移したイベントの行数, セッションの行数)。
+        """
+        period = period or self.rotate_period or "month"
+        boundary = boundary or period_start(datetime.now(), period)
+        with file_lock(self.lock_path):
+            manifest = self.archive.manifest()
+            hot_from = self.archive.hot_from(manifest)
+            if hot_from is not None and boundary <= hot_from:
+                return 0, 0
+            if not os.path.exists(self.path) or not os.path.exists(self.sessions_path):
+                return 0, 0
+            events = read_raw(self.path)
+            st = os.stat(self.sessions_path)
+            sessions = read_raw(self.sessions_path)
+            times = pd.to_datetime(events["timestamp"], format="ISO8601")
+            order = times.argsort(kind="stable")
+            events, times = events.iloc[order], times.iloc[order]
+            ends = pd.to_datetime(sessions["end_time"], format="ISO8601")
+
+            # 前回のローテーションで移し終えた行（途中で止まった場合に残る）は捨てる
+            skip = self._archived_head(manifest, (st.st_dev, st.st_ino), ends)
+            sessions, ends = sessions.iloc[skip:], ends.iloc[skip:]
+            if hot_from is not None:
+                # hot_from より前のイベントは、持ち越した入室中の join だけにする
+                stale = (times < hot_from).to_numpy()
+                keep = pending_joins(events[stale]).index.union(events.index[~stale])
+                events, times = events.loc[keep], times.loc[keep]
+
+            before = (times < boundary).to_numpy()
+            carried = pending_joins(events[before]).index
+            archived = events[before].drop(carried)
+            old_sessions = np.logical_and.accumulate((ends < boundary).to_numpy())
+            if archived.empty and not old_sessions.any() and hot_from is None:
+                return 0, 0
+
+            # 今のセッションファイルの一時ファイル → アーカイブ → manifest → 今のファイルの順に書く（LogArchive の説明を参照）。
+            # 一時ファイルは os.replace しても inode が変わらないので、先に作って manifest に記録する
+            sessions_tmp = self._write_tmp(self.sessions_path, sessions[~old_sessions])
+            tmp_st = os.stat(sessions_tmp)
+            hot_sessions = {"inode": [tmp_st.st_dev, tmp_st.st_ino], "skip": skip + int(old_sessions.sum())}
+            self.archive.add(archived, times.loc[archived.index], sessions[old_sessions], period, boundary, hot_sessions)
+            hot_events = pd.concat([events.loc[carried], events[~before]])
+            self._replace(self.path, hot_events.iloc[times.loc[hot_events.index].argsort(kind="stable")])
+            os.replace(sessions_tmp, self.sessions_path)
+            return len(archived), int(old_sessions.sum())
+
+    def _archived_head(self, manifest: dict, inode: tuple, ends: pd.Series) -> int:
+        """
+        今のセッションファイル（inode、end_time が ends）の先頭のうち、アーカイブへ移し終えた行数。
+        ローテーションが manifest を書いたあと、ファイルを置き換える前に読んだ（止まった）場合だけ 0 でない。
+        """
+        hot = manifest.get("hot_sessions")
+        if hot is not None:
+            return 0 if tuple(hot["inode"]) == inode else hot["skip"]
+        # hot_sessions のない manifest（取り込みで作ったもの）では、移した行は hot_from より前に終わっている
+        hot_from = self.archive.hot_from(manifest)
+        if hot_from is None or ends.empty or ends.iloc[0] >= hot_from:
+            return 0
+        return int(np.logical_and.accumulate((ends < hot_from).to_numpy()).sum())
+
+    @staticmethod
+    def _write_tmp(path: str, rows: pd.DataFrame) -> str:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        rows.to_csv(tmp_path, index=False, lineterminator="\n")
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        return tmp_path
+
+    @classmethod
+    def _replace(cls, path: str, rows: pd.DataFrame):
+        os.replace(cls._write_tmp(path, rows), path)
+
+    def _append_rows(self, path: str, columns: list, rows: list):
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not write_header:
+            # 既存のファイルはヘッダーの列に合わせて書く（guild_id 列がない古いログなど）
+            with open(path, encoding="utf-8") as f:
+                columns = f.readline().strip().split(",")
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            if write_header:
+                writer.writerow(columns)
+            # datetime は str() の "YYYY-MM-DD HH:MM:SS.ffffff" 形式（pandas の to_csv と同じ）
+            writer.writerows(
+                ["" if row.get(col) is None else str(row[col]) for col in columns]
+                for row in rows
+            )
+            f.flush()
+            if self.fsync == "batch" or (
+                self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(f.fileno())
+                self._last_fsync = time.monotonic()
+
+    def close(self):
+        if self.fsync == "never":
+            return
+        for path in (self.path, self.sessions_path):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    os.fsync(f.fileno())
+
+    # ── 読み出し ─────────────────────────────────────────
+    def _hot_sessions(self):
+        """
+        今のファイルのセッションと、そのあとに読んだ manifest、今のファイルの先頭の行のカーソル。
+        ローテーション中に読んだ場合も、アーカイブへ移し終えた行は除く（今のファイルを先に読むこと）。
+        """
+        df, inode = self._sessions_cache.snapshot()
+        manifest = self.archive.manifest()
+        skip = self._archived_head(manifest, inode, df["end_time"])
+        if skip:
+            df = df.iloc[skip:]
+        return df, manifest, self.archive.session_rows(manifest)
+
+    def sessions(self, start: datetime = None, end: datetime = None, user_id: int = None) -> pd.DataFrame:
+        df, manifest, _ = self._hot_sessions()
+        archived = self.archive.sessions(start, end, manifest=manifest)
+        if not archived.empty:
+            df = archived if df.empty else pd.concat([archived, df], ignore_index=True)
+        if df.empty:
+            return empty_sessions()
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df["start_time"] >= start
+        if end is not None:
+            mask &= df["start_time"] < end
+        if user_id is not None:
+            mask &= df["user_id"] == user_id
+        return df[mask]
+
+    def session_cursor(self) -> int:
+        """
+        今のセッションの末尾のカーソル（集計テーブルの差分用）。
+
+        カーソルはセッションが追記された順の通し番号で、アーカイブにある行数 + 今のファイルの行数。
+        ローテーションは今のファイルの先頭の行だけをアーカイブへ移すので、行が移っても番号は変わらない。
+        end_time と違い、時計が戻った・別のプロセスが書いた場合に過去の end_time で追記された行も取りこぼさない。
+        """
+        df, _, base = self._hot_sessions()
+        return base + len(df)
+
+    def sessions_since(self, cursor: int) -> tuple:
+        """
+        cursor より後に追記されたセッションと、次回用のカーソルを返す（集計テーブル・ライブ配信の差分用）。
+        差分の行がもうアーカイブへ移っている場合や、ファイルが作り直されて cursor より短い場合は
+        セッションの代わりに None を返す（呼び出し側は全体から作り直す）。
+        """
+        df, _, base = self._hot_sessions()
+        end = base + len(df)
+        if cursor < base or cursor > end:
+            return None, end
+        return df.iloc[cursor - base:], end
+
+    def session_chunks(self, chunk_rows: int = 100_000, until: int = None):
+        """
+        全セッションを chunk_rows 行ずつ返す（集計テーブルの作り直し用）。アーカイブはパーティションごとに読む。
+        until を渡すと、今のファイルのセッションはカーソルが until までの行だけにする。
+        """
+        df, manifest, base = self._hot_sessions()
+        if until is not None:
+            df = df.iloc[:max(until - base, 0)]
+        for partition in manifest["partitions"]:
+            if not partition.get("sessions"):
+                continue
+            path = os.path.join(self.archive.directory, partition["sessions"]["file"])
+            for chunk in pd.read_csv(path, chunksize=chunk_rows):
+                for col in ("start_time", "end_time"):
+                    chunk[col] = pd.to_datetime(chunk[col], format="ISO8601")
+                yield chunk
+        for pos in range(0, len(df), chunk_rows):
+            yield df.iloc[pos:pos + chunk_rows]
+
+    def events_since(self, cursor):
+        """
+        cursor 以降に追記されたイベントと次回用のカーソルを返す（ライブ配信用）。
+        初回（cursor=None）やログが読み直された場合はイベントの代わりに None を返す。
+        """
+        return self._cache.events_since(cursor)
+
+    def open_sessions(self) -> pd.DataFrame:
+        """
+        入室中（leave 待ち）のセッション。user_id, channel_id, channel_name, start_time の DataFrame。
+        """
+        df = self._cache.open_joins()
+        df = df.rename(columns={"timestamp": "start_time"}).reindex(columns=OPEN_COLUMNS)
+        return df.assign(start_time=pd.to_datetime(df["start_time"]))
+
+    def channel_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        df = self.sessions(start, end)
+        if df.empty:
+            return pd.DataFrame(columns=["channel_id", "channel_name", "duration_hour"])
+        return df.groupby(["channel_id", "channel_name"])["duration_hour"].sum().reset_index()
+
+    def daily_channel_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        df = self.sessions(start, end)
+        if df.empty:
+            return pd.DataFrame(columns=["date", "channel_id", "channel_name", "duration_hour"])
+        df = df.assign(date=df["start_time"].dt.date)
+        return df.groupby(["date", "channel_id", "channel_name"])["duration_hour"].sum().reset_index()
+
+    def daily_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        df, manifest, _ = self._hot_sessions()
+        if any(isinstance(ts, datetime) and ts != datetime(ts.year, ts.month, ts.day) for ts in (start, end)):
+            # 日の途中で区切る場合は、manifest の日別の集計が使えないのでセッションから数える
+            df, manifest = self.sessions(start, end), {"partitions": []}
+        elif not df.empty:
+            mask = pd.Series(True, index=df.index)
+            if start is not None:
+                mask &= df["start_time"] >= start
+            if end is not None:
+                mask &= df["start_time"] < end
+            df = df[mask]
+        # アーカイブの分は manifest の日別の集計から足す（ファイルは開かない）
+        totals = self.archive.daily_hour(start, end, manifest)
+        if not df.empty:
+            for day, h in df.groupby(df["start_time"].dt.strftime("%Y-%m-%d"))["duration_hour"].sum().items():
+                totals[day] = totals.get(day, 0.0) + h
+        if not totals:
+            return pd.DataFrame(columns=["date", "duration_hour"])
+        return pd.DataFrame({
+            "date": [datetime.fromisoformat(day).date() for day in sorted(totals)],
+            "duration_hour": [totals[day] for day in sorted(totals)],
+        })
+
+    def user_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        df = self.sessions(start, end)
+        if df.empty:
+            return pd.DataFrame(columns=["user_id", "duration_hour"])
+        return df.groupby("user_id")["duration_hour"].sum().reset_index()
+
+
+class SQLiteStorage:
+    """
+    イベントと確定済みセッションを SQLite に保存する保存先。
+
+    append_events() はイベントを挿入し、同じトランザクションで入室中の一覧（open_sessions テーブル）を
+    更新する。確定したセッションは append_sessions() で sessions テーブルに書く。
+    集計は期間の絞り込みと GROUP BY を SQL で行うので、期間内の行しか読まない。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        action TEXT NOT NULL,
+        channel_id INTEGER,
+        channel_name TEXT,
+        guild_id INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_events_user_timestamp ON events (user_id, timestamp);
+
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        channel_id INTEGER,
+        channel_name TEXT,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL,
+        duration_hour REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_channel_start ON sessions (channel_id, start_time);
+    CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions (start_time);
+    CREATE INDEX IF NOT EXISTS idx_sessions_user_start ON sessions (user_id, start_time);
+
+    CREATE TABLE IF NOT EXISTS open_sessions (
+        user_id INTEGER PRIMARY KEY,
+        channel_id INTEGER,
+        channel_name TEXT,
+        start_time TEXT NOT NULL
+    );
+    """
+
+    # VC_LOG_FSYNC を SQLite の synchronous 設定に対応させる（WAL モード前提）
+    SYNCHRONOUS = {"never": "OFF", "interval": "NORMAL", "batch": "FULL"}
+
+    def __init__(self, path: str, fsync: str = "interval"):
+        self.path = path
+        self.synchronous = self.SYNCHRONOUS[fsync]
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+            # guild_id 列を追加する前に作ったデータベース
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+            if "guild_id" not in columns:
+                conn.execute("ALTER TABLE events ADD COLUMN guild_id INTEGER")
+            # 差分を end_time で読んでいたときの索引（今は id で読むので使わない）
+            conn.execute("DROP INDEX IF EXISTS idx_sessions_end")
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        スレッドごとの接続を返す（API はスレッドプールから呼ばれるため）。
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def version(self):
+        row = self.connection().execute("SELECT MAX(id) FROM events").fetchone()
+        return (self.path, row[0] or 0)
+
+    @property
+    def files(self) -> dict:
+        return {"db": self.path}
+
+    @property
+    def last_event_time(self):
+        row = self.connection().execute("SELECT timestamp FROM events ORDER BY id DESC LIMIT 1").fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    # ── 書き込み ─────────────────────────────────────────
+    def append_events(self, rows: list):
+        conn = self.connection()
+        with conn:
+            for row in rows:
+                self._apply_event(conn, row)
+
+    def _apply_event(self, conn: sqlite3.Connection, row: dict):
+        ts = row["timestamp"]
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts)
+        ts_text = format_timestamp(ts)
+        user_id, channel_id, channel_name = row["user_id"], row.get("channel_id"), row.get("channel_name")
+        action = row["action"]
+        conn.execute(
+            "INSERT INTO events (user_id, timestamp, action, channel_id, channel_name, guild_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, ts_text, action, channel_id, channel_name, row.get("guild_id")),
+        )
+
+        if action == "join":
+            conn.execute(
+                "INSERT OR REPLACE INTO open_sessions (user_id, channel_id, channel_name, start_time) VALUES (?, ?, ?, ?)",
+                (user_id, channel_id, channel_name, ts_text),
+            )
+        elif action == "leave":
+            # leave 後は状態を破棄する（チャンネル不一致でも破棄）
+            conn.execute("DELETE FROM open_sessions WHERE user_id = ?", (user_id,))
+
+    def append_sessions(self, rows: list):
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO sessions (user_id, channel_id, channel_name, start_time, end_time, duration_hour) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        row["user_id"], row["channel_id"], row["channel_name"],
+                        format_timestamp(row["start_time"]), format_timestamp(row["end_time"]), row["duration_hour"],
+                    )
+                    for row in rows
+                ],
+            )
+
+    def import_frames(self, events: pd.DataFrame, sessions: pd.DataFrame, open_joins: pd.DataFrame):
+        """
+        移行ツール用: 既存ログから計算済みのイベント・セッション・leave 待ち join をまとめて書き込む。
+        """
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO events (user_id, timestamp, action, channel_id, channel_name, guild_id) VALUES (?, ?, ?, ?, ?, ?)",
+                self._records(events, LOG_COLUMNS, ["timestamp"]),
+            )
+            conn.executemany(
+                "INSERT INTO sessions (user_id, channel_id, channel_name, start_time, end_time, duration_hour) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                self._records(sessions, SESSION_COLUMNS, ["start_time", "end_time"]),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO open_sessions (user_id, channel_id, channel_name, start_time) VALUES (?, ?, ?, ?)",
+                self._records(open_joins, ["user_id", "channel_id", "channel_name", "timestamp"], ["timestamp"]),
+            )
+
+    @staticmethod
+    def _records(df: pd.DataFrame, columns: list, time_columns: list):
+        df = df.reindex(columns=columns)
+        df = df.astype(object).where(df.notna(), None)
+        for col in time_columns:
+            df[col] = [format_timestamp(ts) for ts in df[col]]
+        for col in ("user_id", "channel_id", "guild_id"):
+            if col in df:
+                df[col] = [None if v is None else int(v) for v in df[col]]
+        return df.itertuples(index=False, name=None)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ── 読み出し ─────────────────────────────────────────
+    def _query(self, sql: str, params=(), time_columns=(), date_columns=()) -> pd.DataFrame:
+        df = pd.read_sql_query(sql, self.connection(), params=params)
+        for col in time_columns:
+            df[col] = pd.to_datetime(df[col], format="ISO8601")
+        for col in date_columns:
+            df[col] = pd.to_datetime(df[col]).dt.date
+        return df
+
+    @staticmethod
+    def _range(start: datetime, end: datetime):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("start_time >= ?")
+            params.append(format_timestamp(start))
+        if end is not None:
+            clauses.append("start_time < ?")
+            params.append(format_timestamp(end))
+        return clauses, params
+
+    def sessions(self, start: datetime = None, end: datetime = None, user_id: int = None) -> pd.DataFrame:
+        clauses, params = self._range(start, end)
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions {where} ORDER BY id",
+            params, time_columns=["start_time", "end_time"],
+        )
+
+    def session_cursor(self) -> int:
+        """
+        今のセッションの末尾のカーソル（sessions の id。行は消さないので追記された順に増える）。
+        """
+        row = self.connection().execute("SELECT MAX(id) FROM sessions").fetchone()
+        return row[0] or 0
+
+    def sessions_since(self, cursor: int) -> tuple:
+        df = self._query(
+            f"SELECT id, {', '.join(SESSION_COLUMNS)} FROM sessions WHERE id > ? ORDER BY id",
+            (cursor,), time_columns=["start_time", "end_time"],
+        )
+        if not df.empty:
+            return df.drop(columns="id"), int(df["id"].iloc[-1])
+        end = self.session_cursor()
+        if end < cursor:
+            # 作り直されて cursor までの行がない
+            return None, end
+        return df.drop(columns="id"), cursor
+
+    def session_chunks(self, chunk_rows: int = 100_000, until: int = None):
+        """
+        全セッション（until を渡すと id が until までの行）を chunk_rows 行ずつ返す（集計テーブルの作り直し用）。
+        """
+        where, params = ("WHERE id <= ?", (until,)) if until is not None else ("", ())
+        chunks = pd.read_sql_query(
+            f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions {where} ORDER BY id", self.connection(),
+            params=params, chunksize=chunk_rows,
+        )
+        for chunk in chunks:
+            for col in ("start_time", "end_time"):
+                chunk[col] = pd.to_datetime(chunk[col], format="ISO8601")
+            yield chunk
+
+    def events_since(self, cursor):
+        if cursor is None or cursor[0] != self.path:
+            return None, self.version
+        df = self._query(
+            f"SELECT id, {', '.join(LOG_COLUMNS)} FROM events WHERE id > ? ORDER BY id",
+            (cursor[1],), time_columns=["timestamp"],
+        )
+        if df.empty:
+            return df.drop(columns="id"), cursor
+        return df.drop(columns="id"), (self.path, int(df["id"].iloc[-1]))
+
+    def open_sessions(self) -> pd.DataFrame:
+        return self._query(
+            f"SELECT {', '.join(OPEN_COLUMNS)} FROM open_sessions ORDER BY start_time",
+            time_columns=["start_time"],
+        )
+
+    def channel_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        clauses, params = self._range(start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT channel_id, channel_name, SUM(duration_hour) AS duration_hour FROM sessions {where} "
+            "GROUP BY channel_id, channel_name ORDER BY channel_id, channel_name",
+            params,
+        )
+
+    def daily_channel_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        clauses, params = self._range(start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            "SELECT substr(start_time, 1, 10) AS date, channel_id, channel_name, SUM(duration_hour) AS duration_hour "
+            f"FROM sessions {where} "
+            "GROUP BY date, channel_id, channel_name ORDER BY date, channel_id, channel_name",
+            params, date_columns=["date"],
+        )
+
+    def daily_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        clauses, params = self._range(start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            "SELECT substr(start_time, 1, 10) AS date, SUM(duration_hour) AS duration_hour "
+            f"FROM sessions {where} GROUP BY date ORDER BY date",
+            params, date_columns=["date"],
+        )
+
+    def user_usage(self, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        clauses, params = self._range(start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT user_id, SUM(duration_hour) AS duration_hour FROM sessions {where} "
+            "GROUP BY user_id ORDER BY user_id",
+            params,
+        )
+
+
+def partition_exists(guild_id: int) -> bool:
+    """
+    ギルドの保存先（GUILDS_DIR/<guild_id>/）が既にあるか。DEFAULT_GUILD_ID（または guild_id なし）は常に True。
+    """
+    if guild_id is None or guild_id == config.DEFAULT_GUILD_ID:
+        return True
+    return os.path.isdir(os.path.join(config.GUILDS_DIR, str(guild_id)))
+
+
+def partition_path(guild_id: int, path: str, create: bool = False) -> str:
+    """
+    ギルドの保存先ファイルのパス。DEFAULT_GUILD_ID（または guild_id なし）は path そのまま、
+    それ以外は GUILDS_DIR/<guild_id>/ の下の同じ名前のファイル。
+    ディレクトリを作るのは create=True（書き込み側）のときだけで、読み出し側でまだないギルドは FileNotFoundError。
+    """
+    if guild_id is None or guild_id == config.DEFAULT_GUILD_ID:
+        return path
+    directory = os.path.join(config.GUILDS_DIR, str(guild_id))
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    elif not os.path.isdir(directory):
+        raise FileNotFoundError(f"ギルド {guild_id} の保存先がありません: {directory}")
+    return os.path.join(directory, os.path.basename(path))
+
+
+class PartialWriteError(Exception):
+    """
+    PartitionedStorage への書き込みで、一部のギルドの保存先に書き込めなかった。
+    rows は書き込めなかった行（書き込めたギルドの行は含まないので、これだけを再試行すればよい）。
+    """
+
+    def __init__(self, rows: list, errors: dict):
+        self.rows = rows
+        self.errors = errors  # guild_id -> 例外
+        super().__init__("; ".join(f"ギルド {_guild_label(guild_id)}: {e}" for guild_id, e in errors.items()))
+
+
+class PartitionedStorage:
+    """
+    書き込み側（EventWriter）用に、行の guild_id ごとにギルドの保存先へ振り分ける。
+    セッションを書き込んだギルドは pop_touched() で取り出せる（集計テーブルの更新用）。
+    あるギルドへの書き込みが失敗しても他のギルドには書き込み、書き込めなかった行だけを PartialWriteError で返す
+    （書き込めたギルドの行を再試行して二重に数えないように）。
+    """
+
+    def __init__(self):
+        self._touched = set()
+
+    @staticmethod
+    def _by_guild(rows: list) -> dict:
+        groups = {}
+        for row in rows:
+            groups.setdefault(row.get("guild_id"), []).append(row)
+        return groups
+
+    def _append(self, rows: list, write):
+        failed, errors = [], {}
+        for guild_id, group in self._by_guild(rows).items():
+            try:
+                write(guild_id, group)
+            except Exception as e:
+                failed.extend(group)
+                errors[guild_id] = e
+        if errors:
+            raise PartialWriteError(failed, errors)
+
+    def append_events(self, rows: list):
+        self._append(rows, lambda guild_id, group: get_storage(guild_id, create=True).append_events(group))
+
+    def append_sessions(self, rows: list):
+        def write(guild_id, group):
+            get_storage(guild_id, create=True).append_sessions(group)
+            self._touched.add(guild_id)
+        self._append(rows, write)
+
+    def pop_touched(self) -> set:
+        touched, self._touched = self._touched, set()
+        return touched
+
+    def close(self):
+        with _storage_lock:
+            storages = list(_storages.values())
+        for storage in storages:
+            storage.close()
+
+
+_storages = {}
+_storage_lock = threading.Lock()
+
+
+def get_storage(guild_id: int = None, create: bool = False):
+    """
+    設定に応じたギルドの保存先を返す。プロセス内でギルドごとに1つのインスタンスを共有する。
+    まだ保存先がないギルドは、create=True（書き込み側）なら作り、なければ FileNotFoundError（何も作らない）。
+    """
+    if guild_id == config.DEFAULT_GUILD_ID:
+        guild_id = None
+    with _storage_lock:
+        storage = _storages.get(guild_id)
+        if storage is None:
+            if config.STORAGE_BACKEND == "sqlite":
+                storage = SQLiteStorage(partition_path(guild_id, config.SQLITE_PATH, create), fsync=config.VC_LOG_FSYNC)
+            elif config.STORAGE_BACKEND == "csv":
+                storage = CSVStorage(
+                    partition_path(guild_id, config.VC_LOG_PATH, create),
+                    partition_path(guild_id, config.VC_SESSIONS_PATH, create),
+                    fsync=config.VC_LOG_FSYNC, fsync_interval=config.VC_LOG_FSYNC_INTERVAL,
+                    archive_dir=partition_path(guild_id, config.ARCHIVE_DIR, create), rotate=config.VC_LOG_ROTATE,
+                    compression=config.ARCHIVE_COMPRESSION, cache_partitions=config.ARCHIVE_CACHE_PARTITIONS,
+                )
+            else:
+                raise ValueError(f"不明な STORAGE_BACKEND です: {config.STORAGE_BACKEND}")
+            _storages[guild_id] = storage
+        return storage
+
+
+def loaded_storages() -> dict:
+    """
+    このプロセスで開いているギルドの保存先（guild_id -> 保存先。DEFAULT_GUILD_ID は None）。
+    """
+    with _storage_lock:
+        return dict(_storages)
+
+
+def _guild_label(guild_id) -> str:
+    return "default" if guild_id is None else str(guild_id)
+
+
+def _log_sizes() -> dict:
+    sizes = {}
+    for guild_id, storage in loaded_storages().items():
+        for name, path in storage.files.items():
+            try:
+                sizes[(_guild_label(guild_id), name)] = os.path.getsize(path)
+            except OSError:
+                pass
+    return sizes
+
+
+def _event_lag() -> dict:
+    now = datetime.now()
+    lag = {}
+    for guild_id, storage in loaded_storages().items():
+        last = storage.last_event_time
+        if last is not None:
+            lag[(_guild_label(guild_id),)] = (now - last).total_seconds()
+    return lag
+
+
+REGISTRY.gauge("vc_log_size_bytes", "保存先のファイルサイズ（バイト）", ["guild", "file"], collect=_log_sizes)
+REGISTRY.gauge(
+    "vc_event_lag_seconds", "最後に読み込んだ（SQLite は書き込まれた）イベントからの経過秒数", ["guild"], collect=_event_lag,
+)
@@ -1,4 +1,4 @@
-import React from "react";
+import React, { useEffect, useState } from "react";
 import TodayUsageChart from "./components/TodayUsageChart";
 import WeeklyUsageChart from "./components/WeeklyUsageChart.jsx";
 import TotalUsageChart from "./components/TotalUsageChart";
@@ -6,24 +6,49 @@ import RankingChart from "./components/RankingChart";
 import MonthlyReport from "./components/MonthlyReport";
 
 function App() {
+  // 5つのパネルのデータは /api/v1/dashboard から1回でまとめて取得する
+  const [dashboard, setDashboard] = useState(null);
+
+  const fetchDashboard = () => {
+    fetch("http://localhost:8000/api/v1/dashboard", { mode: "cors" })
+      .then((res) => res.json())
+      .then((json) => setDashboard(json))
+      .catch((err) => console.error(err));
+  };
+
+  useEffect(() => {
+    fetchDashboard();
+
+    // 以降の更新は /api/v1/stream から受け取る（ページの再読み込みは不要）
+    const source = new EventSource("http://localhost:8000/api/v1/stream");
+    source.addEventListener("today_usage", (e) => {
+      const { data } = JSON.parse(e.data);
+      setDashboard((prev) => (prev ? { ...prev, today_usage: data } : prev));
+    });
+    // セッションが確定したら週間・累計なども変わるので取り直す（ETag で変化がなければ 304）
+    source.addEventListener("session_closed", fetchDashboard);
+    source.addEventListener("reset", fetchDashboard);
+    return () => source.close();
+  }, []);
+
   return (
     <div style={{ margin: "20px" }}>
       <h1>Discord VC Usage Dashboard</h1>
       <hr />
       <h2>(1) 今日の使用時間</h2>
-      <TodayUsageChart />
+      <TodayUsageChart data={dashboard ? dashboard.today_usage : []} />
       <hr />
       <h2>(2) 直近1週間の使用時間</h2>
-      <WeeklyUsageChart />
+      <WeeklyUsageChart json={dashboard ? dashboard.weekly_usage : []} />
       <hr />
       <h2>(3) 全期間の累計時間</h2>
-      <TotalUsageChart />
+      <TotalUsageChart data={dashboard ? dashboard.total_usage : []} />
       <hr />
       <h2>(4) チャンネル使用量ランキング</h2>
-      <RankingChart />
+      <RankingChart data={dashboard ? dashboard.ranking : []} />
       <hr />
       <h2>(5) 月次レポート</h2>
-      <MonthlyReport />
+      <MonthlyReport initialReport={dashboard ? dashboard.monthly_report : null} />
     </div>
   );
 }
@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useEffect, useState } from "react";
 import styled from "styled-components";
 
 /*
@@ -22,11 +22,16 @@ const ReportContainer = styled.div`
   box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
 `;
 
-function MonthlyReport() {
-  const [year, setYear] = useState(2025);
-  const [month, setMonth] = useState(2);
+// initialReport は /api/v1/dashboard の monthly_report（今月分、App.js で取得）
+function MonthlyReport({ initialReport }) {
+  const [year, setYear] = useState(new Date().getFullYear());
+  const [month, setMonth] = useState(new Date().getMonth() + 1);
   const [report, setReport] = useState(null);
 
+  useEffect(() => {
+    setReport(initialReport);
+  }, [initialReport]);
+
   const handleSubmit = () => {
     fetch(`http://localhost:8000/api/v1/monthly-report?year=${year}&month=${month}`, { mode: 'cors' })
       .then((res) => res.json())
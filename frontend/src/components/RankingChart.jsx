@@ -1,14 +1,7 @@
-import React, { useEffect, useState } from "react";
+import React from "react";
 
-function RankingChart() {
-  const [data, setData] = useState([]);
-
-  useEffect(() => {
-    fetch("http://localhost:8000/api/v1/ranking",{mode: 'cors'})
-      .then((res) => res.json())
-      .then((json) => setData(json))
-      .catch((err) => console.error(err));
-  }, []);
+// data は /api/v1/dashboard の ranking（App.js で取得）
+function RankingChart({ data }) {
 
   return (
     <div>
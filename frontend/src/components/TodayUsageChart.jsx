@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React from "react";
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ReferenceLine } from "recharts";
 import styled from "styled-components";
 
@@ -9,17 +9,8 @@ const ChartContainer = styled.div`
   box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
 `;
 
-function TodayUsageChart() {
-  const [data, setData] = useState([]);
-
-  useEffect(() => {
-    fetch("http://localhost:8000/api/v1/today-usage", { mode: 'cors' })
-      .then((res) => res.json())
-      .then((json) => {
-        setData(json);
-      })
-      .catch((err) => console.error(err));
-  }, []);
+// data は /api/v1/dashboard の today_usage（App.js で取得）
+function TodayUsageChart({ data }) {
 
   // 平均値ラインを引く場合
   const average = data.length > 0
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React from "react";
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip } from "recharts";
 import styled from "styled-components";
 
@@ -9,15 +9,8 @@ const ChartContainer = styled.div`
   box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
 `;
 
-function TotalUsageChart() {
-  const [data, setData] = useState([]);
-
-  useEffect(() => {
-    fetch("http://localhost:8000/api/v1/total-usage", {mode: 'cors'})
-      .then((res) => res.json())
-      .then((json) => setData(json))
-      .catch((err) => console.error(err));
-  }, []);
+// data は /api/v1/dashboard の total_usage（App.js で取得）
+function TotalUsageChart({ data }) {
 
   // デフォルトで降順に返ってくる前提
   // 上位3つをハイライトにするなどの例（ここでは単に色を変えるだけ）
@@ -24,51 +24,47 @@ const ChartContainer = styled.div`
   margin: auto;
 `;
 
-function WeeklyUsageChart() {
+// json は /api/v1/dashboard の weekly_usage（App.js で取得）
+function WeeklyUsageChart({ json }) {
   const [data, setData] = useState([]);
   const [averageUsage, setAverageUsage] = useState(0);
   const [channelColorMapping, setChannelColorMapping] = useState({});
 
   useEffect(() => {
-    fetch("http://localhost:8000/api/v1/weekly-usage", { mode: "cors" })
-      .then((res) => res.json())
-      .then((json) => {
-        const today = new Date();
-        const last7Days = [...Array(7)].map((_, i) => {
-          const d = new Date();
-          d.setDate(today.getDate() - (6 - i));
-          return d.toISOString().split("T")[0];
-        });
+    const today = new Date();
+    const last7Days = [...Array(7)].map((_, i) => {
+      const d = new Date();
+      d.setDate(today.getDate() - (6 - i));
+      return d.toISOString().split("T")[0];
+    });
 
-        const pivot = last7Days.reduce((acc, date) => {
-          acc[date] = { date };
-          return acc;
-        }, {});
-        
-        let totalHours = 0;
-        const chMapping = {};
+    const pivot = last7Days.reduce((acc, date) => {
+      acc[date] = { date };
+      return acc;
+    }, {});
+    
+    let totalHours = 0;
+    const chMapping = {};
 
-        json.forEach(({ date, channel_id, channel_name, duration_hour }) => {
-          if (!pivot[date]) pivot[date] = { date };
-          pivot[date][channel_name] = duration_hour;
-          totalHours += duration_hour;
-          chMapping[channel_name] = channel_id;
-        });
+    json.forEach(({ date, channel_id, channel_name, duration_hour }) => {
+      if (!pivot[date]) pivot[date] = { date };
+      pivot[date][channel_name] = duration_hour;
+      totalHours += duration_hour;
+      chMapping[channel_name] = channel_id;
+    });
 
-        setAverageUsage(totalHours / 7);
+    setAverageUsage(totalHours / 7);
 
-        // channel_name → color マッピングを作成
-        const chColorMapping = Object.fromEntries(
-            Object.keys(chMapping).map((chName) => [
-              chName,
-              channelColors[chMapping[chName]] || "#cccccc",
-            ])
-          );
-        setChannelColorMapping(chColorMapping);
-        setData(Object.values(pivot));
-      })
-      .catch(console.error);
-  }, []);
+    // channel_name → color マッピングを作成
+    const chColorMapping = Object.fromEntries(
+        Object.keys(chMapping).map((chName) => [
+          chName,
+          channelColors[chMapping[chName]] || "#cccccc",
+        ])
+      );
+    setChannelColorMapping(chColorMapping);
+    setData(Object.values(pivot));
+  }, [json]);
 
   // X軸のラベル描画
   const renderDateTick = ({ x, y, payload }) => {
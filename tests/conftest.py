@@ -0,0 +1,15 @@
+"""
+テストの共通設定。
+
+core/config.py は読み込んだ時点の環境変数を使うので、どのテストのモジュールよりも先に、
+保存先を一時ディレクトリに向けておく（本番の data/ を汚さない）。
+"""
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="vc-tests-")
+os.environ.setdefault("STREAM_POLL_INTERVAL", "0.05")
@@ -0,0 +1,80 @@
+"""
+core/event_writer.py（EventWriter）の再試行。一部のギルドだけ書き込めなかったときに、
+書き込めたギルドの行を二重に書かないこと、再試行を待つ行に上限があること。
+"""
+import time
+from datetime import datetime
+
+import pytest
+
+from core import storage as storage_module
+from core.event_writer import EventWriter
+from core.storage import PartitionedStorage
+
+
+class FakeStorage:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.events = []
+        self.sessions = []
+
+    def _check(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+
+    def append_events(self, rows: list):
+        self._check()
+        self.events.extend(rows)
+
+    def append_sessions(self, rows: list):
+        self._check()
+        self.sessions.extend(rows)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def guilds(monkeypatch):
+    guilds = {1: FakeStorage(), 2: FakeStorage(failures=2)}
+    monkeypatch.setattr(storage_module, "get_storage", lambda guild_id, create=False: guilds[guild_id])
+    return guilds
+
+
+def event(guild_id: int, user_id: int) -> dict:
+    return {"guild_id": guild_id, "user_id": user_id, "timestamp": datetime.now(), "action": "join",
+            "channel_id": 100, "channel_name": "自習室"}
+
+
+def session(guild_id: int, user_id: int) -> dict:
+    now = datetime.now()
+    return {"guild_id": guild_id, "user_id": user_id, "channel_id": 100, "channel_name": "自習室",
+            "start_time": now, "end_time": now, "duration_hour": 0.0}
+
+
+def test_retries_only_failed_guild(guilds):
+    writer = EventWriter(PartitionedStorage(), batch_size=4, flush_interval=0.01)
+    for guild_id in (1, 2):
+        writer.write(event(guild_id, 10))
+        writer.write_session(session(guild_id, 10))
+    time.sleep(0.2)
+    writer.close()
+    assert [row["user_id"] for row in guilds[1].events] == [10]
+    assert [row["user_id"] for row in guilds[1].sessions] == [10]
+    assert [row["user_id"] for row in guilds[2].events] == [10]
+    assert [row["user_id"] for row in guilds[2].sessions] == [10]
+
+
+def test_pending_is_capped(guilds, capsys):
+    guilds[2].failures = 10 ** 6
+    writer = EventWriter(PartitionedStorage(), batch_size=100, flush_interval=0.01, max_pending=3)
+    for user_id in range(5):
+        writer.write(event(2, user_id))
+        writer.write(event(1, user_id))
+    writer.close()
+    assert [row["user_id"] for row in guilds[1].events] == list(range(5))
+    assert guilds[2].events == []
+    out = capsys.readouterr().out
+    assert "イベント 2 件を捨てました" in out
+    assert "3 件のイベント" in out
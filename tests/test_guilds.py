@@ -0,0 +1,57 @@
+"""
+?guild_id= の読み出しで、まだないギルドの保存先を作らないこと（core/storage.py・backend/main.py）。
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main as api  # noqa: E402
+from core import config  # noqa: E402
+from core import leaderboard, rollups, storage  # noqa: E402
+
+UNKNOWN = 987654321012345678
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+
+def instances() -> tuple:
+    return len(storage._storages), len(rollups._rollups), len(leaderboard._leaderboards), len(api.live_feeds)
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/total-usage", "/api/v1/dashboard", "/api/v1/now", "/api/v1/stream", "/api/v1/users/ranking",
+    "/api/v1/users/1/sessions", "/api/v1/users/1/summary?end=2025-01-31", "/api/v1/heatmap?end=2025-01-31",
+    "/api/v1/monthly-report?year=2025&month=1",
+])
+def test_unknown_guild_is_404_and_creates_nothing(client, path):
+    before = instances()
+    separator = "&" if "?" in path else "?"
+    response = client.get(f"{path}{separator}guild_id={UNKNOWN}")
+    assert response.status_code == 404
+    assert not os.path.exists(os.path.join(config.GUILDS_DIR, str(UNKNOWN)))
+    assert instances() == before
+
+
+def test_read_side_does_not_create_partition():
+    with pytest.raises(FileNotFoundError):
+        storage.get_storage(UNKNOWN)
+    with pytest.raises(FileNotFoundError):
+        rollups.get_rollups(UNKNOWN)
+    assert not os.path.exists(os.path.join(config.GUILDS_DIR, str(UNKNOWN)))
+
+
+def test_writer_creates_partition(client):
+    guild_id = UNKNOWN + 1
+    writer = storage.PartitionedStorage()
+    writer.append_events([{"guild_id": guild_id, "user_id": 1, "timestamp": "2025-01-01 10:00:00",
+                           "action": "join", "channel_id": 100, "channel_name": "自習室"}])
+    assert storage.partition_exists(guild_id)
+    assert client.get(f"/api/v1/total-usage?guild_id={guild_id}").status_code == 200
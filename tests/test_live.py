@@ -0,0 +1,173 @@
+"""
+core/live.py（LiveFeed）の差分メッセージと、/api/v1/stream の SSE の出力。
+"""
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from core.live import LiveFeed
+from core.rollups import RollupStore
+from core.session_tracker import SessionTracker
+from core.storage import CSVStorage, SQLiteStorage
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "csv":
+        storage = CSVStorage(str(tmp_path / "vc_logs.csv"), fsync="never")
+    else:
+        storage = SQLiteStorage(str(tmp_path / "vc_logs.db"), fsync="never")
+    yield storage
+    storage.close()
+
+
+def make_feed(storage, tmp_path, queue_size: int = 100) -> LiveFeed:
+    rollups = RollupStore(str(tmp_path / "rollups.db"))
+    return LiveFeed(storage, rollups, totals=lambda: [{"channel_id": 100, "total": 1}], queue_size=queue_size)
+
+
+def write(storage, result):
+    events, sessions = result
+    storage.append_events(events)
+    if sessions:
+        storage.append_sessions(sessions)
+
+
+def test_poll_sends_only_new_events(storage, tmp_path):
+    feed = make_feed(storage, tmp_path)
+    tracker = SessionTracker()
+    now = datetime.now().replace(microsecond=0)
+    # 監視を始める前のセッションは差分に含めない
+    write(storage, tracker.join(1, 100, "自習室", now - timedelta(hours=2)))
+    write(storage, tracker.leave(1, 100, "自習室", now - timedelta(hours=1)))
+    feed._start()
+    assert feed._poll() == []
+
+    write(storage, tracker.join(2, 100, "自習室", now - timedelta(minutes=30)))
+    assert feed._poll() == [{
+        "type": "session_opened", "user_id": 2, "channel_id": 100, "channel_name": "自習室",
+        "start_time": (now - timedelta(minutes=30)).isoformat(),
+    }]
+    assert feed._poll() == []
+
+    write(storage, tracker.leave(2, 100, "自習室", now))
+    messages = feed._poll()
+    assert [message["type"] for message in messages] == ["session_closed", "today_usage"]
+    closed = messages[0]
+    assert (closed["user_id"], closed["channel_id"], closed["channel_name"]) == (2, 100, "自習室")
+    assert closed["start_time"] == (now - timedelta(minutes=30)).isoformat()
+    assert closed["end_time"] == now.isoformat()
+    assert closed["duration_hour"] == pytest.approx(0.5)
+    assert messages[1]["data"] == [{"channel_id": 100, "total": 1}]
+    # 確定したセッションは集計テーブルにも取り込まれている
+    assert feed.rollups.cursor == storage.session_cursor()
+    assert feed._poll() == []
+
+
+def test_publish_resets_slow_subscriber(storage, tmp_path):
+    feed = make_feed(storage, tmp_path, queue_size=2)
+
+    async def run():
+        fast, slow = asyncio.Queue(), asyncio.Queue(maxsize=2)
+        feed._subscribers.update({fast, slow})
+        for i in range(3):
+            feed.publish({"type": "session_opened", "user_id": i})
+        return [fast.get_nowait() for _ in range(fast.qsize())], [slow.get_nowait() for _ in range(slow.qsize())]
+
+    fast, slow = asyncio.run(run())
+    assert [message["user_id"] for message in fast] == [0, 1, 2]
+    assert slow == [{"type": "reset"}]
+
+
+class FakeRequest:
+    """
+    StreamingResponse の外から SSE を読むための Request の代わり。disconnect() で切断扱いにする。
+    """
+
+    def __init__(self):
+        self.disconnected = False
+
+    def disconnect(self):
+        self.disconnected = True
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+def parse_sse(chunk: str) -> dict:
+    event, data = chunk.rstrip("\n").split("\n")
+    assert event.startswith("event: ") and data.startswith("data: ")
+    message = json.loads(data[len("data: "):])
+    assert event[len("event: "):] == message["type"]
+    return message
+
+
+def test_stream_sends_deltas_as_sse():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+    import main as api
+
+    async def run():
+        request = FakeRequest()
+        response = await api.stream(request)
+        assert response.media_type == "text/event-stream"
+        assert response.headers["cache-control"] == "no-cache"
+        body = response.body_iterator
+        messages = [parse_sse(await anext(body))]
+        assert api.live_feed.subscriber_count == 1
+
+        # 監視タスクが最初の位置を読むのを待ってから書き込む
+        while api.live_feed._cursor is None:
+            await asyncio.sleep(0.01)
+        tracker = SessionTracker()
+        now = datetime.now().replace(microsecond=0)
+        # today_usage に載るよう、今日のうちに始まったセッションにする
+        start = max(now - timedelta(minutes=30), datetime.combine(now.date(), time.min))
+        write(api.storage, tracker.join(1, 100, "自習室", start))
+        messages.append(parse_sse(await asyncio.wait_for(anext(body), 5)))
+        write(api.storage, tracker.leave(1, 100, "自習室", now))
+        for _ in range(2):
+            messages.append(parse_sse(await asyncio.wait_for(anext(body), 5)))
+
+        request.disconnect()
+        await body.aclose()
+        assert api.live_feed.subscriber_count == 0
+        await api.live_feed.stop()
+        return messages, (now - start) / timedelta(hours=1)
+
+    messages, hours = asyncio.run(run())
+    assert [message["type"] for message in messages] == ["today_usage", "session_opened", "session_closed",
+                                                         "today_usage"]
+    assert messages[0]["data"] == []
+    assert messages[1]["start_time"] == messages[2]["start_time"]
+    assert messages[2]["duration_hour"] == pytest.approx(hours)
+    assert [row["channel_id"] for row in messages[3]["data"]] == [100]
+
+
+def test_stream_subscribes_only_while_sending():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+    import main as api
+
+    async def run():
+        before = api.live_feed.subscriber_count
+        # 送り始める前に切断された（ジェネレーターが一度も回らない）場合はキューを登録しない
+        response = await api.stream(FakeRequest())
+        assert api.live_feed.subscriber_count == before
+        await response.body_iterator.aclose()
+        assert api.live_feed.subscriber_count == before
+
+        # 集計に失敗した場合も登録しない
+        original = api.today_usage_data
+        api.today_usage_data = lambda r: 1 / 0
+        try:
+            with pytest.raises(ZeroDivisionError):
+                await api.stream(FakeRequest())
+        finally:
+            api.today_usage_data = original
+        assert api.live_feed.subscriber_count == before
+        await api.live_feed.stop()
+
+    asyncio.run(run())
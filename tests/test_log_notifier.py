@@ -0,0 +1,81 @@
+"""
+cogs/vc_tracker.py（LogNotifier）の入退室通知のまとめ方と、停止時（close）の送信。
+"""
+import asyncio
+from types import SimpleNamespace
+
+from cogs.vc_tracker import LogNotifier
+
+
+class FakeLogChannel:
+    """
+    送ったメッセージを覚えておくテキストチャンネル。send は delay 秒かかる。
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.sending = asyncio.Event()
+
+    async def send(self, message: str):
+        self.sending.set()
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+
+def member(member_id: int, name: str):
+    return SimpleNamespace(id=member_id, display_name=name)
+
+
+ROOM = SimpleNamespace(id=1, name="自習室")
+LOUNGE = SimpleNamespace(id=2, name="休憩室")
+
+
+def test_window_collapses_changes():
+    async def run():
+        channel = FakeLogChannel()
+        notifier = LogNotifier(lambda: channel, window=0.01)
+        notifier.add(member(1, "a"), None, ROOM)
+        notifier.add(member(2, "b"), ROOM, None)
+        notifier.add(member(3, "c"), None, ROOM)
+        notifier.add(member(3, "c"), ROOM, LOUNGE)
+        notifier.add(member(4, "d"), None, ROOM)
+        notifier.add(member(4, "d"), ROOM, None)
+        await notifier._task
+        return channel.sent
+
+    assert asyncio.run(run()) == [
+        "🔊 **a** が **自習室** に参加しました。\n"
+        "📴 **b** が **自習室** から退出しました。\n"
+        "🔊 **c** が **休憩室** に参加しました。\n"
+        "（短時間の出入り 1 件は省略しました）"
+    ]
+
+
+def test_close_sends_pending_window_without_waiting():
+    async def run():
+        channel = FakeLogChannel()
+        notifier = LogNotifier(lambda: channel, window=60)
+        notifier.add(member(1, "a"), None, ROOM)
+        await asyncio.sleep(0)
+        await asyncio.wait_for(notifier.close(), 1)
+        return channel.sent
+
+    assert asyncio.run(run()) == ["🔊 **a** が **自習室** に参加しました。"]
+
+
+def test_close_waits_for_in_flight_send():
+    async def run():
+        channel = FakeLogChannel(delay=0.05)
+        notifier = LogNotifier(lambda: channel, window=0.01)
+        notifier.add(member(1, "a"), None, ROOM)
+        await channel.sending.wait()
+        # 送信中に届いた入退室も、停止時に送る
+        notifier.add(member(2, "b"), None, LOUNGE)
+        await asyncio.wait_for(notifier.close(), 1)
+        return channel.sent
+
+    assert asyncio.run(run()) == [
+        "🔊 **a** が **自習室** に参加しました。",
+        "🔊 **b** が **休憩室** に参加しました。",
+    ]
@@ -0,0 +1,132 @@
+"""
+cogs/role_manager.py（RoleUpdateQueue）の API 呼び出しのまとめ方と、最後のロールの状態。
+偽のギルド・メンバーは benchmarks/role_storm.py のものを使う。
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from cogs.role_manager import RoleUpdateQueue  # noqa: E402
+from role_storm import FakeGuild, FakeMember, make_storm, settle, simulate  # noqa: E402
+
+
+def make_member(stats: dict, latency: float = 0.01, gateway_delay: float = 0.02):
+    guild = FakeGuild(1, 3)
+    return FakeMember(1, guild, stats, latency, gateway_delay), guild.roles[-1]
+
+
+async def drain(queue: RoleUpdateQueue, stats: dict):
+    while any(not task.done() for task in queue._tasks.values()):
+        await asyncio.sleep(0.001)
+    await settle(stats)
+
+
+def test_pending_toggles_merge_into_last():
+    async def run():
+        stats = {"calls": 0, "updates": 0}
+        member, role = make_member(stats)
+        queue = RoleUpdateQueue(rate=10, per=1.0)
+        for want in (True, False, True, False, True):
+            queue.submit(member, role, want)
+        await drain(queue, stats)
+        return stats, queue, member, role
+
+    stats, queue, member, role = asyncio.run(run())
+    assert stats["calls"] == 1
+    assert queue.merged == 4
+    assert member.get_role(role.id) is not None
+
+
+def test_leave_during_in_flight_add_is_sent():
+    async def run():
+        stats = {"calls": 0, "updates": 0}
+        member, role = make_member(stats)
+        queue = RoleUpdateQueue(rate=10, per=1.0)
+        queue.submit(member, role, True)
+        # add_roles の送信中（結果がキャッシュに入る前）に退出する
+        while stats["calls"] == 0:
+            await asyncio.sleep(0)
+        queue.submit(member, role, False)
+        await drain(queue, stats)
+        assert stats["calls"] == 2
+        assert member.get_role(role.id) is None
+
+        # 送信中の状態と同じ指示は送らない（remove_roles の結果がキャッシュに入る前でも）
+        queue.submit(member, role, True)
+        while stats["calls"] == 2:
+            await asyncio.sleep(0)
+        queue.submit(member, role, True)
+        await drain(queue, stats)
+        return stats, queue, member, role
+
+    stats, queue, member, role = asyncio.run(run())
+    assert stats["calls"] == 3
+    assert queue.skipped == 1
+    assert member.get_role(role.id) is not None
+
+
+@pytest.mark.parametrize("burst", [1, 50])
+@pytest.mark.parametrize("seed", range(5))
+def test_storm_final_state_and_fewer_calls(seed, burst):
+    members = 30
+    storm = make_storm(members, 600, channels=5, seed=seed)
+    options = dict(roles=20, latency=0.0002, gateway_delay=0.001, rate=1000, per=0.01, burst=burst)
+    legacy = simulate("legacy", storm, members, **options)
+    result = simulate("role_manager", storm, members, **options)
+    assert legacy["ok"]
+    assert result["ok"]
+    assert result["calls"] < legacy["calls"]
+    # ロールは1回だけ探し、以降はキャッシュを使う
+    assert result["lookups"] < legacy["lookups"]
+
+
+def test_manual_change_is_corrected_after_confirm():
+    async def run():
+        stats = {"calls": 0, "updates": 0}
+        member, role = make_member(stats)
+        queue = RoleUpdateQueue(rate=10, per=1.0)
+        queue.submit(member, role, True)
+        while stats["calls"] == 0:
+            await asyncio.sleep(0)
+        # 送信中に届いた別のメンバー更新（ロールはまだ反映されていない）では記録を捨てない
+        queue.confirm(member, role)
+        assert queue.current(member, role)
+        await drain(queue, stats)
+        # ロールが反映されたメンバー更新で記録を捨てる
+        queue.confirm(member, role)
+        assert queue._last_sent[member.guild.id] == {}
+
+        # モデレーターが手でロールを外した。次の入室で付け直す
+        member.role_ids.discard(role.id)
+        queue.confirm(member, role)
+        queue.submit(member, role, True)
+        await drain(queue, stats)
+        return stats, member, role
+
+    stats, member, role = asyncio.run(run())
+    assert stats["calls"] == 2
+    assert member.get_role(role.id) is not None
+
+
+def test_forget_drops_guild_state():
+    async def run():
+        stats = {"calls": 0, "updates": 0}
+        member, role = make_member(stats, gateway_delay=0.0)
+        queue = RoleUpdateQueue(rate=10, per=1.0)
+        queue.submit(member, role, True)
+        await drain(queue, stats)
+        # API の応答の時点でキャッシュに入っていれば、その場で記録を捨てる
+        assert queue._last_sent[member.guild.id] == {}
+
+        queue._last_sent[member.guild.id][(member.id, role.id)] = True
+        queue.forget(member.guild.id, member.id)
+        assert queue._last_sent[member.guild.id] == {}
+        queue.forget(member.guild.id)
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue._pending == {} and queue._sent == {} and queue._last_sent == {} and queue._tasks == {}
@@ -0,0 +1,117 @@
+"""
+core/rollups.py の差分の取り込み（保存先のカーソル）。時計が戻って過去の end_time で追記されたセッションや、
+CSV のローテーション（途中で止まった場合も含む）のあとも、取りこぼしも二重の加算もしないこと。
+"""
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from core.rollups import RollupStore
+from core.storage import CSVStorage, SQLiteStorage
+
+START = datetime(2025, 3, 10, 9)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "csv":
+        storage = CSVStorage(str(tmp_path / "vc_logs.csv"), fsync="never")
+    else:
+        storage = SQLiteStorage(str(tmp_path / "vc_logs.db"), fsync="never")
+    yield storage
+    storage.close()
+
+
+def session(user_id: int, start: datetime, hours: float) -> dict:
+    return {
+        "user_id": user_id, "channel_id": 100, "channel_name": "自習室",
+        "start_time": start, "end_time": start + timedelta(hours=hours), "duration_hour": hours,
+    }
+
+
+def daily(rollups: RollupStore, start_day: date, end_day: date) -> dict:
+    df = rollups.daily_usage(start_day, end_day)
+    return dict(zip(df["date"], df["duration_hour"]))
+
+
+def test_sync_picks_up_sessions_with_earlier_end_time(storage, tmp_path):
+    rollups = RollupStore(str(tmp_path / "rollups.db"))
+    storage.append_sessions([session(1, START, 2.0)])
+    assert rollups.sync(storage) == 1
+
+    # 時計が戻った・別のプロセスが書いた: 取り込み済みのものより前に終わったセッションが後から追記される
+    storage.append_sessions([session(2, START - timedelta(days=1), 1.0)])
+    assert rollups.sync(storage) == 1
+    assert rollups.sync(storage) == 0
+    assert daily(rollups, date(2025, 3, 9), date(2025, 3, 11)) == pytest.approx(
+        {date(2025, 3, 9): 1.0, date(2025, 3, 10): 2.0}
+    )
+    assert rollups.cursor == storage.session_cursor()
+
+
+def test_rebuild_matches_incremental_sync(storage, tmp_path):
+    incremental = RollupStore(str(tmp_path / "incremental.db"))
+    for i, hours in enumerate((1.0, 0.5, 2.0)):
+        storage.append_sessions([session(i, START - timedelta(days=i), hours)])
+        incremental.sync(storage)
+    rebuilt = RollupStore(str(tmp_path / "rebuilt.db"))
+    assert rebuilt.rebuild(storage) == 3
+    assert rebuilt.cursor == incremental.cursor == storage.session_cursor()
+    assert daily(rebuilt, date(2025, 3, 1), date(2025, 4, 1)) == pytest.approx(
+        daily(incremental, date(2025, 3, 1), date(2025, 4, 1))
+    )
+
+
+def csv_storage(tmp_path) -> CSVStorage:
+    storage = CSVStorage(str(tmp_path / "vc_logs.csv"), fsync="never")
+    # ローテーションはイベントのファイルがないと何もしない（ヘッダーだけ書いておく）
+    storage.append_events([])
+    return storage
+
+
+def test_rotation_keeps_the_session_cursor(tmp_path):
+    storage = csv_storage(tmp_path)
+    rollups = RollupStore(str(tmp_path / "rollups.db"))
+    storage.append_sessions([session(1, datetime(2025, 2, 20, 9), 1.0), session(2, datetime(2025, 3, 2, 9), 1.0)])
+    rollups.sync(storage)
+    # 取り込んだあとに、前の期間の end_time の行が追記される
+    storage.append_sessions([session(3, datetime(2025, 2, 21, 9), 0.5)])
+    cursor = storage.session_cursor()
+
+    # 先頭から続く前の期間の行だけを移す。後から追記された行は次のローテーションまで今のファイルに残る
+    assert storage.rotate(datetime(2025, 3, 1), "month") == (0, 1)
+    assert storage.session_cursor() == cursor == 3
+    assert rollups.sync(storage) == 1
+    assert daily(rollups, date(2025, 2, 1), date(2025, 4, 1)) == pytest.approx(
+        {date(2025, 2, 20): 1.0, date(2025, 2, 21): 0.5, date(2025, 3, 2): 1.0}
+    )
+    assert len(storage.sessions()) == 3
+
+    assert storage.rotate(datetime(2025, 4, 1), "month") == (0, 2)
+    assert storage.session_cursor() == 3
+    assert rollups.sync(storage) == 0
+    storage.close()
+
+
+def test_rotation_stopped_before_replacing_the_file(tmp_path, monkeypatch):
+    storage = csv_storage(tmp_path)
+    storage.append_sessions([session(1, datetime(2025, 2, 20, 9), 1.0), session(2, datetime(2025, 3, 2, 9), 1.0)])
+    assert storage.sessions_since(0)[1] == 2
+
+    # manifest を書いたあと、今のセッションファイルを置き換える前に止まった
+    replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: None if dst == storage.sessions_path else replace(src, dst))
+    storage.rotate(datetime(2025, 3, 1), "month")
+    monkeypatch.setattr(os, "replace", replace)
+
+    sessions, cursor = storage.sessions_since(1)
+    assert cursor == 2
+    assert sessions["user_id"].tolist() == [2]
+    assert len(storage.sessions()) == 2
+    # 次のローテーションで、移し終えた行を捨ててから続きを行う
+    storage.append_sessions([session(3, datetime(2025, 3, 3, 9), 1.0)])
+    assert storage.rotate(datetime(2025, 4, 1), "month") == (0, 2)
+    assert storage.session_cursor() == 3
+    assert sorted(storage.sessions()["user_id"]) == [1, 2, 3]
+    storage.close()
@@ -0,0 +1,77 @@
+"""
+core/storage.py の日別の集計が、CSV と SQLite の保存先で同じ結果になること（期間の指定がない場合も含む）。
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from core.session_tracker import SessionTracker
+from core.storage import CSVStorage, SQLiteStorage
+
+START = datetime(2025, 2, 1, 9)
+
+
+@pytest.fixture
+def storages(tmp_path):
+    csv = CSVStorage(str(tmp_path / "vc_logs.csv"), fsync="never")
+    sqlite = SQLiteStorage(str(tmp_path / "vc_logs.db"), fsync="never")
+    tracker = SessionTracker()
+    for day in range(3):
+        for user_id, channel_id, hours in ((1, 100, 1.5), (2, 200, 0.5 * (day + 1))):
+            start = START + timedelta(days=day, hours=user_id)
+            for storage in (csv, sqlite):
+                storage.append_events(tracker.join(user_id, channel_id, f"room-{channel_id}", start)[0])
+            events, sessions = tracker.leave(user_id, channel_id, f"room-{channel_id}", start + timedelta(hours=hours))
+            for storage in (csv, sqlite):
+                storage.append_events(events)
+                storage.append_sessions(sessions)
+    yield csv, sqlite
+    csv.close()
+    sqlite.close()
+
+
+@pytest.mark.parametrize("start, end", [
+    (None, None),
+    (datetime(2025, 2, 2), None),
+    (None, datetime(2025, 2, 3)),
+    (datetime(2025, 2, 2), datetime(2025, 2, 3)),
+])
+def test_daily_usage_matches(storages, start, end):
+    csv, sqlite = storages
+    expected = {date(2025, 2, 1): 2.0, date(2025, 2, 2): 2.5, date(2025, 2, 3): 3.0}
+    expected = {day: h for day, h in expected.items()
+                if (start is None or day >= start.date()) and (end is None or day < end.date())}
+    for storage in (csv, sqlite):
+        df = storage.daily_usage(start, end)
+        assert dict(zip(df["date"], df["duration_hour"])) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("start, end", [(None, None), (datetime(2025, 2, 2), datetime(2025, 2, 3))])
+def test_daily_channel_usage_matches(storages, start, end):
+    csv, sqlite = storages
+    rows = []
+    for storage in (csv, sqlite):
+        df = storage.daily_channel_usage(start, end).sort_values(["date", "channel_id"])
+        rows.append([(row.date, int(row.channel_id), row.channel_name, round(row.duration_hour, 6))
+                     for row in df.itertuples(index=False)])
+    assert rows[0] == rows[1]
+    assert len(rows[0]) == (6 if start is None else 2)
+
+
+def test_session_cache_reads_appends_in_file_order(tmp_path, monkeypatch):
+    from core.logcache import SessionLogCache
+
+    monkeypatch.setattr(SessionLogCache, "MAX_CHUNKS", 2)
+    storage = CSVStorage(str(tmp_path / "vc_logs.csv"), fsync="never")
+    expected = []
+    # 読み出しの間に何回か追記する（過去の end_time の行も、読み直さずに後ろに足す）
+    for batch in range(3):
+        for offset in (5, 1, 3):
+            start = START + timedelta(days=offset, hours=batch)
+            row = {"user_id": batch * 10 + offset, "channel_id": 100, "channel_name": "自習室",
+                   "start_time": start, "end_time": start + timedelta(hours=1), "duration_hour": 1.0}
+            storage.append_sessions([row])
+            expected.append(row["user_id"])
+        assert storage.sessions()["user_id"].tolist() == expected
+        assert storage.session_cursor() == len(expected)
+    storage.close()